@@ -0,0 +1,59 @@
+# src/aggregate.py (Modo fetch-and-aggregate: conteos locales en una sola pasada)
+
+from collections import Counter
+from record_store import RecordStore
+
+# --- AYUDAS ---
+def _split_tokens(value):
+    """Los multi-checkbox de HubSpot llegan como 'Spain;Ireland'."""
+    if not value:
+        return set()
+    return {token.strip().lower() for token in value.split(";") if token.strip()}
+
+def _value_counts(records, property_name):
+    """
+    {valor: nº de registros}. Con un RecordStore es un bincount sobre los
+    códigos; con una lista de registros (p. ej. del espejo), un Counter.
+    """
+    if isinstance(records, RecordStore):
+        return records.count_by(property_name)
+    return Counter(record.get("properties", {}).get(property_name) for record in records)
+
+# --- CONTACTOS ---
+def aggregate_contacts(records, countries, lead_sources):
+    """
+    Calcula los mismos conteos que get_total_new_leads, get_leads_by_country
+    y get_leads_by_traffic_source agrupando por valor (no registro a registro).
+    `countries` y `lead_sources` son las secciones del spec ({"property", "map"}).
+    Devuelve (total_leads, country_leads, lead_sources_raw).
+    """
+    # Cada combinación distinta del multi-checkbox se parte una sola vez y suma a todos sus tokens
+    token_counts = Counter()
+    for raw_value, count in _value_counts(records, countries["property"]).items():
+        for token in _split_tokens(raw_value):
+            token_counts[token] += count
+    country_leads = {country: token_counts[token.lower()] for country, token in countries["map"].items()}
+
+    source_counts = _value_counts(records, lead_sources["property"])
+    lead_sources_raw = {
+        label: ("MANUAL_SKIP" if internal_value == "MANUAL_SKIP" else source_counts.get(internal_value, 0))
+        for label, internal_value in lead_sources["map"].items()
+    }
+    return len(records), country_leads, lead_sources_raw
+
+# --- DEALS ---
+def aggregate_deals(records, pipeline_map, breakdowns):
+    """
+    Calcula los conteos por pipeline y los desgloses por propiedad agrupando por valor.
+    `breakdowns` es {nombre: (propiedad, mapa_etiqueta_valor)}.
+    Devuelve (pipeline_totals, {nombre: desglose}).
+    """
+    pipeline_counts = _value_counts(records, "pipeline")
+    pipeline_totals = {label: pipeline_counts.get(pipeline_id, 0) for label, pipeline_id in pipeline_map.items()}
+
+    results = {}
+    for name, (property_name, property_map) in breakdowns.items():
+        value_counts = _value_counts(records, property_name)
+        results[name] = {label: value_counts.get(internal_value, 0) for label, internal_value in property_map.items()}
+
+    return pipeline_totals, results
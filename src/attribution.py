@@ -0,0 +1,123 @@
+# src/attribution.py (Atribución de engagements al canal del lead vía asociaciones batch)
+
+from collections import Counter
+import metrics
+from deals import fetch_deal_records
+from hubspot_client import HUBSPOT_API_BASE, post_json, run_parallel
+
+# Endpoints batch de HubSpot (100 ids por llamada en lugar de una llamada por deal)
+DEAL_CONTACTS_ASSOCIATIONS_ENDPOINT = f"{HUBSPOT_API_BASE}/crm/v4/associations/deals/contacts/batch/read"
+CONTACTS_BATCH_READ_ENDPOINT = f"{HUBSPOT_API_BASE}/crm/v3/objects/contacts/batch/read"
+BATCH_SIZE = 100
+
+# Canales que no vienen del mapa de fuentes de leads
+NO_CONTACT_CHANNEL = "(Sin contacto asociado)"
+UNMAPPED_CHANNEL = "(Otras fuentes)"
+
+# --- LLAMADAS BATCH ---
+def _batches(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+def _post_batch(url, access_token, payload):
+    response = post_json(url, access_token, payload)
+    response.raise_for_status()
+    return response.json()
+
+def fetch_deal_contacts(access_token, deal_ids):
+    """{deal_id: [contact_id, ...]} con una llamada por cada 100 deals (en paralelo)."""
+    def read(batch):
+        data = _post_batch(DEAL_CONTACTS_ASSOCIATIONS_ENDPOINT, access_token, {
+            "inputs": [{"id": str(deal_id)} for deal_id in batch]
+        })
+        return {
+            int(result["from"]["id"]): [int(target["toObjectId"]) for target in result.get("to", [])]
+            for result in data.get("results", [])
+        }
+
+    associations = {}
+    for part in run_parallel(read, _batches(deal_ids)):
+        associations.update(part)
+    return associations
+
+def fetch_contact_sources(access_token, contact_ids, source_property):
+    """{contact_id: (createdate, fuente de tráfico)} con una llamada por cada 100 contactos."""
+    def read(batch):
+        data = _post_batch(CONTACTS_BATCH_READ_ENDPOINT, access_token, {
+            "properties": ["createdate", source_property],
+            "inputs": [{"id": str(contact_id)} for contact_id in batch],
+        })
+        return {
+            int(result["id"]): (
+                result["properties"].get("createdate") or "",
+                result["properties"].get(source_property),
+            )
+            for result in data.get("results", [])
+        }
+
+    sources = {}
+    for part in run_parallel(read, _batches(contact_ids)):
+        sources.update(part)
+    return sources
+
+# --- JOIN LOCAL ---
+def attribute_deals(deal_contacts, contact_sources):
+    """
+    Hash join deal -> contactos -> fuente. Si un deal tiene varios contactos
+    se atribuye al primero que se creó (el lead original); los contactos sin
+    createdate ("") van al final. Devuelve {deal_id: fuente}.
+    """
+    attribution = {}
+    for deal_id, contact_ids in deal_contacts.items():
+        known = [contact_sources[c] for c in contact_ids if c in contact_sources]
+        if known:
+            attribution[deal_id] = min(known, key=lambda item: (item[0] == "", item[0]))[1]
+    return attribution
+
+def collect_attribution(access_token, pipeline_id_list, date_range, source_property):
+    """
+    Deals cerrados/ganados de la ventana -> asociaciones -> `source_property`
+    del contacto (la propiedad de lead_sources del spec).
+    Devuelve {"YYYY-MM" del cierre: Counter(fuente -> nº de deals)}; los deals
+    sin contacto cuentan en NO_CONTACT_CHANNEL.
+    """
+    print("\nAtribuyendo engagements al canal del lead (asociaciones batch)...")
+    with metrics.span("attribution", window=list(date_range)):
+        deals = fetch_deal_records(access_token, pipeline_id_list, date_range)
+        deal_contacts = fetch_deal_contacts(access_token, deals.ids)
+        contact_ids = {c for contact_ids in deal_contacts.values() for c in contact_ids}
+        attribution = attribute_deals(deal_contacts, fetch_contact_sources(access_token, contact_ids, source_property))
+    print(f"   {len(deals)} deals, {len(contact_ids)} contactos asociados, "
+          f"{len(_batches(deals.ids)) + len(_batches(contact_ids))} llamadas batch")
+
+    months = deals.values("closedate")
+    by_month = {}
+    for deal_id, month_code in zip(deals.ids, deals.codes("closedate")):
+        channel = attribution.get(deal_id, NO_CONTACT_CHANNEL)
+        by_month.setdefault(months[month_code], Counter())[channel] += 1
+    return by_month
+
+# --- REPORTE ---
+def build_attribution_report(deals_by_source, lead_sources_raw, sources_map):
+    """
+    Filas (canal, leads, engagements, conversión) por cada fuente del mapa de
+    leads. La conversión es engagements del mes / leads del mes del mismo canal.
+    """
+    rows = []
+    mapped = set()
+    for label, internal_value in sources_map.items():
+        if internal_value == "MANUAL_SKIP":
+            continue
+        mapped.add(internal_value)
+        leads = lead_sources_raw.get(label) or 0
+        engagements = deals_by_source.get(internal_value, 0)
+        conversion = f"{engagements / leads:.1%}" if leads else ""
+        rows.append((label, leads, engagements, conversion))
+    unmapped = sum(
+        count for source, count in deals_by_source.items()
+        if source not in mapped and source != NO_CONTACT_CHANNEL
+    )
+    rows.append((UNMAPPED_CHANNEL, "", unmapped, ""))
+    rows.append((NO_CONTACT_CHANNEL, "", deals_by_source.get(NO_CONTACT_CHANNEL, 0), ""))
+    rows.append(("Total Engagements", "", sum(deals_by_source.values()), ""))
+    return rows
@@ -0,0 +1,195 @@
+# src/benchmark.py (Benchmark offline de main() contra el servidor local de HubSpot)
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+SRC_DIR = Path(__file__).parent
+DEFAULT_RESULTS_DIR = SRC_DIR.parent / "bench_results"
+
+# --- SERVIDOR DE PRUEBAS ---
+def start_mock_server(args):
+    """
+    Lanza mock_hubspot.py en un proceso aparte (su memoria no cuenta en el
+    RSS del pipeline) y espera a la línea READY con la URL base.
+    """
+    command = [
+        sys.executable, str(SRC_DIR / "mock_hubspot.py"),
+        "--contacts", str(args.contacts), "--deals", str(args.deals),
+        "--months", str(args.months), "--seed", str(args.seed),
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate),
+    ]
+    if args.server_rate_limit:
+        command += ["--rate-limit", str(args.server_rate_limit)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        print(f"[mock] {line.rstrip()}")
+        if line.startswith("READY "):
+            return process, line.split()[1]
+    raise RuntimeError("El servidor de pruebas terminó sin arrancar.")
+
+def fetch_server_stats(base_url):
+    import requests
+    return requests.get(f"{base_url}/__stats", timeout=10).json()
+
+# --- MÉTRICAS ---
+def percentile(values, pct):
+    """Percentil por el método del rango más cercano (None si no hay datos)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso (Linux devuelve KB; macOS, bytes)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# --- EJECUCIÓN ---
+def run_pipeline(base_url, pipeline_args):
+    """Ejecuta main() de punta a punta contra el servidor y mide cada llamada."""
+    os.environ["HUBSPOT_API_BASE"] = base_url
+    os.environ.setdefault("HUBSPOT_ACCESS_TOKEN", "benchmark-token")
+    # Los almacenes locales van a la carpeta temporal, no a los del proyecto
+    workdir = tempfile.mkdtemp(prefix="benchmark_")
+    os.environ["HUBSPOT_MIRROR_PATH"] = os.path.join(workdir, ".hubspot_mirror.sqlite")
+    os.environ["REPORT_HISTORY_PATH"] = os.path.join(workdir, ".report_history.sqlite")
+    os.environ["HUBSPOT_CHECKPOINT_PATH"] = os.path.join(workdir, ".hubspot_checkpoint.jsonl")
+    sys.path.insert(0, str(SRC_DIR))
+
+    # Se importa después de fijar HUBSPOT_API_BASE: los endpoints se leen al importar
+    import hubspot_client
+    import main as report_main
+
+    events = []
+    lock = threading.Lock()
+
+    def observe(event):
+        with lock:
+            events.append(event)
+
+    hubspot_client.add_request_observer(observe)
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)  # Los CSV del reporte se escriben aquí, no en el repo
+    started = time.perf_counter()
+    try:
+        report_main.main(pipeline_args)
+    finally:
+        wall_s = time.perf_counter() - started
+        os.chdir(previous_cwd)
+        hubspot_client.remove_request_observer(observe)
+    return wall_s, events, workdir
+
+def summarize(args, pipeline_args, wall_s, events, server_stats):
+    latencies = [event["latency_s"] for event in events]
+    statuses = {}
+    for event in events:
+        statuses[str(event["status"])] = statuses.get(str(event["status"]), 0) + 1
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "scenario": {
+            "contacts": args.contacts, "deals": args.deals, "months": args.months,
+            "latency_s": args.latency, "jitter_s": args.jitter,
+            "server_rate_limit": args.server_rate_limit, "error_rate": args.error_rate,
+            "pipeline_args": pipeline_args,
+        },
+        "wall_s": round(wall_s, 3),
+        "requests": len(events),
+        "retries": sum(1 for event in events if event["attempt"] > 0),
+        "status_counts": statuses,
+        "response_bytes": sum(event["response_bytes"] for event in events),
+        "latency_ms": {
+            name: (round(value * 1000, 2) if value is not None else None)
+            for name, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p95", percentile(latencies, 95)),
+                ("p99", percentile(latencies, 99)),
+            )
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "server": server_stats,
+    }
+
+def compare(current, baseline_path):
+    """Imprime la diferencia frente a un resultado anterior guardado."""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    print(f"\n--- COMPARACIÓN CON {baseline_path} ---")
+    for name, getter in (
+        ("wall_s", lambda r: r["wall_s"]),
+        ("requests", lambda r: r["requests"]),
+        ("p95 ms", lambda r: r["latency_ms"]["p95"]),
+        ("peak_rss_mb", lambda r: r["peak_rss_mb"]),
+    ):
+        old, new = getter(baseline), getter(current)
+        if old in (None, 0) or new is None:
+            print(f"  {name}: {old} -> {new}")
+        else:
+            print(f"  {name}: {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark de main() contra un HubSpot local. "
+                    "Los argumentos tras '--' se pasan a main.py (p. ej. -- --mode aggregate)."
+    )
+    parser.add_argument("--contacts", type=int, default=10000)
+    parser.add_argument("--deals", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--server-rate-limit", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto bench_results/<fecha>.json)")
+    parser.add_argument("--compare", help="Resultado JSON anterior contra el que comparar")
+    argv = list(sys.argv[1:] if argv is None else argv)
+    pipeline_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, pipeline_args = argv[:split], argv[split + 1:]
+    return parser.parse_args(argv), pipeline_args
+
+def main(argv=None):
+    args, pipeline_args = parse_args(argv)
+    # Sin caché en disco por defecto: medimos la red, no la caché
+    if "--no-cache" not in pipeline_args:
+        pipeline_args.append("--no-cache")
+
+    process, base_url = start_mock_server(args)
+    try:
+        wall_s, events, workdir = run_pipeline(base_url, pipeline_args)
+        server_stats = fetch_server_stats(base_url)
+    finally:
+        process.terminate()
+        process.wait()
+
+    result = summarize(args, pipeline_args, wall_s, events, server_stats)
+    output = Path(args.output) if args.output else (
+        DEFAULT_RESULTS_DIR / f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+
+    print("\n--- RESULTADO DEL BENCHMARK ---")
+    print(f"Tiempo total: {result['wall_s']} s | Peticiones: {result['requests']} "
+          f"(reintentos: {result['retries']}) | Latencia p50/p95/p99: "
+          f"{result['latency_ms']['p50']}/{result['latency_ms']['p95']}/{result['latency_ms']['p99']} ms | "
+          f"Pico RSS: {result['peak_rss_mb']} MB")
+    print(f"Reportes CSV en: {workdir}")
+    print(f"Resultados guardados en: {output}")
+    if args.compare:
+        compare(result, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# src/bitmap_index.py (Índice de bitmaps por token de país y fuente de tráfico)
+
+import argparse
+import re
+from contacts import COUNTRY_PROPERTY, TRAFFIC_SOURCE_PROPERTY, get_last_month_dates, get_month_windows
+from record_store import RecordStore
+
+# NumPy es opcional: si está instalado, cada bitmap sale de un packbits sobre la columna
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- BITSETS ---
+# Cada bitmap es un int de Python: el bit i vale 1 si el registro i tiene el token.
+# AND/OR/NOT/popcount se hacen en C sobre palabras de máquina (sin dependencias).
+
+# int.bit_count existe desde Python 3.10; antes se cuentan los '1' del binario
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+else:
+    def _popcount(bitmap):
+        return bin(bitmap).count("1")
+
+def _code_bitmaps(codes, n_values):
+    """
+    Un bitmap por código de una columna array('I'). Con NumPy cada bitmap es
+    un packbits de `codes == código`; sin NumPy, una sola pasada que marca el
+    bit de cada registro en el buffer de su código (sin listas de posiciones).
+    """
+    if not codes:
+        return [0] * n_values
+    if np is not None:
+        column = np.frombuffer(codes, dtype=np.uint32)
+        return [
+            int.from_bytes(np.packbits(column == code, bitorder="little").tobytes(), "little")
+            for code in range(n_values)
+        ]
+    buffers = [bytearray((len(codes) + 7) // 8) for _ in range(n_values)]
+    for i, code in enumerate(codes):
+        buffers[code][i >> 3] |= 1 << (i & 7)
+    return [int.from_bytes(buffer, "little") for buffer in buffers]
+
+# --- ÍNDICE ---
+class BitmapIndex:
+    """
+    Índice local de los contactos de una ventana: un bitmap por token del
+    multi-checkbox de país (mapeado o no) y otro por valor de la fuente de tráfico.
+    Todas las consultas son operaciones bit a bit, sin llamadas a la API.
+    Sólo lo usa la CLI de consultas; el reporte cuenta con RecordStore.count_by.
+    """
+
+    def __init__(self, records, country_property=COUNTRY_PROPERTY, source_property=TRAFFIC_SOURCE_PROPERTY):
+        # `records` puede ser un RecordStore o una lista de registros (se codifica una vez)
+        if not isinstance(records, RecordStore):
+            store = RecordStore([country_property, source_property])
+            store.add_page(records)
+            records = store
+        self.size = len(records)
+        self.universe = (1 << self.size) - 1
+        self.countries = {}
+        self.country_names = {}
+        # Un bitmap por combinación distinta del multi-checkbox; cada combinación
+        # se parte una sola vez y su bitmap se suma (OR) a todos sus tokens
+        country_values = records.values(country_property)
+        for raw, bitmap in zip(country_values, _code_bitmaps(records.codes(country_property), len(country_values))):
+            for name in (raw or "").split(";"):
+                name = name.strip()
+                if name:
+                    self.country_names.setdefault(name.lower(), name)
+                    self.countries[name.lower()] = self.countries.get(name.lower(), 0) | bitmap
+        source_values = records.values(source_property)
+        self.sources = {
+            value: bitmap
+            for value, bitmap in zip(source_values, _code_bitmaps(records.codes(source_property), len(source_values)))
+            if value
+        }
+        self._levels = None
+
+    # --- BITMAPS BASE ---
+    def country(self, token):
+        """Contactos con ese token de país (sin distinguir mayúsculas). Token desconocido -> 0."""
+        return self.countries.get(token.lower(), 0)
+
+    def source(self, value):
+        return self.sources.get(value, 0)
+
+    def count(self, bitmap):
+        return _popcount(bitmap)
+
+    def all_of(self, *tokens):
+        bitmap = self.universe
+        for token in tokens:
+            bitmap &= self.country(token)
+        return bitmap
+
+    def any_of(self, *tokens):
+        bitmap = 0
+        for token in tokens:
+            bitmap |= self.country(token)
+        return bitmap
+
+    def negate(self, bitmap):
+        return self.universe & ~bitmap
+
+    # --- Nº DE DESTINOS POR CONTACTO ---
+    def _destination_levels(self):
+        """
+        levels[k] = contactos con al menos k+1 destinos. Se calcula como un
+        contador en bitmaps: por cada token, un contacto que ya tenía k sube a k+1.
+        """
+        if self._levels is None:
+            levels = []
+            for bitmap in self.countries.values():
+                carry = bitmap
+                for k in range(len(levels)):
+                    carry, levels[k] = levels[k] & carry, levels[k] | carry
+                    if not carry:
+                        break
+                if carry:
+                    levels.append(carry)
+            self._levels = levels
+        return self._levels
+
+    def destinations_at_least(self, n):
+        if n <= 0:
+            return self.universe
+        levels = self._destination_levels()
+        return levels[n - 1] if n <= len(levels) else 0
+
+    def destinations_exactly(self, n):
+        return self.destinations_at_least(n) & self.negate(self.destinations_at_least(n + 1))
+
+    # --- RESÚMENES ---
+    def country_counts(self):
+        """{token tal y como llega de HubSpot: nº de contactos}, incluidos los no mapeados."""
+        return {
+            self.country_names[token]: _popcount(bitmap)
+            for token, bitmap in sorted(self.countries.items(), key=lambda item: -_popcount(item[1]))
+        }
+
+    def source_counts(self):
+        return {value: _popcount(bitmap) for value, bitmap in self.sources.items()}
+
+    # --- CONSULTAS DE TEXTO ---
+    def query(self, expression):
+        """
+        Evalúa una expresión y devuelve su bitmap. Sintaxis:
+          Spain AND Ireland | Spain OR "New Zealand" | NOT Unknown | (A OR B) AND source:PAID_SOCIAL
+          destinations=1 | destinations>=2
+        """
+        return _Parser(self, expression).parse()
+
+# --- PARSER DE EXPRESIONES ---
+_TOKEN_RE = re.compile(r'\s*(\(|\)|"[^"]*"|[^\s()"]+)')
+
+class _Parser:
+    def __init__(self, index, expression):
+        self.index = index
+        self.tokens = _TOKEN_RE.findall(expression)
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("Expresión incompleta.")
+        self.position += 1
+        return token
+
+    def parse(self):
+        bitmap = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"Token inesperado: {self._peek()}")
+        return bitmap
+
+    def _or(self):
+        bitmap = self._and()
+        while (self._peek() or "").upper() == "OR":
+            self._next()
+            bitmap |= self._and()
+        return bitmap
+
+    def _and(self):
+        bitmap = self._not()
+        while (self._peek() or "").upper() == "AND":
+            self._next()
+            bitmap &= self._not()
+        return bitmap
+
+    def _not(self):
+        if (self._peek() or "").upper() == "NOT":
+            self._next()
+            return self.index.negate(self._not())
+        return self._atom()
+
+    def _atom(self):
+        token = self._next()
+        if token == "(":
+            bitmap = self._or()
+            if self._next() != ")":
+                raise ValueError("Falta ')'.")
+            return bitmap
+        match = re.fullmatch(r"destinations(>=|=)(\d+)", token, re.IGNORECASE)
+        if match:
+            n = int(match.group(2))
+            return self.index.destinations_at_least(n) if match.group(1) == ">=" \
+                else self.index.destinations_exactly(n)
+        if token.lower().startswith("source:"):
+            return self.index.source(token.split(":", 1)[1])
+        return self.index.country(token.strip('"'))
+
+# --- CLI (lee del espejo local: ninguna llamada a la API) ---
+def main(argv=None):
+    import mirror
+    from planner import load_spec
+
+    parser = argparse.ArgumentParser(description="Consultas de países/fuentes sobre el espejo local con bitmaps")
+    parser.add_argument("expressions", nargs="*", help='p. ej. "Spain AND Ireland", "destinations=1"')
+    parser.add_argument("--month", metavar="YYYY-MM", help="Mes a indexar (por defecto, el mes pasado)")
+    args = parser.parse_args(argv)
+
+    start_date_ms, end_date_ms = get_month_windows(args.month, args.month)[0][1] if args.month \
+        else get_last_month_dates()
+    spec = load_spec()
+    index = BitmapIndex(
+        mirror.load_contact_records(mirror.connect(), start_date_ms, end_date_ms),
+        spec["countries"]["property"], spec["lead_sources"]["property"]
+    )
+    print(f"Contactos indexados: {index.size}")
+
+    if not args.expressions:
+        print("\n--- TOKENS DE PAÍS ---")
+        for name, count in index.country_counts().items():
+            print(f"  {name}: {count}")
+        print("\n--- Nº DE DESTINOS POR CONTACTO ---")
+        for n in range(len(index._destination_levels()) + 1):
+            print(f"  {n}: {index.count(index.destinations_exactly(n))}")
+        return
+    for expression in args.expressions:
+        print(f"{expression}: {index.count(index.query(expression))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# src/cache.py (Caché persistente en SQLite de los resultados de búsqueda)
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import metrics
+from hubspot_client import HUBSPOT_API_BASE
+
+# Archivo de caché (junto al proyecto, fuera de src/)
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / ".hubspot_cache.sqlite"
+
+# TTL: un mes cerrado casi no cambia; el mes en curso sí
+CLOSED_WINDOW_TTL_SECONDS = 30 * 24 * 3600
+OPEN_WINDOW_TTL_SECONDS = 15 * 60
+
+# Máximo de entradas antes de expulsar las menos usadas (LRU)
+DEFAULT_MAX_ENTRIES = 10000
+
+_cache_path = Path(os.getenv("HUBSPOT_CACHE_PATH", DEFAULT_CACHE_PATH))
+_max_entries = DEFAULT_MAX_ENTRIES
+_enabled = True
+_refresh = False
+_lock = threading.Lock()
+_conn = None
+
+# --- CONFIGURACIÓN ---
+def configure(path=None, max_entries=None, enabled=True, refresh=False):
+    """
+    Ajusta la caché antes de lanzar búsquedas.
+    refresh=True ignora las entradas existentes (pero guarda los resultados nuevos).
+    """
+    global _cache_path, _max_entries, _enabled, _refresh, _conn
+    with _lock:
+        if path is not None and Path(path) != _cache_path:
+            if _conn is not None:
+                _conn.close()
+                _conn = None
+            _cache_path = Path(path)
+        if max_entries is not None:
+            _max_entries = max_entries
+        _enabled = enabled
+        _refresh = refresh
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(str(_cache_path), check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_last_used ON search_cache (last_used)")
+        _conn.commit()
+    return _conn
+
+# --- CLAVE CANÓNICA ---
+def _canonical_filter(f):
+    """Normaliza un filtro: claves ordenadas y listas de valores ordenadas."""
+    f = dict(f)
+    if "values" in f:
+        f["values"] = sorted(str(v) for v in f["values"])
+    if "value" in f:
+        f["value"] = str(f["value"])
+    return f
+
+def source_id(access_token):
+    """
+    Identidad del origen de los datos: URL base de la API + hash del token.
+    Así dos portales (o el mock) nunca comparten entradas; el token no se guarda en claro.
+    """
+    token_hash = hashlib.sha256((access_token or "").encode("utf-8")).hexdigest()[:16]
+    return f"{HUBSPOT_API_BASE}#{token_hash}"
+
+def make_key(object_type, filters, window, source=None):
+    """
+    Hash canónico de origen + tipo de objeto + filtros + ventana de fechas.
+    El orden de los filtros (y de los valores de un IN) no cambia la clave.
+    """
+    canonical = {
+        "source": source,
+        "object": object_type,
+        "filters": sorted(
+            (json.dumps(_canonical_filter(f), sort_keys=True) for f in filters)
+        ),
+        "window": list(window),
+    }
+    raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def ttl_for_window(window):
+    """TTL largo si la ventana ya terminó, corto si incluye el presente."""
+    _, end_ms = window
+    now_ms = datetime.now().timestamp() * 1000
+    return CLOSED_WINDOW_TTL_SECONDS if end_ms <= now_ms else OPEN_WINDOW_TTL_SECONDS
+
+# --- LECTURA / ESCRITURA ---
+def get(key):
+    """Devuelve el valor guardado o None si no existe, ha caducado o se pidió --refresh."""
+    if not _enabled or _refresh:
+        return None
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        row = conn.execute(
+            "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (now, key))
+        conn.commit()
+    return json.loads(value)
+
+def put(key, value, ttl_seconds):
+    """Guarda un valor (nunca None: los errores no se cachean) y aplica el límite LRU."""
+    if not _enabled or value is None:
+        return
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO search_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl_seconds, now)
+        )
+        # Expulsión LRU: nos quedamos con las `_max_entries` más recientes
+        conn.execute("""
+            DELETE FROM search_cache WHERE key IN (
+                SELECT key FROM search_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (_max_entries,))
+        conn.commit()
+
+def cached_search(access_token, object_type, filters, window, search_func):
+    """
+    Envuelve una búsqueda: si la clave está en caché no hay llamada de red;
+    si no, ejecuta `search_func()` y guarda el resultado con el TTL adecuado.
+    La clave incluye el portal (token) y la URL de la API.
+    """
+    key = make_key(object_type, filters, window, source_id(access_token))
+    value = get(key)
+    if _enabled:
+        metrics.record_cache(value is not None)
+    if value is not None:
+        return value
+    value = search_func()
+    put(key, value, ttl_for_window(window))
+    return value
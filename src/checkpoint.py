@@ -0,0 +1,86 @@
+# src/checkpoint.py (Checkpoint en disco de cada búsqueda completada, para --resume)
+
+import json
+import os
+import threading
+from pathlib import Path
+
+# Archivo de checkpoint (junto al proyecto, fuera de src/): una línea JSON por búsqueda completada
+DEFAULT_CHECKPOINT_PATH = Path(__file__).parent.parent / ".hubspot_checkpoint.jsonl"
+
+_path = Path(os.getenv("HUBSPOT_CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH))
+_completed = {}
+_failed = set()
+_active = False
+_lock = threading.Lock()
+
+# --- CICLO DE VIDA ---
+def start(resume=False, path=None):
+    """
+    Activa el checkpoint de la ejecución.
+    resume=False empieza de cero (borra el anterior); resume=True carga los
+    resultados ya guardados para no repetir esas búsquedas.
+    """
+    global _path, _active
+    with _lock:
+        if path is not None:
+            _path = Path(path)
+        _completed.clear()
+        _failed.clear()
+        _active = True
+        if not resume:
+            _path.unlink(missing_ok=True)
+            return 0
+        if _path.exists():
+            with open(_path, encoding="utf-8") as file:
+                for line in file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Última línea a medio escribir si el proceso murió
+                        continue
+                    _completed[entry["key"]] = entry["count"]
+        return len(_completed)
+
+def finish():
+    """Ejecución completa sin fallos: el checkpoint ya no hace falta."""
+    global _active
+    with _lock:
+        _active = False
+        _completed.clear()
+        _failed.clear()
+        _path.unlink(missing_ok=True)
+
+def is_active():
+    return _active
+
+# --- LECTURA / ESCRITURA ---
+def make_key(search_key, window):
+    """Búsqueda del plan + ventana de fechas (un mismo plan se ejecuta por cada mes)."""
+    return f"{search_key}@{window[0]}-{window[1]}"
+
+def get(key):
+    """Total guardado o None si la búsqueda falló o no llegó a ejecutarse."""
+    return _completed.get(key) if _active else None
+
+def failed():
+    """Búsquedas de esta ejecución que devolvieron None (se repetirán con --resume)."""
+    return set(_failed)
+
+def record(key, count):
+    """Añade el resultado al archivo en cuanto llega (los fallos, None, no se guardan)."""
+    if not _active:
+        return
+    with _lock:
+        if count is None:
+            _failed.add(key)
+            return
+        _failed.discard(key)
+        _completed[key] = count
+        line = json.dumps({"key": key, "count": count}) + "\n"
+        with open(_path, "a", encoding="utf-8") as file:
+            file.write(line)
+            file.flush()
@@ -7,38 +7,76 @@ from dateutil.relativedelta import relativedelta
 from dotenv import load_dotenv 
 from pathlib import Path 
 import pprint
+from cache import cached_search
+import metrics
+from hubspot_client import HUBSPOT_API_BASE, post_json, run_parallel, search_all_partitioned
+from record_store import RecordStore
 
 # URL base para buscar contactos en la API v3 de HubSpot
-API_ENDPOINT = "https://api.hubspot.com/crm/v3/objects/contacts/search"
+API_ENDPOINT = f"{HUBSPOT_API_BASE}/crm/v3/objects/contacts/search"
+
+# Propiedades de contacto por defecto de las funciones get_* (el reporte usa las del spec)
+TRAFFIC_SOURCE_PROPERTY = "original_traffic_source_2_0"
+COUNTRY_PROPERTY = "investment_destination_country__multiple_checkboxes_"
 
 # --- FUNCIÓN DE AYUDA PARA FECHAS ---
+def get_month_dates(year, month):
+    """Calcula las fechas de inicio y fin (exclusivo) de un mes concreto, en ms."""
+    first_day = datetime(year, month, 1)
+    first_day_next_month = first_day + relativedelta(months=1)
+    start_timestamp = int(first_day.timestamp() * 1000)
+    end_timestamp = int(first_day_next_month.timestamp() * 1000)
+    return start_timestamp, end_timestamp
+
 def get_last_month_dates():
     """Calcula las fechas de inicio y fin del mes anterior. Rango de fechas."""
     today = datetime.now()
     first_day_current_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     last_day_last_month = first_day_current_month - relativedelta(days=1)
-    first_day_last_month = last_day_last_month.replace(day=1)
-    start_timestamp = int(first_day_last_month.timestamp() * 1000)
-    end_timestamp = int(first_day_current_month.timestamp() * 1000)
-    return start_timestamp, end_timestamp
+    return get_month_dates(last_day_last_month.year, last_day_last_month.month)
 
-# --- EL "MOTOR" DE BÚSQUEDA ---
-def _search_contacts(access_token, additional_filters=[]):
+def get_month_windows(from_month, to_month):
     """
-    Función interna que busca contactos.
-    El filtro base es SÓLO la fecha de creación.
+    Genera las ventanas mensuales entre 'YYYY-MM' y 'YYYY-MM' (ambos incluidos).
+    Devuelve una lista ordenada de ("YYYY-MM", (inicio_ms, fin_ms)).
     """
-    headers = {
-        "Authorization": f"Bearer {access_token}",          #a quien le hacemos la solicitud
-        "Content-Type": "application/json"                  #formato JSON
-    }
-    start_date_ms, end_date_ms = get_last_month_dates()     #FECHAS para cuando queremos sacar los datos
-    
-    # 1. Filtros Base: SÓLO mes pasado.
-    base_filters = [
+    current = datetime.strptime(from_month, "%Y-%m")
+    last = datetime.strptime(to_month, "%Y-%m")
+    if current > last:
+        raise ValueError(f"El mes inicial {from_month} es posterior al final {to_month}.")
+    windows = []
+    while current <= last:
+        windows.append((current.strftime("%Y-%m"), get_month_dates(current.year, current.month)))
+        current += relativedelta(months=1)
+    return windows
+
+def month_of(value):
+    """'YYYY-MM' (hora local, igual que las ventanas) de una fecha ISO o epoch ms de HubSpot."""
+    if value in (None, ""):
+        return None
+    if str(value).isdigit():
+        moment = datetime.fromtimestamp(int(value) / 1000)
+    else:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00")).astimezone()
+    return moment.strftime("%Y-%m")
+
+def _contact_base_filters(start_date_ms, end_date_ms):
+    """Filtros de fecha de creación [inicio, fin)."""
+    return [
         {"propertyName": "createdate", "operator": "GTE", "value": start_date_ms},
         {"propertyName": "createdate", "operator": "LT", "value": end_date_ms}
     ]
+
+# --- EL "MOTOR" DE BÚSQUEDA ---
+def _search_contacts(access_token, additional_filters=[], date_range=None):
+    """
+    Función interna que busca contactos.
+    El filtro base es SÓLO la fecha de creación (por defecto, el mes pasado).
+    """
+    start_date_ms, end_date_ms = date_range or get_last_month_dates()     #FECHAS para cuando queremos sacar los datos
+    
+    # 1. Filtros Base: SÓLO la ventana de fechas.
+    base_filters = _contact_base_filters(start_date_ms, end_date_ms)
     
     # 2. Combinamos los filtros
     all_filters = base_filters + additional_filters
@@ -48,8 +86,16 @@ def _search_contacts(access_token, additional_filters=[]):
         "limit": 1                                           # Solo queremos el conteo total
     }
 
+    # Los meses cerrados casi no cambian: consultamos antes la caché en disco
+    return cached_search(
+        access_token, "contacts", all_filters, (start_date_ms, end_date_ms),
+        lambda: _request_contacts_total(access_token, payload)
+    )
+
+def _request_contacts_total(access_token, payload):
+    """Lanza la búsqueda y devuelve `total` (None si falla)."""
     try:
-        response = requests.post(API_ENDPOINT, headers=headers, json=payload)
+        response = post_json(API_ENDPOINT, access_token, payload)
         response.raise_for_status()                          # Lanza un error 
         data = response.json()
         return data.get("total", 0)
@@ -74,60 +120,43 @@ def get_total_new_leads(access_token):
     print("Obteniendo total de nuevos leads...")
     return _search_contacts(access_token, additional_filters=[])
 
-def get_leads_by_country(access_token, countries):
-    """Devuelve un desglose de contactos por país (multi-checkbox) y el valor 'Unknown'."""
+def get_leads_by_country(access_token, country_tokens, property_name=COUNTRY_PROPERTY):
+    """
+    Devuelve un desglose de contactos por país (multi-checkbox) y el valor 'Unknown'.
+    `country_tokens` es {país del reporte: token} (la sección "countries" del spec).
+    """
     print("Obteniendo leads por país...")
     
-    results = {}
+    searches = []
     
-    for country in countries:
+    for country, token in country_tokens.items():
         print(f"   - Buscando país: {country}")
-
-        if country in ["Spain", "Ireland", "Indonesia", "Australia"]:
-            # Usamos la propiedad multi-checkbox
-            property_name = "investment_destination_country__multiple_checkboxes_" 
-            country_filter = {
-                "propertyName": property_name,
-                "operator": "CONTAINS_TOKEN", 
-                "value": country
-            }
-        elif country == "Wealth":
-            # Asumimos que "Wealth" se correlaciona con el valor de país "WEALTH" o "Unknown" 
-            # en la propiedad 'investment_destination_country__multiple_checkboxes_'
-            property_name = "investment_destination_country__multiple_checkboxes_" 
-            country_filter = {
-                "propertyName": property_name,
-                "operator": "CONTAINS_TOKEN", 
-                "value": "WEALTH"
-            }
-        elif country == "Unknown":
-            # Esto es un valor de la propiedad 'investment_destination_country__multiple_checkboxes_'
-            property_name = "investment_destination_country__multiple_checkboxes_" 
-            country_filter = {
-                "propertyName": property_name,
-                "operator": "CONTAINS_TOKEN", 
-                "value": "Unknown"
-            }
-        else:
-             # Si no está mapeado, se asume 0 o se usa la lógica Unknown/default.
-             # Para simplificar, si no es conocido, lo ignoramos o lo marcamos como Unknown.
-             continue
         
-        count = _search_contacts(access_token, additional_filters=[country_filter])
-        results[country] = count
-            
-    return results
+        # Usamos la propiedad multi-checkbox
+        country_filter = {
+            "propertyName": property_name,
+            "operator": "CONTAINS_TOKEN", 
+            "value": token
+        }
+        
+        searches.append((country, country_filter))
+    
+    # Todas las búsquedas de país salen a la vez; el orden del dict se conserva
+    counts = run_parallel(
+        lambda search: _search_contacts(access_token, additional_filters=[search[1]]),
+        searches
+    )
+    return {country: count for (country, _), count in zip(searches, counts)}
 
 
-def get_leads_by_traffic_source(access_token, sources_map):
+def get_leads_by_traffic_source(access_token, sources_map, property_name=TRAFFIC_SOURCE_PROPERTY):
     """Devuelve el desglose para fuentes individuales o agregadas.
        Solo busca valores ATÓMICOS de la API.
     """
     print("\nObteniendo leads por fuente de tráfico (Individual/Atómico)...")
     
-    property_name = "original_traffic_source_2_0" 
-    
     results = {}
+    searches = []
     for label, internal_value in sources_map.items():
         # Ignoramos si la etiqueta es 'manual'
         if internal_value == "MANUAL_SKIP":
@@ -142,11 +171,39 @@ def get_leads_by_traffic_source(access_token, sources_map):
             "value": internal_value
         }
         
-        count = _search_contacts(access_token, additional_filters=[source_filter])
+        results[label] = None  # Reservamos la posición para mantener el orden
+        searches.append((label, source_filter))
+    
+    counts = run_parallel(
+        lambda search: _search_contacts(access_token, additional_filters=[search[1]]),
+        searches
+    )
+    for (label, _), count in zip(searches, counts):
         results[label] = count
         
     return results
 
+# --- DESCARGA DE REGISTROS (modo fetch-and-aggregate) ---
+def fetch_contact_records(access_token, date_range=None, properties=()):
+    """
+    Descarga TODOS los contactos creados en la ventana (por defecto el mes
+    pasado), pidiendo sólo `properties` (las que agrupa el spec) y createdate.
+    Devuelve un RecordStore (columnas de códigos, no la lista de JSON).
+    """
+    print("Descargando contactos de la ventana (paginado)...")
+    date_range = date_range or get_last_month_dates()
+    properties = ["createdate"] + [name for name in properties if name != "createdate"]
+    # La fecha sólo se usa para repartir por mes: se guarda ya como 'YYYY-MM'
+    store = RecordStore(properties, transforms={"createdate": month_of})
+    with metrics.span("fetch:contacts", object="contacts", window=list(date_range)):
+        return search_all_partitioned(
+            API_ENDPOINT, access_token,
+            _contact_base_filters,
+            date_range,
+            properties,
+            store=store
+        )
+
 # --- FUNCIÓN AMBASSADORS (CORREGIDA) ---
 def get_leads_ambassadors(access_token, internal_name_code):
     """
@@ -4,35 +4,39 @@ import requests
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import os # Necesario para get_last_month_dates si no se importa de contacts
-from contacts import get_last_month_dates # <--- Importamos la función de fechas
+from contacts import get_last_month_dates, month_of # <--- Importamos las funciones de fechas
+from cache import cached_search
+import metrics
+from hubspot_client import HUBSPOT_API_BASE, post_json, run_parallel, search_all_partitioned
+from record_store import RecordStore
 
 # URL base para buscar Deals en la API v3 de HubSpot
-DEALS_API_ENDPOINT = "https://api.hubspot.com/crm/v3/objects/deals/search"
+DEALS_API_ENDPOINT = f"{HUBSPOT_API_BASE}/crm/v3/objects/deals/search"
 
-# --- EL "MOTOR" DE BÚSQUEDA BASE PARA DEALS (CORREGIDO) ---
-def _search_deals(access_token, pipeline_id_list, additional_filters=[]):
-    """
-    Función interna que busca Deals. 
-    Aplica filtros de pipeline, CERRADO/GANADO y fecha de CIERRE.
-    """
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    start_date_ms, end_date_ms = get_last_month_dates()
-    
-    # 1. Filtros Base: Pipeline, Cerrado-Ganado y Fecha de CIERRE.
-    base_filters = [
+def _deal_base_filters(pipeline_id_list, start_date_ms, end_date_ms):
+    """Filtros base: Cerrado/Ganado, fecha de CIERRE [inicio, fin) y pipelines."""
+    return [
         # Filtro 1: Debe estar Cerrado/Ganado (hs_is_closed_won = True)
         {"propertyName": "hs_is_closed_won", "operator": "EQ", "value": "true"}, 
         
-        # Filtro 2: Deals CERRADOS el mes pasado (closedate)
+        # Filtro 2: Deals CERRADOS en el rango (closedate)
         {"propertyName": "closedate", "operator": "GTE", "value": start_date_ms},
         {"propertyName": "closedate", "operator": "LT", "value": end_date_ms},
         
         # Filtro 3: Limitar a los pipelines de interés
         {"propertyName": "pipeline", "operator": "IN", "values": pipeline_id_list}
     ]
+
+# --- EL "MOTOR" DE BÚSQUEDA BASE PARA DEALS (CORREGIDO) ---
+def _search_deals(access_token, pipeline_id_list, additional_filters=[], date_range=None):
+    """
+    Función interna que busca Deals. 
+    Aplica filtros de pipeline, CERRADO/GANADO y fecha de CIERRE (por defecto, el mes pasado).
+    """
+    start_date_ms, end_date_ms = date_range or get_last_month_dates()
+    
+    # 1. Filtros Base: Pipeline, Cerrado-Ganado y Fecha de CIERRE.
+    base_filters = _deal_base_filters(pipeline_id_list, start_date_ms, end_date_ms)
     
     # 2. Combinamos todos los filtros
     all_filters = base_filters + additional_filters
@@ -43,8 +47,16 @@ def _search_deals(access_token, pipeline_id_list, additional_filters=[]):
         "limit": 1 # Solo queremos el conteo total
     }
 
+    # Los meses cerrados casi no cambian: consultamos antes la caché en disco
+    return cached_search(
+        access_token, "deals", all_filters, (start_date_ms, end_date_ms),
+        lambda: _request_deals_total(access_token, payload)
+    )
+
+def _request_deals_total(access_token, payload):
+    """Lanza la búsqueda y devuelve `total` (None si falla)."""
     try:
-        response = requests.post(DEALS_API_ENDPOINT, headers=headers, json=payload)
+        response = post_json(DEALS_API_ENDPOINT, access_token, payload)
         response.raise_for_status() 
         data = response.json()
         return data.get("total", 0)
@@ -71,18 +83,18 @@ def get_engagements_per_pipeline(access_token, pipeline_map):
     Obtiene el conteo total de deals para cada pipeline especificado en el mapa.
     """
     print("\nObteniendo Engagements (Deals) por Pipeline...")
-    results = {}
     
     # Usamos la lista de IDs de pipelines que ya existe en el mapa
     
     for label, pipeline_id in pipeline_map.items():
         print(f"  - Buscando Pipeline: {label} (ID: {pipeline_id})")
-        
-        # Para el conteo por pipeline, solo usamos el ID de ese pipeline para el filtro
-        count = _search_deals(access_token, [pipeline_id], additional_filters=[])
-        results[label] = count
-        
-    return results
+    
+    # Para el conteo por pipeline, solo usamos el ID de ese pipeline para el filtro
+    counts = run_parallel(
+        lambda pipeline_id: _search_deals(access_token, [pipeline_id], additional_filters=[]),
+        pipeline_map.values()
+    )
+    return dict(zip(pipeline_map.keys(), counts))
 
 def get_engagements_breakdown_by_property(access_token, pipeline_id_list, property_name, property_map):
     """
@@ -90,7 +102,7 @@ def get_engagements_breakdown_by_property(access_token, pipeline_id_list, proper
     """
     print(f"\nObteniendo desglose de Engagements por propiedad: {property_name}...")
     
-    results = {}
+    searches = []
     
     for label, internal_value in property_map.items():
         print(f"  - Buscando por: {label} (Valor API: {internal_value})")
@@ -101,9 +113,31 @@ def get_engagements_breakdown_by_property(access_token, pipeline_id_list, proper
             "operator": "EQ", # Asumimos operador de igualdad (EQ)
             "value": internal_value
         }
-        
-        # Usamos todos los pipelines definidos en 'pipeline_id_list'
-        count = _search_deals(access_token, pipeline_id_list, additional_filters=[property_filter])
-        results[label] = count
-        
-    return results
\ No newline at end of file
+        searches.append((label, property_filter))
+    
+    # Usamos todos los pipelines definidos en 'pipeline_id_list'
+    counts = run_parallel(
+        lambda search: _search_deals(access_token, pipeline_id_list, additional_filters=[search[1]]),
+        searches
+    )
+    return {label: count for (label, _), count in zip(searches, counts)}
+
+def fetch_deal_records(access_token, pipeline_id_list, date_range=None, properties=()):
+    """
+    Descarga TODOS los deals cerrados/ganados en la ventana (por defecto el mes
+    pasado) en los pipelines indicados, pidiendo sólo `properties` (las que
+    agrupa el spec) y closedate.
+    Devuelve un RecordStore (closedate guardado como 'YYYY-MM').
+    """
+    print("\nDescargando deals cerrados/ganados de la ventana (paginado)...")
+    date_range = date_range or get_last_month_dates()
+    properties = ["closedate"] + [name for name in properties if name != "closedate"]
+    store = RecordStore(properties, transforms={"closedate": month_of})
+    with metrics.span("fetch:deals", object="deals", window=list(date_range)):
+        return search_all_partitioned(
+            DEALS_API_ENDPOINT, access_token,
+            lambda start_date_ms, end_date_ms: _deal_base_filters(pipeline_id_list, start_date_ms, end_date_ms),
+            date_range,
+            properties,
+            store=store
+        )
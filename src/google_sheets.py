@@ -0,0 +1,200 @@
+# src/google_sheets.py (Exportador del reporte a Google Sheets por lotes)
+
+import os
+import threading
+import time
+import requests
+from urllib.parse import quote
+from hubspot_client import (
+    MAX_RETRIES,
+    RETRYABLE_STATUS,
+    REQUEST_TIMEOUT_SECONDS,
+    _backoff_seconds,
+    _retry_after_seconds
+)
+
+# Base de la API (se puede apuntar al servidor local de pruebas)
+SHEETS_API_BASE = os.getenv("GOOGLE_SHEETS_API_BASE", "https://sheets.googleapis.com").rstrip("/")
+SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+# --- AUTENTICACIÓN ---
+def get_access_token():
+    """
+    Token OAuth para la API de Sheets:
+    1. GOOGLE_SHEETS_ACCESS_TOKEN si está definido (también sirve para el servidor de pruebas).
+    2. Si no, la cuenta de servicio de GOOGLE_SERVICE_ACCOUNT_FILE (requiere oauth2client).
+    """
+    token = os.getenv("GOOGLE_SHEETS_ACCESS_TOKEN")
+    if token:
+        return token
+    keyfile = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
+    if not keyfile:
+        raise ValueError("No se encontró GOOGLE_SHEETS_ACCESS_TOKEN ni GOOGLE_SERVICE_ACCOUNT_FILE.")
+    try:
+        from oauth2client.service_account import ServiceAccountCredentials
+    except ImportError:
+        raise ImportError("Para usar una cuenta de servicio instala oauth2client (pip install oauth2client).")
+    credentials = ServiceAccountCredentials.from_json_keyfile_name(keyfile, SHEETS_SCOPES)
+    return credentials.get_access_token().access_token
+
+# --- RANGOS A1 ---
+def column_letter(index):
+    """1 -> 'A', 27 -> 'AA'."""
+    letters = ""
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def a1_range(sheet_name, first_row, first_col, last_row, last_col):
+    """Rango A1 con el nombre de la pestaña entre comillas ('Reporte'!A1:B3)."""
+    sheet = "'" + sheet_name.replace("'", "''") + "'"
+    return f"{sheet}!{column_letter(first_col)}{first_row}:{column_letter(last_col)}{last_row}"
+
+# --- REJILLAS ---
+def report_to_grid(final_report_data):
+    """Reporte de un mes -> filas [MÉTRICA, VALOR] con cabecera (igual que el CSV)."""
+    return [["MÉTRICA", "VALOR"]] + [[label, value] for label, value in final_report_data]
+
+def wide_report_to_grid(reports_by_month):
+    """Varios meses -> una columna por mes (igual que el CSV ancho)."""
+    months = list(reports_by_month.keys())
+    reports = list(reports_by_month.values())
+    grid = [["MÉTRICA"] + months]
+    for i, (label, _) in enumerate(reports[0]):
+        grid.append([label] + [report[i][1] for report in reports])
+    return grid
+
+def _cell(value):
+    """Normaliza un valor para comparar (Sheets devuelve '' para celdas vacías)."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+# --- DIFERENCIAS ---
+def diff_ranges(current, desired, sheet_name):
+    """
+    Compara la rejilla actual de la hoja con la deseada y devuelve la lista
+    mínima de rangos {range, values} a escribir:
+    - en cada fila, las celdas cambiadas contiguas forman un tramo;
+    - filas consecutivas con el mismo tramo de columnas se unen en un bloque.
+    Las celdas que sobran en la hoja (fuera de la rejilla deseada) se vacían.
+    """
+    n_rows = max(len(current), len(desired))
+    runs = []  # (fila, col_inicio, col_fin) con base 1
+    for r in range(n_rows):
+        current_row = current[r] if r < len(current) else []
+        desired_row = desired[r] if r < len(desired) else []
+        n_cols = max(len(current_row), len(desired_row))
+        start = None
+        for c in range(n_cols + 1):
+            changed = c < n_cols and _cell(current_row[c] if c < len(current_row) else None) != \
+                _cell(desired_row[c] if c < len(desired_row) else None)
+            if changed and start is None:
+                start = c
+            elif not changed and start is not None:
+                runs.append((r + 1, start + 1, c))
+                start = None
+
+    def desired_value(row, col):
+        row_values = desired[row - 1] if row - 1 < len(desired) else []
+        return row_values[col - 1] if col - 1 < len(row_values) else ""
+
+    blocks = []
+    for row, first_col, last_col in runs:
+        last = blocks[-1] if blocks else None
+        if last and last["last_row"] == row - 1 and last["cols"] == (first_col, last_col):
+            last["last_row"] = row
+        else:
+            blocks.append({"first_row": row, "last_row": row, "cols": (first_col, last_col)})
+
+    data = []
+    for block in blocks:
+        first_col, last_col = block["cols"]
+        values = [
+            [desired_value(row, col) for col in range(first_col, last_col + 1)]
+            for row in range(block["first_row"], block["last_row"] + 1)
+        ]
+        data.append({
+            "range": a1_range(sheet_name, block["first_row"], first_col, block["last_row"], last_col),
+            "values": values,
+        })
+    return data
+
+# --- API ---
+def _headers(access_token):
+    return {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+
+# --- SESIÓN HTTP (keep-alive) Y REINTENTOS ---
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
+
+def _request(method, url, access_token, **request_options):
+    """
+    Petición a Sheets por una sesión propia, con la misma política que
+    hubspot_client: timeout por intento y reintentos con backoff ante 429/5xx
+    o errores de conexión, respetando Retry-After. Devuelve la última respuesta.
+    """
+    attempt = 0
+    while True:
+        try:
+            response = _get_session().request(
+                method, url, headers=_headers(access_token), timeout=REQUEST_TIMEOUT_SECONDS, **request_options
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt >= MAX_RETRIES:
+                raise
+            time.sleep(_backoff_seconds(attempt))
+            attempt += 1
+            continue
+        if response.status_code not in RETRYABLE_STATUS or attempt >= MAX_RETRIES:
+            return response
+        retry_after = _retry_after_seconds(response)
+        time.sleep(retry_after if retry_after is not None else _backoff_seconds(attempt))
+        print(f"   (Sheets: reintento {attempt + 1}/{MAX_RETRIES} tras HTTP {response.status_code})")
+        attempt += 1
+
+def read_sheet(spreadsheet_id, sheet_name, access_token):
+    """Lee todos los valores de la pestaña (1 petición). Pestaña vacía -> []."""
+    sheet = quote("'" + sheet_name.replace("'", "''") + "'", safe="")
+    url = f"{SHEETS_API_BASE}/v4/spreadsheets/{spreadsheet_id}/values/{sheet}"
+    response = _request("GET", url, access_token, params={"valueRenderOption": "UNFORMATTED_VALUE"})
+    response.raise_for_status()
+    return response.json().get("values", [])
+
+def batch_update(spreadsheet_id, data, access_token):
+    """Escribe todos los rangos en UNA llamada a values.batchUpdate."""
+    url = f"{SHEETS_API_BASE}/v4/spreadsheets/{spreadsheet_id}/values:batchUpdate"
+    # RAW: las etiquetas que empiezan por '-' ('--- 6Deal Type ---') se
+    # interpretarían como fórmulas; los enteros ya van como números JSON
+    payload = {"valueInputOption": "RAW", "data": data}
+    # Reintentar es seguro: batchUpdate escribe los mismos valores en los mismos rangos
+    response = _request("POST", url, access_token, json=payload)
+    response.raise_for_status()
+    return response.json()
+
+def export_grid(grid, spreadsheet_id, sheet_name, access_token=None):
+    """
+    Exporta una rejilla completa: 1 lectura + como mucho 1 batchUpdate con
+    sólo los rangos que han cambiado. Devuelve el nº de rangos escritos.
+    """
+    access_token = access_token or get_access_token()
+    print(f"\nExportando reporte a Google Sheets ({spreadsheet_id} / {sheet_name})...")
+    current = read_sheet(spreadsheet_id, sheet_name, access_token)
+    data = diff_ranges(current, grid, sheet_name)
+    if not data:
+        print("La hoja ya está al día: no se envía ninguna escritura.")
+        return 0
+    result = batch_update(spreadsheet_id, data, access_token)
+    print(f"¡Éxito! {len(data)} rangos actualizados "
+          f"({result.get('totalUpdatedCells', '?')} celdas) en una sola llamada.")
+    return len(data)
@@ -0,0 +1,284 @@
+# src/history.py (Histórico de reportes en SQLite indexado + consultas de tendencia y diff)
+
+import argparse
+import csv
+import os
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from dateutil.relativedelta import relativedelta
+
+DEFAULT_HISTORY_PATH = Path(__file__).parent.parent / ".report_history.sqlite"
+
+# Secciones del reporte mensual actual
+LEADS_SECTION = "--- 2LEADS - SPLIT PER CHANNEL ---"
+ENGAGEMENTS_SECTION = "--- 5ENGAGEMENTS - SPLIT PER CHANNEL ---"
+
+# Métricas de los CSV antiguos (reporte_hubspot_*) -> (sección, métrica) actuales
+LEGACY_METRICS = {
+    "Total Engagements (Mes Pasado)": (ENGAGEMENTS_SECTION, "# of new Engagements"),
+    "Total Nuevos Leads (Mes Pasado)": (LEADS_SECTION, "# of new leads"),
+}
+
+# Nombres cortos aceptados en las consultas
+METRIC_ALIASES = {
+    "Total Engagements": "# of new Engagements",
+    "Total Nuevos Leads": "# of new leads",
+    "Total Leads": "# of new leads",
+}
+
+# --- CONEXIÓN ---
+def connect(path=None):
+    path = path or os.getenv("REPORT_HISTORY_PATH", DEFAULT_HISTORY_PATH)
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS report_history (
+            run_ts TEXT NOT NULL,
+            month TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            section TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            value TEXT,
+            value_num REAL,
+            source TEXT,
+            PRIMARY KEY (run_ts, month, section, metric)
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_metric ON report_history (metric, month, run_ts);
+        CREATE INDEX IF NOT EXISTS idx_history_month_run ON report_history (month, run_ts);
+    """)
+    return conn
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _rows_with_sections(final_report_data):
+    """(posición, sección, métrica, valor) para cada fila con métrica; las cabeceras fijan la sección."""
+    section = ""
+    for position, (label, value) in enumerate(final_report_data):
+        if not label:
+            continue
+        if label.startswith("---"):
+            section = label
+            continue
+        yield position, section, label, value
+
+# --- ESCRITURA ---
+def append_run(final_report_data, month, run_ts=None, source="main.py", conn=None):
+    """Guarda una ejecución del reporte (todas sus métricas) para el mes indicado."""
+    conn = conn or connect()
+    run_ts = run_ts or datetime.now().isoformat(timespec="seconds")
+    rows = [
+        (run_ts, month, position, section, metric, None if value is None else str(value), _to_number(value), source)
+        for position, section, metric, value in _rows_with_sections(final_report_data)
+    ]
+    conn.executemany("INSERT OR REPLACE INTO report_history VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    return len(rows)
+
+# --- IMPORTACIÓN DE CSV ANTIGUOS ---
+def report_month_for(run_date):
+    """Los reportes siempre cubren el mes anterior a la fecha de ejecución."""
+    return (run_date.replace(day=1) - relativedelta(months=1)).strftime("%Y-%m")
+
+def parse_csv(path):
+    """
+    Lee cualquiera de los formatos de CSV del repo y devuelve la lista
+    (MÉTRICA, VALOR) con cabeceras de sección '--- ... ---':
+    - reporte_mensual_*: ya viene en ese formato.
+    - reporte_hubspot_*: bloques separados por líneas vacías; la primera fila
+      de cada bloque es su cabecera (se usa como sección).
+    """
+    with open(path, encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    if rows and rows[0] and rows[0][0] == "MÉTRICA":
+        return [(row[0], row[1] if len(row) > 1 else "") for row in rows[1:] if row]
+
+    data = []
+    new_block = True
+    for row in rows:
+        if not row or not any(cell.strip() for cell in row):
+            new_block = True
+            continue
+        if new_block:
+            new_block = False
+            if row[0] != "Metrica":
+                data.append((f"--- {row[0]} ---", ""))
+            continue
+        label, value = row[0].strip(), row[1] if len(row) > 1 else ""
+        if label in LEGACY_METRICS:
+            section, label = LEGACY_METRICS[label]
+            data.append((section, ""))
+            data.append((label, value))
+            data.append(("--- Metrica ---", ""))
+        else:
+            data.append((label, value))
+    return data
+
+def import_csv(path, conn=None):
+    """Importa un CSV del repo usando la fecha del nombre como momento de ejecución."""
+    match = re.search(r"(\d{4}-\d{2}-\d{2})", Path(path).name)
+    if not match:
+        raise ValueError(f"No se encuentra la fecha en el nombre del archivo: {path}")
+    run_date = datetime.strptime(match.group(1), "%Y-%m-%d")
+    return append_run(
+        parse_csv(path), report_month_for(run_date),
+        run_ts=run_date.isoformat(timespec="seconds"), source=Path(path).name, conn=conn
+    )
+
+# --- CONSULTAS ---
+def _metric_filter(metric, section):
+    metric = METRIC_ALIASES.get(metric, metric)
+    sql, params = "metric = ?", [metric]
+    if section:
+        sql += " AND section = ?"
+        params.append(section)
+    return sql, params
+
+def trend(conn, metric, section=None):
+    """Mes a mes: el valor de la última ejecución de cada mes. [(sección, mes, run_ts, valor)]."""
+    where, params = _metric_filter(metric, section)
+    return conn.execute(f"""
+        SELECT h.section, h.month, h.run_ts, h.value
+        FROM report_history h
+        WHERE {where.replace('metric', 'h.metric').replace('section', 'h.section')}
+          AND h.run_ts = (
+              SELECT MAX(run_ts) FROM report_history
+              WHERE metric = h.metric AND section = h.section AND month = h.month
+          )
+        ORDER BY h.section, h.month
+    """, params).fetchall()
+
+def runs(conn, metric, month=None, section=None):
+    """Ejecución a ejecución del mismo mes. [(sección, mes, run_ts, valor)]."""
+    where, params = _metric_filter(metric, section)
+    if month:
+        where += " AND month = ?"
+        params.append(month)
+    return conn.execute(f"""
+        SELECT section, month, run_ts, value FROM report_history
+        WHERE {where} ORDER BY section, month, run_ts
+    """, params).fetchall()
+
+def list_runs(conn, month=None):
+    sql = "SELECT month, run_ts, source, COUNT(*) FROM report_history"
+    params = []
+    if month:
+        sql += " WHERE month = ?"
+        params.append(month)
+    return conn.execute(sql + " GROUP BY month, run_ts, source ORDER BY month, run_ts", params).fetchall()
+
+def latest_runs(conn):
+    """
+    Última ejecución de cada mes con todas sus filas, en orden del reporte:
+    {mes: {"run_ts": ..., "rows": [(sección, métrica, valor), ...]}}.
+    """
+    rows = conn.execute("""
+        SELECT h.month, h.run_ts, h.section, h.metric, h.value
+        FROM report_history h
+        JOIN (SELECT month, MAX(run_ts) AS run_ts FROM report_history GROUP BY month) latest
+          ON latest.month = h.month AND latest.run_ts = h.run_ts
+        ORDER BY h.month, h.position
+    """).fetchall()
+    runs_by_month = {}
+    for month, run_ts, section, metric, value in rows:
+        entry = runs_by_month.setdefault(month, {"run_ts": run_ts, "rows": []})
+        entry["rows"].append((section, metric, value))
+    return runs_by_month
+
+def diff(conn, month, run_a=None, run_b=None):
+    """
+    Métricas que cambian entre dos ejecuciones del mismo mes (por defecto,
+    las dos últimas). Devuelve (run_a, run_b, [(sección, métrica, valor_a, valor_b)]).
+    """
+    if not (run_a and run_b):
+        latest = [row[0] for row in conn.execute(
+            "SELECT DISTINCT run_ts FROM report_history WHERE month = ? ORDER BY run_ts DESC LIMIT 2", (month,)
+        )]
+        if len(latest) < 2:
+            return None, None, []
+        run_b, run_a = latest
+    # LEFT JOIN + las filas sólo de b (sin FULL OUTER JOIN: exige SQLite >= 3.39)
+    changes = conn.execute("""
+        WITH a AS (SELECT * FROM report_history WHERE month = ? AND run_ts = ?),
+             b AS (SELECT * FROM report_history WHERE month = ? AND run_ts = ?)
+        SELECT a.section, a.metric, a.value, b.value, COALESCE(b.position, a.position) AS position
+        FROM a LEFT JOIN b ON a.section = b.section AND a.metric = b.metric
+        WHERE a.value IS NOT b.value
+        UNION ALL
+        SELECT b.section, b.metric, NULL, b.value, b.position
+        FROM b
+        WHERE NOT EXISTS (SELECT 1 FROM a WHERE a.section = b.section AND a.metric = b.metric)
+        ORDER BY position
+    """, (month, run_a, month, run_b)).fetchall()
+    return run_a, run_b, [row[:4] for row in changes]
+
+def _delta(previous, current):
+    a, b = _to_number(previous), _to_number(current)
+    if a is None or b is None:
+        return ""
+    return f"{b - a:+g}"
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Histórico de reportes: importar, tendencias y diffs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="Importa CSV de reportes existentes")
+    p_import.add_argument("files", nargs="+")
+
+    p_trend = sub.add_parser("trend", help="Evolución mes a mes de una métrica (última ejecución de cada mes)")
+    p_trend.add_argument("metric")
+    p_trend.add_argument("--section")
+
+    p_runs = sub.add_parser("runs", help="Valor de una métrica en cada ejecución (run a run)")
+    p_runs.add_argument("metric")
+    p_runs.add_argument("--month")
+    p_runs.add_argument("--section")
+
+    p_list = sub.add_parser("list", help="Lista las ejecuciones guardadas")
+    p_list.add_argument("--month")
+
+    p_diff = sub.add_parser("diff", help="Métricas que cambian entre dos ejecuciones del mismo mes")
+    p_diff.add_argument("month")
+    p_diff.add_argument("run_a", nargs="?")
+    p_diff.add_argument("run_b", nargs="?")
+
+    args = parser.parse_args(argv)
+    conn = connect()
+
+    if args.command == "import":
+        for path in args.files:
+            count = import_csv(path, conn)
+            print(f"{path}: {count} métricas importadas")
+
+    elif args.command in ("trend", "runs"):
+        rows = trend(conn, args.metric, args.section) if args.command == "trend" \
+            else runs(conn, args.metric, args.month, args.section)
+        if not rows:
+            print(f"No hay datos para '{args.metric}'.")
+        previous = {}
+        for section, month, run_ts, value in rows:
+            group = section if args.command == "trend" else (section, month)
+            delta = _delta(previous.get(group), value) if group in previous else ""
+            previous[group] = value
+            print(f"{section:45} {month}  {run_ts}  {str(value):>10}  {delta}")
+
+    elif args.command == "list":
+        for month, run_ts, source, count in list_runs(conn, args.month):
+            print(f"{month}  {run_ts}  {count:3} métricas  ({source})")
+
+    elif args.command == "diff":
+        run_a, run_b, changes = diff(conn, args.month, args.run_a, args.run_b)
+        if run_a is None:
+            print(f"Hacen falta al menos dos ejecuciones de {args.month}.")
+            return
+        print(f"Diferencias {args.month}: {run_a} -> {run_b}")
+        for section, metric, value_a, value_b in changes:
+            print(f"  {section:45} {metric:40} {str(value_a):>10} -> {str(value_b):<10} {_delta(value_a, value_b)}")
+
+if __name__ == "__main__":
+    main()
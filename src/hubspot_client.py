@@ -0,0 +1,342 @@
+# src/hubspot_client.py (Sesión compartida, motor de concurrencia y control de cuota)
+
+import os
+import contextvars
+import threading
+import time
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# Base de la API (se puede apuntar a un servidor local de pruebas)
+HUBSPOT_API_BASE = os.getenv("HUBSPOT_API_BASE", "https://api.hubspot.com").rstrip("/")
+
+# Límite por defecto de búsquedas simultáneas contra HubSpot
+DEFAULT_MAX_WORKERS = 8
+
+# Cuota de la API de búsqueda de HubSpot (peticiones por segundo por portal)
+DEFAULT_SEARCH_RATE = 5
+
+# Los GET de listado (p. ej. archivados) no cuentan contra /search sino contra
+# el límite general del portal: llevan su propio cubo para no gastar búsquedas
+DEFAULT_LIST_RATE = float(os.getenv("HUBSPOT_LIST_RATE", 10))
+
+# Reintentos ante errores transitorios (429 y 5xx)
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Tiempo máximo por intento (conexión, lectura): un socket colgado cuenta como error de conexión
+REQUEST_TIMEOUT_SECONDS = (10, 60)
+
+_max_workers = DEFAULT_MAX_WORKERS
+_request_slots = threading.BoundedSemaphore(DEFAULT_MAX_WORKERS)
+_session = None
+_session_lock = threading.Lock()
+_request_observers = []
+
+# --- CONFIGURACIÓN ---
+def set_max_workers(max_workers):
+    """Configura cuántas peticiones pueden estar en vuelo a la vez (se llama antes de lanzar búsquedas)."""
+    global _max_workers, _request_slots, _session
+    if max_workers < 1:
+        raise ValueError("El límite de concurrencia debe ser al menos 1.")
+    with _session_lock:
+        _max_workers = max_workers
+        _request_slots = threading.BoundedSemaphore(max_workers)
+        _session = None  # Se recrea con un pool del tamaño adecuado
+
+def get_max_workers():
+    return _max_workers
+
+# --- PLANIFICADOR: TOKEN BUCKET COMPARTIDO ---
+class TokenBucket:
+    """
+    Cubo de fichas compartido por todos los hilos: cada petición consume una ficha
+    y las fichas se reponen a `rate` por segundo (hasta `capacity`).
+    `pause(seconds)` congela el cubo entero, p. ej. tras un 429 con Retry-After.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                    self._last_refill = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+_bucket = TokenBucket(DEFAULT_SEARCH_RATE)
+_list_bucket = TokenBucket(DEFAULT_LIST_RATE)
+
+def set_rate_limit(requests_per_second, burst=None):
+    """Ajusta el cubo a la cuota de búsqueda del portal."""
+    global _bucket
+    if requests_per_second <= 0:
+        raise ValueError("La cuota debe ser mayor que 0.")
+    _bucket = TokenBucket(requests_per_second, burst)
+
+def _retry_after_seconds(response):
+    """Lee Retry-After (segundos o fecha HTTP). Devuelve None si no viene."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _rate_limit_pause_seconds(response):
+    """Si las cabeceras X-HubSpot-RateLimit-* indican cuota agotada, cuánto esperar."""
+    headers = response.headers
+    if headers.get("X-HubSpot-RateLimit-Secondly-Remaining") == "0":
+        return 1.0
+    if headers.get("X-HubSpot-RateLimit-Remaining") == "0":
+        interval_ms = headers.get("X-HubSpot-RateLimit-Interval-Milliseconds", "1000")
+        try:
+            return int(interval_ms) / 1000
+        except ValueError:
+            return 1.0
+    return None
+
+def _backoff_seconds(attempt):
+    """Backoff exponencial con jitter completo."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+# --- OBSERVADORES DE PETICIONES ---
+def add_request_observer(callback):
+    """
+    Registra `callback(event)` para cada intento HTTP. `event` es un dict con
+    url, status (None si hubo error de conexión), latency_s, response_bytes y attempt.
+    """
+    _request_observers.append(callback)
+
+def remove_request_observer(callback):
+    if callback in _request_observers:
+        _request_observers.remove(callback)
+
+def _notify(url, status, latency_s, response_bytes, attempt):
+    event = {
+        "url": url,
+        "status": status,
+        "latency_s": latency_s,
+        "response_bytes": response_bytes,
+        "attempt": attempt,
+    }
+    for callback in list(_request_observers):
+        callback(event)
+
+# --- SESIÓN HTTP (keep-alive) ---
+def get_session():
+    """Devuelve una única sesión HTTP con pool de conexiones reutilizables."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+def post_json(url, access_token, payload):
+    """
+    Envía un POST autenticado por la sesión compartida.
+    Como máximo hay `_max_workers` peticiones abiertas al mismo tiempo y todas
+    pasan por el token bucket. Los 429/5xx y errores de conexión se reintentan
+    con backoff (respetando Retry-After); se devuelve la última respuesta.
+    """
+    return _send("POST", url, access_token, json=payload)
+
+def get_json(url, access_token, params=None):
+    """
+    GET autenticado con los mismos reintentos que post_json, pero con el cubo
+    de listados: recorrer un listado no retrasa las búsquedas del reporte.
+    """
+    return _send("GET", url, access_token, bucket=_list_bucket, params=params)
+
+def _send(method, url, access_token, bucket=None, **request_options):
+    bucket = bucket or _bucket
+    headers = {
+        "Authorization": f"Bearer {access_token}",          #a quien le hacemos la solicitud
+        "Content-Type": "application/json"                  #formato JSON
+    }
+    attempt = 0
+    while True:
+        bucket.acquire()
+        started = time.perf_counter()
+        try:
+            with _request_slots:
+                response = get_session().request(
+                    method, url, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS, **request_options
+                )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            _notify(url, None, time.perf_counter() - started, 0, attempt)
+            if attempt >= MAX_RETRIES:
+                raise
+            time.sleep(_backoff_seconds(attempt))
+            attempt += 1
+            continue
+        _notify(url, response.status_code, time.perf_counter() - started, len(response.content), attempt)
+
+        pause = _rate_limit_pause_seconds(response)
+        if pause:
+            bucket.pause(pause)
+
+        if response.status_code not in RETRYABLE_STATUS or attempt >= MAX_RETRIES:
+            return response
+
+        retry_after = _retry_after_seconds(response)
+        if retry_after is not None:
+            # El 429 afecta a todo el portal: congelamos el cubo para todos los hilos
+            bucket.pause(retry_after)
+            time.sleep(retry_after)
+        else:
+            time.sleep(_backoff_seconds(attempt))
+        print(f"   (reintento {attempt + 1}/{MAX_RETRIES} tras HTTP {response.status_code})")
+        attempt += 1
+
+# --- PAGINACIÓN DE BÚSQUEDAS ---
+# HubSpot no devuelve más de 200 registros por página en /search
+SEARCH_PAGE_SIZE = 200
+
+# ...y deja de paginar a partir de 10.000 resultados por búsqueda
+SEARCH_RESULT_CAP = 10000
+
+def search_all_pages(url, access_token, filters, properties, page_size=SEARCH_PAGE_SIZE, on_page=None):
+    """
+    Recorre todas las páginas de una búsqueda y devuelve la lista de registros
+    ({"id": ..., "properties": {...}}). Sólo se piden las propiedades indicadas.
+    Con `on_page`, cada página se entrega a esa función y no se acumula nada.
+    Si alguna página falla se lanza la excepción: un conteo parcial sería incorrecto.
+    """
+    records = []
+    after = None
+    while True:
+        payload = {
+            "filterGroups": [{"filters": filters}],
+            "properties": properties,
+            "limit": page_size
+        }
+        if after is not None:
+            payload["after"] = after
+        response = post_json(url, access_token, payload)
+        response.raise_for_status()
+        data = response.json()
+        if on_page is not None:
+            on_page(data.get("results", []))
+        else:
+            records.extend(data.get("results", []))
+        after = data.get("paging", {}).get("next", {}).get("after")
+        if after is None:
+            return records
+
+def search_total(url, access_token, filters):
+    """Devuelve sólo el `total` de una búsqueda (limit 1). Lanza si falla."""
+    payload = {"filterGroups": [{"filters": filters}], "limit": 1}
+    response = post_json(url, access_token, payload)
+    response.raise_for_status()
+    return response.json().get("total", 0)
+
+# --- PARTICIONADO ADAPTATIVO POR FECHAS ---
+def partition_window(url, access_token, build_filters, window, cap=SEARCH_RESULT_CAP):
+    """
+    Divide recursivamente [inicio, fin) por la mitad hasta que el `total` de
+    cada subventana cabe bajo el tope de /search. Las dos mitades se cuentan
+    en paralelo. Devuelve la lista ordenada de subventanas.
+    """
+    start_ms, end_ms = window
+    total = search_total(url, access_token, build_filters(start_ms, end_ms))
+    if total <= cap:
+        return [window]
+    if end_ms - start_ms <= 1:
+        raise RuntimeError(f"Más de {cap} resultados en un único milisegundo ({start_ms}); no se puede partir.")
+    middle_ms = start_ms + (end_ms - start_ms) // 2
+    halves = run_parallel(
+        lambda half: partition_window(url, access_token, build_filters, half, cap),
+        [(start_ms, middle_ms), (middle_ms, end_ms)]
+    )
+    return halves[0] + halves[1]
+
+def search_all_partitioned(url, access_token, build_filters, window, properties, store=None):
+    """
+    Como search_all_pages pero sin el tope de 10.000: parte la ventana con
+    partition_window, descarga las subventanas en paralelo y une sin duplicados
+    (por id, por si un registro cambia de fecha entre peticiones).
+    Con `store` (un RecordStore), las páginas se vuelcan en él según llegan y
+    se devuelve el propio store en lugar de la lista de registros.
+    """
+    subwindows = partition_window(url, access_token, build_filters, window)
+    if len(subwindows) > 1:
+        print(f"   (ventana dividida en {len(subwindows)} tramos para no superar {SEARCH_RESULT_CAP} resultados)")
+    if store is not None:
+        run_parallel(
+            lambda subwindow: search_all_pages(
+                url, access_token, build_filters(*subwindow), properties, on_page=store.add_page
+            ),
+            subwindows
+        )
+        store.deduplicate()
+        return store
+    pages = run_parallel(
+        lambda subwindow: search_all_pages(url, access_token, build_filters(*subwindow), properties),
+        subwindows
+    )
+    merged = {}
+    for records in pages:
+        for record in records:
+            merged[record["id"]] = record
+    return list(merged.values())
+
+# --- EJECUCIÓN EN PARALELO ---
+def run_parallel(func, items):
+    """
+    Ejecuta `func(item)` para cada elemento en paralelo.
+    Devuelve los resultados en el MISMO orden que `items`.
+    """
+    items = list(items)
+    if not items:
+        return []
+    # Cada tarea hereda el contexto del llamante (p. ej. el span de metrics.py)
+    contexts = [contextvars.copy_context() for _ in items]
+    # Los hilos sólo esperan la red; el límite real lo marca el semáforo de post_json.
+    # El pool se acota porque las llamadas se anidan (meses x búsquedas x particiones)
+    pool_size = min(len(items), max(get_max_workers() * 4, 32))
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
+        return list(executor.map(lambda ctx, item: ctx.run(func, item), contexts, items))
+
+def run_tasks(tasks):
+    """
+    Ejecuta un diccionario {nombre: función_sin_argumentos} en paralelo.
+    Devuelve {nombre: resultado} conservando el orden de las claves.
+    """
+    names = list(tasks.keys())
+    results = run_parallel(lambda name: tasks[name](), names)
+    return dict(zip(names, results))
@@ -3,28 +3,78 @@
 import os
 import pprint
 import csv
+import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 from pathlib import Path
 from contacts import (
-    get_total_new_leads, 
-    get_leads_by_country, 
-    get_leads_by_traffic_source,
-    get_last_month_dates # <--- Importamos si es necesario, pero ya está en deals.py
+    get_last_month_dates,
+    get_month_windows,
+    fetch_contact_records
 )
-from deals import ( 
-    get_engagements_per_pipeline,
-    get_engagements_breakdown_by_property
+from deals import fetch_deal_records
+from aggregate import aggregate_contacts, aggregate_deals
+import attribution
+import cache
+import checkpoint
+import mirror
+import metrics
+import google_sheets
+import history
+from planner import (
+    load_spec,
+    build_plan,
+    explain,
+    execute_plan,
+    assemble_results,
+    missing_targets,
+    row_value,
+    contact_properties,
+    deal_properties
 )
+from hubspot_client import (
+    set_max_workers,
+    set_rate_limit,
+    run_tasks,
+    run_parallel,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_SEARCH_RATE
+)
+
+# --- MAPAS DE DATOS (desde el spec declarativo src/metrics_spec.json) ---
+METRICS_SPEC = load_spec()
+
+# 1. Leads por País: {"property", "map": {país: token}} ("Wealth" -> token "WEALTH")
+COUNTRIES_TO_CHECK = METRICS_SPEC["countries"]
+
+# 2. Leads por Fuente (SÓLO valores ATÓMICOS de la API; los manuales van como MANUAL_SKIP)
+LEAD_SOURCES = METRICS_SPEC["lead_sources"]
+LEAD_SOURCES_MAP = LEAD_SOURCES["map"]
+
+# 3. Engagements (Deals) Configuración
+PIPELINE_MAP = METRICS_SPEC["pipelines"]
+PIPELINE_ID_LIST = list(PIPELINE_MAP.values()) 
+
+DEAL_BREAKDOWNS = METRICS_SPEC["deal_breakdowns"]
+
+# 4. Filas del reporte, en orden: texto fijo ("Manual") o suma de destinos del plan
+REPORT_ROWS = METRICS_SPEC["report"]
+
+# Grupos que la atribución necesita completos aunque ninguna fila los use
+ATTRIBUTION_GROUPS = ("lead_sources_raw",)
+
+# Propiedades que se descargan en los modos aggregate/mirror (las que agrupa el spec)
+CONTACT_PROPERTIES = contact_properties(METRICS_SPEC)
+DEAL_PROPERTIES = deal_properties(METRICS_SPEC)
 
 # --- FUNCIÓN FINAL DE EXPORTACIÓN ---
 # ... (write_final_report se mantiene igual) ...
-def write_final_report(data_to_write):
+def write_final_report(data_to_write, filename=None):
     """
     Crea el reporte CSV con toda la información consolidada en el orden exacto.
     """
     today_str = datetime.now().strftime("%Y-%m-%d")
-    filename = f"reporte_mensual_{today_str}.csv"
+    filename = filename or f"reporte_mensual_{today_str}.csv"
     
     print(f"\nEscribiendo reporte final en: {filename}")
     
@@ -45,165 +95,374 @@ def write_final_report(data_to_write):
     except Exception as e:
         print(f"Error al escribir el archivo CSV: {e}")
 
-# --- FUNCIÓN PRINCIPAL DE EJECUCIÓN ---
-def main():
-    print("Iniciando el script de automatización...")
-    
-    # --- A. CONFIGURACIÓN GENERAL ---
-    root_dir = Path(__file__).parent.parent
-    env_path = root_dir / ".env"
-    load_dotenv(dotenv_path=env_path)
-    HUBSPOT_ACCESS_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN")
-    
-    if not HUBSPOT_ACCESS_TOKEN:
-        raise ValueError("No se encontró HUBSPOT_ACCESS_TOKEN.")
-    
-    print("Token de HubSpot cargado con éxito.")
-    
-    # --- B. MAPAS DE DATOS (COMPLETOS) ---
-    # 1. Leads por País (Incluimos "Wealth" en la lista)
-    COUNTRIES_TO_CHECK = ["Spain", "Ireland", "Indonesia", "Australia", "Unknown", "Wealth"]
-    
-    # 2. Leads por Fuente (Usamos SÓLO los valores ATÓMICOS de la API, y marcamos los manuales)
-    LEAD_SOURCES_MAP = {
-        "Meta - Paid Social": "PAID_SOCIAL", 
-        "Google - Paid Search": "PAID_SEARCH", 
-        "Organic Search": "ORGANIC_SEARCH", 
-        "Organic Social": "ORGANIC_SOCIAL", 
-        "Direct Traffic": "DIRECT_TRAFFIC", 
-        "Email marketing": "EMAIL_MARKETING",
-        "Referrals": "REFERRALS", 
-        "AI Referrals": "AI_REFERRALS", 
-        "Family & friends": "FAMILY_AND_FRIENDS", 
-        "PR/Events/Organic (raw)": "PR_EVENTS_ORGANIC", # Usamos el valor atómico
-        "Partnerships": "PARTNERSHIPS", 
-        "App": "APP", 
-        "Ambassadors": "AMBASSADORS", 
-        "Outbound": "OUTBOUND_SALES", # Valor atómico
-        "B2C referrals": "B2C_REFERRALS",
-        # Estos se marcarán para saltar la consulta y se manejan en el reporte.
-        "C2C referrals (manual)": "MANUAL_SKIP", 
-        "Marketing Influencers (manual)": "MANUAL_SKIP", 
-    }
+def write_wide_report(reports_by_month, filename):
+    """
+    Crea un único CSV ancho: una fila por métrica y una columna por mes.
+    `reports_by_month` es {"YYYY-MM": final_report_data} (mismo orden de filas).
+    """
+    months = list(reports_by_month.keys())
+    rows = [report for report in reports_by_month.values()]
     
-    # ... (Mapeo de Deals se mantiene igual) ...
-    # 3. Engagements (Deals) Configuración
-    PIPELINE_MAP = {"[SP] Sales": "default", "[SP] Value Partners & Wealth": "188587965"}
-    PIPELINE_ID_LIST = list(PIPELINE_MAP.values()) 
+    print(f"\nEscribiendo reporte multi-mes en: {filename}")
     
-    DEAL_TYPE_PROP_NAME = "dealtype"
-    DEAL_TYPE_MAP = {
-        "New": "newbusiness", "New - Multi": "New - Multi", "Repeat": "existingbusiness", "Repeat - Multi": "Repeat - Multi"
-    }
+    try:
+        with open(filename, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(["MÉTRICA"] + months)
+            for i, (label, _) in enumerate(rows[0]):
+                writer.writerow([label] + [report[i][1] for report in rows])
+            
+        print(f"¡Éxito! Reporte guardado en {filename}")
+        print(f"Ruta completa: {Path.cwd() / filename}")
 
-    DEAL_SOURCE_PROP_NAME = "deal_source"
-    DEAL_SOURCE_MAP_RAW = {
-        "Family & Friends (raw)": "Direct Traffic", "Partnership (raw)": "B2C Referrals", "Ambassador": "Ambassador",
-        "Paid": "Paid", "Organic": "Organic", "Outbound Sales": "Outbound Sales", "App": "App", 
-        "Events": "Events", "Influencers and MKT Ambassadors": "Influencers and MKT Ambassadors",
-        "C2C Referrals (raw)": "C2C Referrals" 
-    }
+    except Exception as e:
+        print(f"Error al escribir el archivo CSV: {e}")
+
+def save_complete_to_history(reports_by_month, results_by_month):
+    """
+    Guarda en el histórico sólo los meses sin búsquedas fallidas: en el CSV un
+    fallo cuenta como 0, pero en el histórico parecería un valor real y
+    falsearía las tendencias. Esos meses se guardan cuando --resume los completa.
+    """
+    complete = {}
+    for month, report in reports_by_month.items():
+        missing = missing_targets(METRICS_SPEC, results_by_month[month])
+        if missing:
+            print(f"AVISO: {month} no se guarda en el histórico ({len(missing)} métricas sin dato por "
+                  f"búsquedas fallidas); se guardará al completarlo con --resume.")
+        else:
+            complete[month] = report
+    if complete:
+        save_to_history(complete)
+
+def save_to_history(reports_by_month):
+    """Guarda cada mes en el histórico de reportes sin romper la ejecución si falla."""
+    run_ts = datetime.now().isoformat(timespec="seconds")
+    try:
+        for month, report in reports_by_month.items():
+            history.append_run(report, month, run_ts=run_ts)
+        print(f"Histórico actualizado ({', '.join(reports_by_month)}).")
+    except Exception as e:
+        print(f"Error al guardar en el histórico: {e}")
+
+def write_attribution_report(rows, filename):
+    """CSV de atribución: engagements y conversión por canal del lead."""
+    print(f"\nEscribiendo atribución por canal en: {filename}")
+    try:
+        with open(filename, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(["CANAL DEL LEAD", "LEADS", "ENGAGEMENTS", "CONVERSIÓN"])
+            writer.writerows(rows)
+        print(f"¡Éxito! Atribución guardada en {filename}")
+    except Exception as e:
+        print(f"Error al escribir el archivo CSV: {e}")
+
+def run_attribution(access_token, results_by_month, date_range):
+    """Atribuye los engagements de la ventana y escribe un CSV por mes (sin romper la ejecución)."""
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    try:
+        deals_by_month = attribution.collect_attribution(
+            access_token, PIPELINE_ID_LIST, date_range, LEAD_SOURCES["property"]
+        )
+    except Exception as e:
+        print(f"Error al calcular la atribución: {e}")
+        return
+    for month, results in results_by_month.items():
+        rows = attribution.build_attribution_report(
+            deals_by_month.get(month, {}), results["lead_sources_raw"], LEAD_SOURCES_MAP
+        )
+        write_attribution_report(rows, f"reporte_atribucion_{month}_{today_str}.csv")
+
+def export_to_sheet(grid, spreadsheet_id, sheet_name):
+    """Exporta la rejilla a Google Sheets sin romper la ejecución si falla."""
+    try:
+        google_sheets.export_grid(grid, spreadsheet_id, sheet_name)
+    except Exception as e:
+        print(f"Error al exportar a Google Sheets: {e}")
+
+# --- C. EJECUCIÓN DE LLAMADAS A LA API ---
+def collect_search_results(access_token, date_range=None, groups=()):
+    """
+    Modo 'search': una búsqueda de conteo (limit 1) por cada búsqueda DISTINTA
+    del plan. Todas se lanzan a la vez y comparten la sesión HTTP y el límite
+    de concurrencia (--workers). Sólo se consultan los destinos que usa el
+    reporte, más los grupos completos de `groups`.
+    """
+    plan = build_plan(METRICS_SPEC, groups)
+    counts = execute_plan(access_token, plan, date_range)
+    return assemble_results(METRICS_SPEC, plan, counts)
+
+def collect_aggregate_results(access_token, date_range=None):
+    """
+    Modo 'aggregate': descarga una sola vez los contactos del mes y los deals
+    cerrados/ganados (sólo las propiedades necesarias) y calcula todos los
+    desgloses localmente. Nº de peticiones = registros / tamaño de página.
+    """
+    records = run_tasks({
+        "contacts": lambda: fetch_contact_records(access_token, date_range, CONTACT_PROPERTIES),
+        "deals": lambda: fetch_deal_records(access_token, PIPELINE_ID_LIST, date_range, DEAL_PROPERTIES),
+    })
+    return aggregate_records(records["contacts"], records["deals"])
+
+def collect_mirror_results(access_token, date_range=None, sync=True):
+    """
+    Modo 'mirror': sincroniza el espejo local (sólo lo modificado desde la
+    última vez) y calcula el reporte de la ventana leyendo de SQLite.
+    """
+    conn = mirror.connect()
+    if sync:
+        mirror.sync(access_token, conn, METRICS_SPEC)
+    start_date_ms, end_date_ms = date_range or get_last_month_dates()
+    return aggregate_records(
+        mirror.load_contact_records(conn, start_date_ms, end_date_ms),
+        mirror.load_deal_records(conn, PIPELINE_ID_LIST, start_date_ms, end_date_ms),
+    )
+
+def aggregate_records(contact_records, deal_records):
+    """Convierte registros (de la API o del espejo) en los conteos crudos del reporte."""
+    total_leads, country_leads, lead_sources_raw = aggregate_contacts(
+        contact_records, COUNTRIES_TO_CHECK, LEAD_SOURCES
+    )
+    pipeline_totals, breakdowns = aggregate_deals(deal_records, PIPELINE_MAP, {
+        group: (breakdown["property"], breakdown["map"]) for group, breakdown in DEAL_BREAKDOWNS.items()
+    })
     
-    TRAFFIC_SOURCE_PROP_NAME = "hs_analytics_source" 
-    TRAFFIC_SOURCE_MAP = {
-        "Meta": "PAID_SOCIAL", 
-        "Google": "PAID_SEARCH",
+    return {
+        "total_leads": total_leads,
+        "country_leads": country_leads,
+        "lead_sources_raw": lead_sources_raw,
+        "pipeline_totals": pipeline_totals,
+        **breakdowns,
     }
+
+def collect_results(access_token, mode, date_range=None, groups=()):
+    """Conteos crudos de una ventana (por defecto el mes pasado) en el modo indicado."""
+    if mode == "aggregate":
+        return collect_aggregate_results(access_token, date_range)
+    if mode == "mirror":
+        return collect_mirror_results(access_token, date_range)
+    return collect_search_results(access_token, date_range, groups)
+
+# --- C'. BACKFILL MULTI-MES ---
+def collect_backfill_results(access_token, mode, windows, groups=()):
+    """
+    Calcula los conteos crudos de varios meses. Devuelve {"YYYY-MM": results}.
+    - search: cada mes es un plan completo; todos los meses se lanzan en paralelo
+      y comparten el mismo token bucket (un único presupuesto de cuota).
+    - aggregate: UNA descarga paginada para todo el rango, repartida por mes en local.
+    - mirror: una sola sincronización y una lectura local por mes.
+    """
+    months = [month for month, _ in windows]
     
-    # --- C. EJECUCIÓN DE LLAMADAS A LA API ---
+    if mode == "aggregate":
+        full_range = (windows[0][1][0], windows[-1][1][1])
+        records = run_tasks({
+            "contacts": lambda: fetch_contact_records(access_token, full_range, CONTACT_PROPERTIES),
+            "deals": lambda: fetch_deal_records(access_token, PIPELINE_ID_LIST, full_range, DEAL_PROPERTIES),
+        })
+        # Los almacenes ya guardan createdate/closedate como 'YYYY-MM'
+        contacts_by_month = records["contacts"].split_by("createdate")
+        deals_by_month = records["deals"].split_by("closedate")
+        return {
+            month: aggregate_records(contacts_by_month.get(month, []), deals_by_month.get(month, []))
+            for month in months
+        }
     
-    # CONTACTS
-    total_leads = get_total_new_leads(HUBSPOT_ACCESS_TOKEN)
-    country_leads = get_leads_by_country(HUBSPOT_ACCESS_TOKEN, COUNTRIES_TO_CHECK)
-    lead_sources_raw = get_leads_by_traffic_source(HUBSPOT_ACCESS_TOKEN, LEAD_SOURCES_MAP)
+    if mode == "mirror":
+        mirror.sync(access_token, mirror.connect(), METRICS_SPEC)
+        return {
+            month: collect_mirror_results(access_token, date_range, sync=False)
+            for month, date_range in windows
+        }
     
-    # DEALS
-    pipeline_totals = get_engagements_per_pipeline(HUBSPOT_ACCESS_TOKEN, PIPELINE_MAP)
-    total_engagements = sum(v for v in pipeline_totals.values() if v is not None)
-    deal_source_raw = get_engagements_breakdown_by_property(HUBSPOT_ACCESS_TOKEN, PIPELINE_ID_LIST, DEAL_SOURCE_PROP_NAME, DEAL_SOURCE_MAP_RAW)
-    deal_type_data = get_engagements_breakdown_by_property(HUBSPOT_ACCESS_TOKEN, PIPELINE_ID_LIST, DEAL_TYPE_PROP_NAME, DEAL_TYPE_MAP)
-    traffic_source_deals = get_engagements_breakdown_by_property(HUBSPOT_ACCESS_TOKEN, PIPELINE_ID_LIST, TRAFFIC_SOURCE_PROP_NAME, TRAFFIC_SOURCE_MAP)
+    results = run_parallel(
+        lambda window: collect_search_results(access_token, window[1], groups), windows
+    )
+    return dict(zip(months, results))
 
-    # --- D. PROCESAMIENTO Y AGRUPACIÓN DE RESULTADOS ---
+# --- D/E. CONSTRUCCIÓN DEL REPORTE ---
+def build_report(results):
+    """
+    Construye la lista ordenada (MÉTRICA, VALOR) del reporte final a partir
+    de los conteos crudos (mismo formato en todos los modos). Las filas y
+    las sumas de cada una (p. ej. Paid online = Meta + Google) vienen de la
+    sección "report" del spec.
+    """
     print("\nProcesando y agrupando resultados finales...")
+    return [(row["label"], row_value(row, results)) for row in REPORT_ROWS]
 
-    def get_count(data, key):
-        # Si el valor es "MANUAL_SKIP" o None, devuelve 0
-        value = data.get(key, 0)
-        return 0 if value == "MANUAL_SKIP" or value is None else value
-
-    # 1. AGRUPACIÓN DE FUENTES DE LEADS (CONTACTOS)
-    
-    # Corregido: Sumamos Meta y Google que son valores atómicos consultados
-    paid_online_mkt_leads = get_count(lead_sources_raw, "Meta - Paid Social") + get_count(lead_sources_raw, "Google - Paid Search")
-    
-    # PR / Events / Organic: usamos el valor atómico consultado
-    pr_events_organic_leads = get_count(lead_sources_raw, "PR/Events/Organic (raw)")
-    
-    # C2C: es manual, no se calcula
-    c2c_referrals_leads = "Manual" 
-    
-    # Marketing Influencers: es manual, no se calcula
-    marketing_influencers_leads = "Manual" 
-
-    # 2. AGRUPACIÓN DE FUENTES DE ENGAGEMENTS (DEALS)
-    meta_deals = get_count(traffic_source_deals, "Meta")
-    google_deals = get_count(traffic_source_deals, "Google")
-    paid_online_mkt_deals = meta_deals + google_deals 
-    
-    pr_events_organic_deals = get_count(deal_source_raw, "Organic") + get_count(deal_source_raw, "Events")
-    
-    # --- E. CONSTRUCCIÓN DEL REPORTE ORDENADO ---
-    final_report_data = [
-        # --- 1. SECCIÓN LEADS ---
-        ("--- 2LEADS - SPLIT PER CHANNEL ---", ""),
-        ("# of new leads", total_leads),
-        ("Target", "Manual"), # Se deja Manual según tu solicitud
-        ("Paid online Marketing", paid_online_mkt_leads),
-        ("Meta - Paid Social", get_count(lead_sources_raw, "Meta - Paid Social")),
-        ("Google - Paid Search", get_count(lead_sources_raw, "Google - Paid Search")),
-        ("C2C referrals", c2c_referrals_leads), # Valor Manual
-        ("Family & friends", get_count(lead_sources_raw, "Family & friends")),
-        ("PR /Events / Organic", pr_events_organic_leads),
-        ("Marketing Influencers", marketing_influencers_leads), # Valor Manual
-        ("Partnerships", get_count(lead_sources_raw, "Partnerships")),
-        ("App", get_count(lead_sources_raw, "App")),
-        ("Ambassadors", get_count(lead_sources_raw, "Ambassadors")),
-        ("Outbound", get_count(lead_sources_raw, "Outbound")),
-        ("B2C referrals", get_count(lead_sources_raw, "B2C referrals")),
-        ("Indonesia", get_count(country_leads, "Indonesia")),
-        ("Ireland", get_count(country_leads, "Ireland")),
-        ("Wealth", get_count(country_leads, "Wealth")), 
-        
-        # --- 2. SECCIÓN ENGAGEMENTS ---
-        ("", ""), 
-        ("--- 5ENGAGEMENTS - SPLIT PER CHANNEL ---", ""),
-        ("# of new Engagements", total_engagements),
-        ("Deal Source (Closers + PC + Wealth)", total_engagements), 
-        ("Paid Online Marketing", paid_online_mkt_deals),
-        ("Meta", meta_deals), 
-        ("Google", google_deals), 
-        ("C2C", get_count(deal_source_raw, "C2C Referrals (raw)")), 
-        ("Family and Friends", get_count(deal_source_raw, "Family & Friends (raw)")),
-        ("PR / Events / Organic", pr_events_organic_deals),
-        ("Marketing Influencers", get_count(deal_source_raw, "Influencers and MKT Ambassadors")), 
-        ("Partnerships", get_count(deal_source_raw, "Partnership (raw)")),
-        ("App", get_count(deal_source_raw, "App")),
-        ("Ambassador", get_count(deal_source_raw, "Ambassador")),
-        ("Outbound Sales", get_count(deal_source_raw, "Outbound Sales")),
-        ("B2B Referrals", get_count(deal_source_raw, "Partnership (raw)")), 
+# --- ARGUMENTOS DE LÍNEA DE COMANDOS ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Reporte mensual de HubSpot")
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.getenv("HUBSPOT_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+        help="Número máximo de búsquedas simultáneas contra HubSpot"
+    )
+    parser.add_argument(
+        "--rate", type=float,
+        default=float(os.getenv("HUBSPOT_SEARCH_RATE", DEFAULT_SEARCH_RATE)),
+        help="Cuota de búsquedas por segundo del portal (token bucket compartido)"
+    )
+    parser.add_argument(
+        "--mode", choices=["search", "aggregate", "mirror"], default="search",
+        help="'search': una búsqueda de conteo por fila; 'aggregate': descarga los registros una vez y cuenta en local; "
+             "'mirror': sincroniza el espejo local incremental y cuenta desde SQLite"
+    )
+    parser.add_argument(
+        "--refresh", action="store_true",
+        help="Ignora la caché en disco y vuelve a consultar HubSpot (los resultados nuevos sí se guardan)"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Desactiva por completo la caché en disco"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Modo search: reutiliza el checkpoint de la ejecución anterior y sólo repite "
+             "las búsquedas que fallaron o no llegaron a ejecutarse"
+    )
+    parser.add_argument(
+        "--from", dest="from_month", metavar="YYYY-MM",
+        help="Backfill: primer mes a calcular (requiere --to)"
+    )
+    parser.add_argument(
+        "--to", dest="to_month", metavar="YYYY-MM",
+        help="Backfill: último mes a calcular (incluido)"
+    )
+    parser.add_argument(
+        "--output", choices=["per-month", "wide"], default="per-month",
+        help="Backfill: un CSV por mes o un único CSV con una columna por mes"
+    )
+    parser.add_argument(
+        "--attribution", action="store_true",
+        help="Atribuye los deals cerrados/ganados al canal de su contacto (asociaciones batch) "
+             "y escribe engagements y conversión por canal de lead"
+    )
+    parser.add_argument(
+        "--sheet", default=os.getenv("GOOGLE_SHEET_ID"), metavar="SPREADSHEET_ID",
+        help="Exporta también el reporte a esta hoja de Google Sheets (un solo batchUpdate con los cambios)"
+    )
+    parser.add_argument(
+        "--sheet-tab", default=os.getenv("GOOGLE_SHEET_TAB", "Reporte"),
+        help="Pestaña de la hoja donde escribir el reporte"
+    )
+    parser.add_argument(
+        "--metrics", nargs="?", const="", default=None, metavar="TRAZA.jsonl",
+        help="Registra cada búsqueda (latencia, bytes, reintentos, caché, estado HTTP), "
+             "imprime un resumen y guarda la traza en JSON lines"
+    )
+    parser.add_argument(
+        "--explain", action="store_true",
+        help="Muestra el plan de búsquedas y su coste de cuota, sin ejecutar nada"
+    )
+    args = parser.parse_args(argv)
+    if bool(args.from_month) != bool(args.to_month):
+        parser.error("--from y --to se usan juntos.")
+    if args.resume and args.mode != "search":
+        parser.error("--resume sólo aplica al modo search (el modo mirror ya es incremental).")
+    return args
+
+# --- EJECUCIÓN DEL REPORTE (un mes o backfill) ---
+def run_report(args, access_token):
+    # La atribución necesita todas las fuentes de leads, aunque el reporte no las use
+    groups = ATTRIBUTION_GROUPS if args.attribution else ()
+    if args.mode == "search":
+        restored = checkpoint.start(resume=args.resume)
+        if args.resume:
+            print(f"Reanudando: {restored} búsquedas recuperadas del checkpoint.")
+    
+    # --- BACKFILL MULTI-MES (--from / --to) ---
+    if args.from_month:
+        windows = get_month_windows(args.from_month, args.to_month)
+        print(f"Backfill de {len(windows)} meses ({args.from_month} a {args.to_month}) en modo {args.mode}...")
+        results_by_month = collect_backfill_results(access_token, args.mode, windows, groups)
+        reports_by_month = {month: build_report(results) for month, results in results_by_month.items()}
         
-        # --- 3. SECCIÓN DEAL TYPE ---
-        ("", ""), 
-        ("--- 6Deal Type ---", ""),
-        ("New", get_count(deal_type_data, "New")),
-        ("New Multi", get_count(deal_type_data, "New - Multi")),
-        ("Repeat", get_count(deal_type_data, "Repeat")),
-        ("Repeat Multi", get_count(deal_type_data, "Repeat - Multi")),
-    ]
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        if args.output == "wide":
+            write_wide_report(
+                reports_by_month,
+                f"reporte_mensual_{args.from_month}_a_{args.to_month}_{today_str}.csv"
+            )
+        else:
+            for month, report in reports_by_month.items():
+                write_final_report(report, f"reporte_mensual_{month}_{today_str}.csv")
+        save_complete_to_history(reports_by_month, results_by_month)
+        if args.sheet:
+            export_to_sheet(google_sheets.wide_report_to_grid(reports_by_month), args.sheet, args.sheet_tab)
+        if args.attribution:
+            run_attribution(access_token, results_by_month, (windows[0][1][0], windows[-1][1][1]))
+        close_checkpoint()
+        return
+    
+    # --- C. EJECUCIÓN DE LLAMADAS A LA API ---
+    results = collect_results(access_token, args.mode, groups=groups)
+    
+    # --- D/E. PROCESAMIENTO Y CONSTRUCCIÓN DEL REPORTE ---
+    final_report_data = build_report(results)
 
     # --- F. EXPORTACIÓN FINAL ---
     write_final_report(final_report_data)
+    month = history.report_month_for(datetime.now())
+    save_complete_to_history({month: final_report_data}, {month: results})
+    if args.sheet:
+        export_to_sheet(google_sheets.report_to_grid(final_report_data), args.sheet, args.sheet_tab)
+    if args.attribution:
+        run_attribution(
+            access_token, {history.report_month_for(datetime.now()): results}, get_last_month_dates()
+        )
+    close_checkpoint()
+
+def close_checkpoint():
+    """Borra el checkpoint si todo fue bien; si no, avisa de cómo reanudar."""
+    if not checkpoint.is_active():
+        return
+    failed = checkpoint.failed()
+    if failed:
+        print(f"\nAVISO: {len(failed)} búsquedas fallaron y cuentan como 0 en el reporte. "
+              f"Ejecuta de nuevo con --resume para repetir sólo esas búsquedas.")
+    else:
+        checkpoint.finish()
+
+# --- FUNCIÓN PRINCIPAL DE EJECUCIÓN ---
+def load_access_token():
+    """Lee HUBSPOT_ACCESS_TOKEN del .env del proyecto (o del entorno)."""
+    root_dir = Path(__file__).parent.parent
+    env_path = root_dir / ".env"
+    load_dotenv(dotenv_path=env_path)
+    access_token = os.getenv("HUBSPOT_ACCESS_TOKEN")
+    
+    if not access_token:
+        raise ValueError("No se encontró HUBSPOT_ACCESS_TOKEN.")
+    
+    print("Token de HubSpot cargado con éxito.")
+    return access_token
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    if args.explain:
+        explain(build_plan(METRICS_SPEC, ATTRIBUTION_GROUPS if args.attribution else ()), rate=args.rate)
+        return
+    
+    print("Iniciando el script de automatización...")
+    
+    # --- A. CONFIGURACIÓN GENERAL ---
+    HUBSPOT_ACCESS_TOKEN = load_access_token()
+    set_max_workers(args.workers)
+    set_rate_limit(args.rate)
+    cache.configure(enabled=not args.no_cache, refresh=args.refresh)
+    
+    if args.metrics is not None:
+        metrics.enable()
+    try:
+        run_report(args, HUBSPOT_ACCESS_TOKEN)
+    finally:
+        if args.metrics is not None:
+            metrics.print_summary()
+            trace_path = args.metrics or f"metrics_trace_{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.jsonl"
+            metrics.write_trace(trace_path)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
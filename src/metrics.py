@@ -0,0 +1,136 @@
+# src/metrics.py (Instrumentación: trazas por búsqueda y resumen de la ejecución)
+
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import hubspot_client
+
+# Span activo del hilo/contexto actual (run_parallel propaga el contexto)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_enabled = False
+_trace_id = None
+_spans = []
+_lock = threading.Lock()
+
+# --- ACTIVACIÓN ---
+def enable():
+    """Empieza a registrar spans y cada intento HTTP de post_json."""
+    global _enabled, _trace_id
+    with _lock:
+        if _enabled:
+            return
+        _enabled = True
+        _trace_id = uuid.uuid4().hex
+        _spans.clear()
+    hubspot_client.add_request_observer(_record_http)
+
+def disable():
+    global _enabled
+    _enabled = False
+    hubspot_client.remove_request_observer(_record_http)
+
+def is_enabled():
+    return _enabled
+
+# --- SPANS ---
+@contextmanager
+def span(name, **attributes):
+    """
+    Delimita una búsqueda lógica (p. ej. una métrica del plan). Dentro del
+    bloque, los intentos HTTP y el uso de caché se anotan en este span.
+    """
+    if not _enabled:
+        yield None
+        return
+    record = {
+        "trace_id": _trace_id,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_span_id": (_current_span.get() or {}).get("span_id"),
+        "name": name,
+        "start_time_unix_nano": time.time_ns(),
+        "filters_hash": None,
+        "http_status": None,
+        "http_requests": 0,
+        "retries": 0,
+        "response_bytes": 0,
+        "http_latency_ms": 0.0,
+        "cache": None,
+        **attributes,
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        record["end_time_unix_nano"] = time.time_ns()
+        _current_span.reset(token)
+        with _lock:
+            _spans.append(record)
+
+def annotate(**attributes):
+    """Añade atributos al span activo (si lo hay)."""
+    record = _current_span.get()
+    if record is not None:
+        with _lock:
+            record.update(attributes)
+
+def record_cache(hit):
+    annotate(cache="hit" if hit else "miss")
+
+def _record_http(event):
+    """Observador de hubspot_client: suma cada intento HTTP al span activo."""
+    record = _current_span.get()
+    if record is None:
+        return
+    with _lock:
+        record["http_requests"] += 1
+        record["retries"] += 1 if event["attempt"] > 0 else 0
+        record["response_bytes"] += event["response_bytes"]
+        record["http_latency_ms"] = round(record["http_latency_ms"] + event["latency_s"] * 1000, 3)
+        record["http_status"] = event["status"]
+
+# --- SALIDA ---
+def write_trace(path):
+    """Escribe un span por línea (JSON lines)."""
+    with _lock:
+        spans = list(_spans)
+    with open(path, "w", encoding="utf-8") as file:
+        for record in spans:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"Traza de métricas guardada en: {path} ({len(spans)} spans)")
+
+def summary(top=10):
+    """Resumen agregado de la ejecución (dict)."""
+    with _lock:
+        spans = list(_spans)
+    leaves = [s for s in spans if s["http_requests"] or s["cache"]]
+    return {
+        "spans": len(spans),
+        "http_requests": sum(s["http_requests"] for s in spans),
+        "retries": sum(s["retries"] for s in spans),
+        "response_bytes": sum(s["response_bytes"] for s in spans),
+        "cache_hits": sum(1 for s in leaves if s["cache"] == "hit"),
+        "cache_misses": sum(1 for s in leaves if s["cache"] == "miss"),
+        "errors": sum(1 for s in spans if s["http_status"] is not None and s["http_status"] >= 400),
+        "slowest": [
+            {"name": s["name"], "duration_ms": s["duration_ms"], "http_requests": s["http_requests"]}
+            for s in sorted(leaves, key=lambda s: s["duration_ms"], reverse=True)[:top]
+        ],
+    }
+
+def print_summary():
+    data = summary()
+    print("\n--- MÉTRICAS DE LA EJECUCIÓN ---")
+    print(f"Búsquedas (spans): {data['spans']} | Peticiones HTTP: {data['http_requests']} "
+          f"| Reintentos: {data['retries']} | Errores: {data['errors']}")
+    print(f"Caché: {data['cache_hits']} aciertos / {data['cache_misses']} fallos "
+          f"| Bytes recibidos: {data['response_bytes']}")
+    print("Búsquedas más lentas:")
+    for item in data["slowest"]:
+        print(f"  - {item['name']}: {item['duration_ms']:.0f} ms ({item['http_requests']} peticiones)")
@@ -0,0 +1,326 @@
+# src/mirror.py (Espejo local incremental de contactos y deals en SQLite)
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from contacts import API_ENDPOINT
+from deals import DEALS_API_ENDPOINT
+from planner import load_spec, contact_properties, deal_properties
+from hubspot_client import HUBSPOT_API_BASE, get_json, post_json, SEARCH_PAGE_SIZE, SEARCH_RESULT_CAP
+import metrics
+
+DEFAULT_MIRROR_PATH = Path(__file__).parent.parent / ".hubspot_mirror.sqlite"
+
+# Propiedad de "última modificación" de cada objeto (no se llaman igual)
+MODIFIED_PROPERTY = {
+    "contacts": "lastmodifieddate",
+    "deals": "hs_lastmodifieddate",
+}
+
+# Margen hacia atrás al retomar desde la marca de agua: un registro puede llegar
+# al índice de búsqueda minutos después de su `lastmodifieddate`
+SYNC_OVERLAP_MS = 10 * 60 * 1000
+
+# Propiedad con los ids absorbidos en una fusión (esos registros ya no existen)
+MERGED_IDS_PROPERTY = "hs_merged_object_ids"
+
+# Páginas del listado de objetos (GET), que no es /search
+LIST_PAGE_SIZE = 100
+
+# El listado `archived=true` no se puede filtrar ni ordenar por archivedAt, así que
+# recorrerlo cuesta tanto como el archivo entero: sólo se hace si el espejo tiene
+# más registros que HubSpot (hay borrados pendientes) o si el último pase es más
+# antiguo que este intervalo (red de seguridad para borrados que el total no delata)
+ARCHIVED_SCAN_INTERVAL_MS = int(os.getenv("HUBSPOT_ARCHIVED_SCAN_HOURS", 24)) * 60 * 60 * 1000
+
+_mirror_path = Path(os.getenv("HUBSPOT_MIRROR_PATH", DEFAULT_MIRROR_PATH))
+_lock = threading.Lock()
+
+# --- AYUDAS ---
+def _to_ms(value):
+    """HubSpot devuelve fechas ISO ('2025-10-01T10:00:00.000Z') o epoch en ms."""
+    if value in (None, ""):
+        return None
+    if str(value).isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000)
+
+def connect(path=None):
+    """
+    Abre (y si hace falta crea) la base de datos del espejo. Las columnas fijas
+    son las de los filtros; las propiedades de los desgloses (las que pida el
+    spec) se guardan como JSON en `properties`.
+    """
+    conn = sqlite3.connect(str(path or _mirror_path), check_same_thread=False)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(sync_state)")]
+    if columns and "properties" not in columns:
+        # Espejo con el esquema antiguo (columnas fijas): se rehace con un backfill
+        print("Espejo con esquema antiguo: se vacía y se hará un backfill completo.")
+        conn.executescript("DROP TABLE IF EXISTS contacts; DROP TABLE IF EXISTS deals; DROP TABLE sync_state;")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS contacts (
+            id TEXT PRIMARY KEY,
+            createdate INTEGER,
+            lastmodified INTEGER,
+            properties TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_contacts_createdate ON contacts (createdate);
+
+        CREATE TABLE IF NOT EXISTS deals (
+            id TEXT PRIMARY KEY,
+            closedate INTEGER,
+            lastmodified INTEGER,
+            hs_is_closed_won TEXT,
+            pipeline TEXT,
+            properties TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_deals_closedate ON deals (closedate);
+
+        CREATE TABLE IF NOT EXISTS sync_state (
+            object_type TEXT PRIMARY KEY,
+            high_water_ms INTEGER NOT NULL,
+            synced_at TEXT NOT NULL,
+            properties TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS archived_scans (
+            object_type TEXT PRIMARY KEY,
+            scanned_at_ms INTEGER NOT NULL
+        );
+    """)
+    return conn
+
+def get_sync_state(conn, object_type):
+    """(marca de agua, propiedades guardadas hasta ella). (0, []) si nunca se sincronizó."""
+    row = conn.execute(
+        "SELECT high_water_ms, properties FROM sync_state WHERE object_type = ?", (object_type,)
+    ).fetchone()
+    return (row[0], json.loads(row[1])) if row else (0, [])
+
+def get_high_water(conn, object_type):
+    return get_sync_state(conn, object_type)[0]
+
+# --- SINCRONIZACIÓN ---
+def _fetch_modified_since(access_token, object_type, since_ms, properties):
+    """
+    Descarga (ordenado por fecha de modificación ascendente) todo lo modificado
+    desde `since_ms`. Al llegar al tope de 10.000 resultados se reinicia la
+    búsqueda desde la última fecha vista, así que no hay límite de volumen.
+    Devuelve un generador de páginas de registros.
+    """
+    url = API_ENDPOINT if object_type == "contacts" else DEALS_API_ENDPOINT
+    modified_property = MODIFIED_PROPERTY[object_type]
+    cursor_ms = since_ms
+    while True:
+        after = None
+        seen = 0
+        last_modified_ms = None
+        while True:
+            payload = {
+                "filterGroups": [{"filters": [
+                    {"propertyName": modified_property, "operator": "GTE", "value": cursor_ms}
+                ]}],
+                "sorts": [{"propertyName": modified_property, "direction": "ASCENDING"}],
+                "properties": properties + [modified_property],
+                "limit": SEARCH_PAGE_SIZE
+            }
+            if after is not None:
+                payload["after"] = after
+            response = post_json(url, access_token, payload)
+            response.raise_for_status()
+            data = response.json()
+            page = data.get("results", [])
+            if page:
+                yield page
+                seen += len(page)
+                last_modified_ms = _to_ms(page[-1]["properties"].get(modified_property))
+            after = data.get("paging", {}).get("next", {}).get("after")
+            # En el tope HubSpot deja de dar `after` aunque queden resultados (total > vistos)
+            if seen + SEARCH_PAGE_SIZE > SEARCH_RESULT_CAP and data.get("total", 0) > seen:
+                break
+            if after is None:
+                return
+        if last_modified_ms is None or last_modified_ms <= cursor_ms:
+            # Más de 10.000 registros con la misma fecha exacta: no podemos avanzar
+            raise RuntimeError(f"No se puede avanzar el cursor de {object_type} más allá de {cursor_ms}.")
+        # Reiniciamos desde la última fecha vista (GTE: los repetidos se sobreescriben)
+        cursor_ms = last_modified_ms
+
+def _contact_row(record, properties):
+    p = record.get("properties", {})
+    return (
+        record["id"],
+        _to_ms(p.get("createdate")),
+        _to_ms(p.get(MODIFIED_PROPERTY["contacts"])),
+        json.dumps({name: p.get(name) for name in properties}),
+    )
+
+def _deal_row(record, properties):
+    p = record.get("properties", {})
+    return (
+        record["id"],
+        _to_ms(p.get("closedate")),
+        _to_ms(p.get(MODIFIED_PROPERTY["deals"])),
+        p.get("hs_is_closed_won"),
+        p.get("pipeline"),
+        json.dumps({name: p.get(name) for name in properties}),
+    )
+
+# Columnas fijas que se piden siempre (además de las del spec)
+_OBJECTS = {
+    "contacts": (["createdate"], _contact_row, "INSERT OR REPLACE INTO contacts VALUES (?, ?, ?, ?)"),
+    "deals": (["closedate", "hs_is_closed_won", "pipeline"], _deal_row,
+              "INSERT OR REPLACE INTO deals VALUES (?, ?, ?, ?, ?, ?)"),
+}
+
+def sync(access_token, conn=None, spec=None):
+    """
+    Sincroniza el espejo: la primera vez descarga todo (backfill) y después
+    sólo lo modificado desde la marca de agua guardada. Se guardan las
+    propiedades que pide el spec; si pide alguna que el espejo aún no tiene,
+    se repite el backfill de ese objeto. Devuelve {tipo_objeto: nº de registros actualizados}.
+    """
+    conn = conn or connect()
+    spec = spec or load_spec()
+    wanted = {"contacts": contact_properties(spec), "deals": deal_properties(spec)}
+    updated = {}
+    for object_type, (fixed, row_builder, insert_sql) in _OBJECTS.items():
+        high_water, stored = get_sync_state(conn, object_type)
+        missing = [name for name in wanted[object_type] if name not in stored]
+        if high_water and missing:
+            print(f"El spec pide propiedades nuevas de {object_type} ({', '.join(missing)}): backfill completo.")
+            high_water = 0
+        properties = stored + missing
+        since_ms = max(0, high_water - SYNC_OVERLAP_MS) if high_water else 0
+        label = "backfill inicial" if high_water == 0 else f"cambios desde {since_ms}"
+        print(f"Sincronizando espejo de {object_type} ({label})...")
+        with metrics.span(f"mirror_sync:{object_type}", object=object_type, since_ms=since_ms):
+            count = _sync_object(
+                access_token, conn, object_type, since_ms, high_water,
+                properties, fixed + properties + [MERGED_IDS_PROPERTY], row_builder, insert_sql
+            )
+            local, remote = _local_total(conn, object_type), _remote_total(access_token, object_type)
+            removed = None
+            if local > remote or _archived_scan_due(conn, object_type):
+                removed = remove_archived(access_token, conn, object_type)
+                local -= removed
+        archived = "listado de archivados omitido" if removed is None else f"{removed} archivados eliminados"
+        print(f"   - {count} registros de {object_type} actualizados, {archived}")
+        _warn_if_mismatch(object_type, local, remote)
+        updated[object_type] = count
+    return updated
+
+def _sync_object(access_token, conn, object_type, since_ms, high_water, stored_properties, fetch_properties,
+                 row_builder, insert_sql):
+    """Descarga y guarda los cambios de un tipo de objeto. Devuelve cuántos registros."""
+    count = 0
+    for page in _fetch_modified_since(access_token, object_type, since_ms, list(dict.fromkeys(fetch_properties))):
+        rows = [row_builder(record, stored_properties) for record in page]
+        merged_ids = [
+            (merged_id,)
+            for record in page
+            for merged_id in (record["properties"].get(MERGED_IDS_PROPERTY) or "").split(";")
+            if merged_id.strip()
+        ]
+        with _lock:
+            conn.executemany(insert_sql, rows)
+            # Los registros absorbidos en una fusión desaparecen del espejo
+            conn.executemany(f"DELETE FROM {object_type} WHERE id = ?", merged_ids)
+            page_high_water = max((row[2] or 0) for row in rows)
+            high_water = max(high_water, page_high_water)
+            # La marca de agua se guarda con cada página: una sync cortada se retoma
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                (object_type, high_water, datetime.now().isoformat(), json.dumps(stored_properties))
+            )
+            conn.commit()
+        count += len(rows)
+    return count
+
+# --- BORRADOS ---
+def _archived_scan_due(conn, object_type):
+    row = conn.execute(
+        "SELECT scanned_at_ms FROM archived_scans WHERE object_type = ?", (object_type,)
+    ).fetchone()
+    now_ms = int(datetime.now().timestamp() * 1000)
+    return row is None or now_ms - row[0] >= ARCHIVED_SCAN_INTERVAL_MS
+
+def remove_archived(access_token, conn, object_type):
+    """
+    /search no devuelve registros archivados (borrados o fusionados), así que
+    se recorre el listado `archived=true` y se quitan del espejo. Los GET van
+    por el cubo de listados, no por el de /search. Devuelve cuántos se quitaron.
+    """
+    url = f"{HUBSPOT_API_BASE}/crm/v3/objects/{object_type}"
+    params = {"archived": "true", "limit": LIST_PAGE_SIZE, "properties": "hs_object_id"}
+    scanned_at_ms = int(datetime.now().timestamp() * 1000)
+    removed = 0
+    while True:
+        response = get_json(url, access_token, params)
+        response.raise_for_status()
+        data = response.json()
+        ids = [(record["id"],) for record in data.get("results", [])]
+        if ids:
+            with _lock:
+                removed += conn.executemany(f"DELETE FROM {object_type} WHERE id = ?", ids).rowcount
+                conn.commit()
+        after = data.get("paging", {}).get("next", {}).get("after")
+        if after is None:
+            break
+        params["after"] = after
+    # Sólo un pase completo cuenta para el intervalo
+    with _lock:
+        conn.execute("INSERT OR REPLACE INTO archived_scans VALUES (?, ?)", (object_type, scanned_at_ms))
+        conn.commit()
+    return removed
+
+def _local_total(conn, object_type):
+    return conn.execute(f"SELECT COUNT(*) FROM {object_type}").fetchone()[0]
+
+def _remote_total(access_token, object_type):
+    url = API_ENDPOINT if object_type == "contacts" else DEALS_API_ENDPOINT
+    response = post_json(url, access_token, {"limit": 1})
+    response.raise_for_status()
+    return response.json().get("total", 0)
+
+def _warn_if_mismatch(object_type, local, remote):
+    if local != remote:
+        print(f"   AVISO: el espejo tiene {local} {object_type} y HubSpot {remote}; "
+              f"borra {_mirror_path.name} para forzar un backfill si la diferencia persiste.")
+
+def check_total(access_token, conn, object_type):
+    """Compara el nº de registros del espejo con el `total` de HubSpot y avisa si no cuadran."""
+    local, remote = _local_total(conn, object_type), _remote_total(access_token, object_type)
+    _warn_if_mismatch(object_type, local, remote)
+    return local, remote
+
+# --- LECTURA PARA EL REPORTE ---
+def load_contact_records(conn, start_date_ms, end_date_ms):
+    """Contactos creados en [inicio, fin) con el mismo formato que la API."""
+    rows = conn.execute(
+        "SELECT id, properties FROM contacts WHERE createdate >= ? AND createdate < ?",
+        (start_date_ms, end_date_ms)
+    )
+    return [{"id": row[0], "properties": json.loads(row[1])} for row in rows]
+
+def load_deal_records(conn, pipeline_id_list, start_date_ms, end_date_ms):
+    """Deals cerrados/ganados en [inicio, fin) de los pipelines indicados."""
+    placeholders = ", ".join("?" for _ in pipeline_id_list)
+    rows = conn.execute(
+        "SELECT id, pipeline, properties FROM deals "
+        "WHERE hs_is_closed_won = 'true' AND closedate >= ? AND closedate < ? "
+        f"AND pipeline IN ({placeholders})",
+        (start_date_ms, end_date_ms, *pipeline_id_list)
+    )
+    return [{"id": row[0], "properties": {**json.loads(row[2]), "pipeline": row[1]}} for row in rows]
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=Path(__file__).parent.parent / ".env")
+    token = os.getenv("HUBSPOT_ACCESS_TOKEN")
+    if not token:
+        raise ValueError("No se encontró HUBSPOT_ACCESS_TOKEN.")
+    sync(token)
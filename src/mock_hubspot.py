@@ -0,0 +1,603 @@
+# src/mock_hubspot.py (Servidor local que imita /search, las lecturas batch de HubSpot y Sheets)
+
+import argparse
+import bisect
+import json
+import random
+import threading
+import time
+from array import array
+from urllib.parse import unquote
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dateutil.relativedelta import relativedelta
+
+# --- VALORES SINTÉTICOS (los mismos que consulta el reporte, más algo de ruido) ---
+TRAFFIC_SOURCES = [
+    "PAID_SOCIAL", "PAID_SEARCH", "ORGANIC_SEARCH", "ORGANIC_SOCIAL", "DIRECT_TRAFFIC",
+    "EMAIL_MARKETING", "REFERRALS", "AI_REFERRALS", "FAMILY_AND_FRIENDS", "PR_EVENTS_ORGANIC",
+    "PARTNERSHIPS", "APP", "AMBASSADORS", "OUTBOUND_SALES", "B2C_REFERRALS", "OTHER", None,
+]
+COUNTRY_TOKENS = ["Spain", "Ireland", "Indonesia", "Australia", "Unknown", "WEALTH", "Portugal"]
+PIPELINES = ["default", "188587965", "999999"]
+DEAL_SOURCES = [
+    "Direct Traffic", "B2C Referrals", "Ambassador", "Paid", "Organic", "Outbound Sales", "App",
+    "Events", "Influencers and MKT Ambassadors", "C2C Referrals", None,
+]
+DEAL_TYPES = ["newbusiness", "New - Multi", "existingbusiness", "Repeat - Multi", None]
+ANALYTICS_SOURCES = ["PAID_SOCIAL", "PAID_SEARCH", "ORGANIC_SEARCH", "DIRECT_TRAFFIC", "OFFLINE", None]
+
+SEARCH_RESULT_CAP = 10000
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 100
+
+# --- DATASET COLUMNAR ---
+# Cada tabla guarda columnas: fechas como array('q') en ms y categorías como
+# códigos array('H') + vocabulario. Así 5M de registros caben en memoria.
+def _categorical(values, vocabulary):
+    codes = {value: code for code, value in enumerate(vocabulary)}
+    return ("cat", array("H", (codes[v] for v in values)), vocabulary)
+
+def _date_column(values):
+    return ("date", array("q", values), None)
+
+def _country_vocabulary():
+    """Todas las combinaciones de 1 o 2 tokens, más vacío."""
+    combos = [None] + list(COUNTRY_TOKENS)
+    for i, first in enumerate(COUNTRY_TOKENS):
+        for second in COUNTRY_TOKENS[i + 1:]:
+            combos.append(f"{first};{second}")
+    return combos
+
+def _sorted_dates(rng, n, start_ms, end_ms):
+    return sorted(rng.randrange(start_ms, end_ms) for _ in range(n))
+
+def generate_dataset(n_contacts, n_deals, months=12, seed=42):
+    """
+    Genera contactos y deals repartidos en los últimos `months` meses (hasta hoy).
+    Devuelve {"contacts": tabla, "deals": tabla}.
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    end_ms = int(now.timestamp() * 1000)
+    start_ms = int((now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                    - relativedelta(months=months)).timestamp() * 1000)
+
+    created = _sorted_dates(rng, n_contacts, start_ms, end_ms)
+    countries = _country_vocabulary()
+    contacts = {
+        "sort_key": "createdate",
+        "size": n_contacts,
+        "columns": {
+            "createdate": _date_column(created),
+            "lastmodifieddate": _date_column(min(end_ms, c + rng.randrange(0, 30 * 86400000)) for c in created),
+            "original_traffic_source_2_0": _categorical(
+                (rng.choice(TRAFFIC_SOURCES) for _ in range(n_contacts)), TRAFFIC_SOURCES),
+            "investment_destination_country__multiple_checkboxes_": _categorical(
+                (rng.choice(countries) for _ in range(n_contacts)), countries),
+        },
+    }
+
+    closed = _sorted_dates(rng, n_deals, start_ms, end_ms)
+    deals = {
+        "sort_key": "closedate",
+        "size": n_deals,
+        "columns": {
+            "closedate": _date_column(closed),
+            "hs_lastmodifieddate": _date_column(min(end_ms, c + rng.randrange(0, 7 * 86400000)) for c in closed),
+            "hs_is_closed_won": _categorical(
+                ("true" if rng.random() < 0.7 else "false" for _ in range(n_deals)), ["true", "false"]),
+            "pipeline": _categorical((rng.choice(PIPELINES) for _ in range(n_deals)), PIPELINES),
+            "deal_source": _categorical((rng.choice(DEAL_SOURCES) for _ in range(n_deals)), DEAL_SOURCES),
+            "dealtype": _categorical((rng.choice(DEAL_TYPES) for _ in range(n_deals)), DEAL_TYPES),
+            "hs_analytics_source": _categorical(
+                (rng.choice(ANALYTICS_SOURCES) for _ in range(n_deals)), ANALYTICS_SOURCES),
+            "dealname": _categorical((None for _ in range(n_deals)), [None]),
+        },
+    }
+
+    # Asociaciones deal -> contactos (índices; -1 = ninguno): hasta 2 contactos
+    # creados antes del cierre. Se generan al final para no alterar lo anterior.
+    first_contact = array("i")
+    second_contact = array("i")
+    for closedate in closed:
+        eligible = bisect.bisect_left(created, closedate)
+        has_contact = eligible > 0 and rng.random() < 0.9
+        first_contact.append(rng.randrange(eligible) if has_contact else -1)
+        second_contact.append(rng.randrange(eligible) if has_contact and rng.random() < 0.2 else -1)
+    deals["associations"] = {"contacts": (first_contact, second_contact)}
+    return {"contacts": contacts, "deals": deals}
+
+# --- EVALUACIÓN DE FILTROS ---
+def _to_ms(value):
+    if isinstance(value, (int, float)) or str(value).lstrip("-").isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000)
+
+def _iso(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def _predicate(table, flt):
+    """Convierte un filtro de HubSpot en una función índice -> bool."""
+    name, operator = flt["propertyName"], flt["operator"]
+    column = table["columns"].get(name)
+    if column is None:
+        return lambda i: operator in ("NEQ", "NOT_HAS_PROPERTY")
+    kind, data, vocabulary = column
+
+    if kind == "date":
+        if operator == "HAS_PROPERTY":
+            return lambda i: True
+        value = _to_ms(flt["value"])
+        compare = {
+            "EQ": lambda v: v == value, "NEQ": lambda v: v != value,
+            "GT": lambda v: v > value, "GTE": lambda v: v >= value,
+            "LT": lambda v: v < value, "LTE": lambda v: v <= value,
+        }[operator]
+        return lambda i: compare(data[i])
+
+    def codes_where(test):
+        return {code for code, text in enumerate(vocabulary) if test(text)}
+
+    if operator == "EQ":
+        codes = codes_where(lambda text: text is not None and text.lower() == str(flt["value"]).lower())
+    elif operator == "NEQ":
+        codes = codes_where(lambda text: text is None or text.lower() != str(flt["value"]).lower())
+    elif operator == "IN":
+        wanted = {str(v).lower() for v in flt["values"]}
+        codes = codes_where(lambda text: text is not None and text.lower() in wanted)
+    elif operator == "CONTAINS_TOKEN":
+        token = str(flt["value"]).lower()
+        codes = codes_where(lambda text: text is not None and token in {t.lower() for t in text.split(";")})
+    elif operator == "CONTAINS":
+        needle = str(flt["value"]).strip("*").lower()
+        codes = codes_where(lambda text: text is not None and needle in text.lower())
+    elif operator == "HAS_PROPERTY":
+        codes = codes_where(lambda text: text not in (None, ""))
+    elif operator == "NOT_HAS_PROPERTY":
+        codes = codes_where(lambda text: text in (None, ""))
+    else:
+        raise ValueError(f"Operador no soportado: {operator}")
+    return lambda i: data[i] in codes
+
+def _sort_key_range(table, filters):
+    """Usa bisect sobre la columna ordenada para acotar el rango a recorrer."""
+    low, high = 0, table["size"]
+    data = table["columns"][table["sort_key"]][1]
+    rest = []
+    for flt in filters:
+        if flt["propertyName"] == table["sort_key"] and flt["operator"] in ("GTE", "GT", "LT", "LTE"):
+            value = _to_ms(flt["value"])
+            if flt["operator"] == "GTE":
+                low = max(low, bisect.bisect_left(data, value))
+            elif flt["operator"] == "GT":
+                low = max(low, bisect.bisect_right(data, value))
+            elif flt["operator"] == "LT":
+                high = min(high, bisect.bisect_left(data, value))
+            else:
+                high = min(high, bisect.bisect_right(data, value))
+        else:
+            rest.append(flt)
+    return low, high, rest
+
+def match(table, filter_groups, sorts):
+    """Índices que cumplen algún grupo de filtros (OR de ANDs), ordenados."""
+    matched = set()
+    ordered = []
+    for group in filter_groups or [{"filters": []}]:
+        low, high, rest = _sort_key_range(table, group.get("filters", []))
+        predicates = [_predicate(table, flt) for flt in rest]
+        for i in range(low, max(low, high)):
+            if i not in matched and all(p(i) for p in predicates):
+                matched.add(i)
+                ordered.append(i)
+    if len(filter_groups or []) > 1:
+        ordered.sort()
+    for sort in reversed(sorts or []):
+        name = sort["propertyName"] if isinstance(sort, dict) else sort
+        column = table["columns"].get(name)
+        if column is not None:
+            descending = isinstance(sort, dict) and sort.get("direction") == "DESCENDING"
+            ordered.sort(key=lambda i: column[1][i], reverse=descending)
+    return ordered
+
+def render(table, object_type, index, properties):
+    """Un registro con el formato de la API (fechas en ISO, categorías en texto)."""
+    wanted = set(properties or [])
+    wanted.update({"createdate", "lastmodifieddate"} if object_type == "contacts" else {"hs_lastmodifieddate"})
+    props = {"hs_object_id": str(index + 1)}
+    for name in wanted:
+        column = table["columns"].get(name)
+        if column is None:
+            props[name] = None
+            continue
+        kind, data, vocabulary = column
+        props[name] = _iso(data[index]) if kind == "date" else vocabulary[data[index]]
+    return {"id": str(index + 1), "properties": props, "archived": False}
+
+# --- EVENTOS DE WEBHOOK (para probar webhooks.py con el replayer) ---
+CONTACT_EVENT_PROPERTIES = ["original_traffic_source_2_0", "investment_destination_country__multiple_checkboxes_"]
+DEAL_EVENT_PROPERTIES = ["pipeline", "hs_is_closed_won", "closedate", "deal_source", "dealtype", "hs_analytics_source"]
+
+def dataset_events(dataset, since_ms, duplicate_rate=0.01, seed=42):
+    """
+    Eventos de HubSpot (creation + propertyChange) de los contactos creados y
+    deals cerrados desde `since_ms`, ordenados por occurredAt. Un % se repite
+    (reintentos de HubSpot) con el mismo eventId.
+    """
+    rng = random.Random(seed)
+    events = []
+    tables = [
+        ("contact", dataset["contacts"], "createdate", CONTACT_EVENT_PROPERTIES),
+        ("deal", dataset["deals"], "closedate", DEAL_EVENT_PROPERTIES),
+    ]
+    for object_type, table, date_column, properties in tables:
+        dates = table["columns"][date_column][1]
+        for index in range(bisect.bisect_left(dates, since_ms), table["size"]):
+            occurred_at = dates[index]
+            object_id = index + 1
+            events.append({"subscriptionType": f"{object_type}.creation", "objectId": object_id,
+                           "occurredAt": occurred_at})
+            for offset, name in enumerate(properties, start=1):
+                kind, data, vocabulary = table["columns"][name]
+                value = str(data[index]) if kind == "date" else vocabulary[data[index]]
+                if value is None:
+                    continue
+                events.append({"subscriptionType": f"{object_type}.propertyChange", "objectId": object_id,
+                               "occurredAt": occurred_at + offset, "propertyName": name, "propertyValue": value})
+    events.sort(key=lambda event: event["occurredAt"])
+    output = []
+    for event_id, event in enumerate(events, start=1):
+        event = {"eventId": event_id, "portalId": 1, "attemptNumber": 0, **event}
+        output.append(event)
+        if rng.random() < duplicate_rate:
+            output.append({**event, "attemptNumber": 1})
+    return output
+
+# --- FAKE DE GOOGLE SHEETS (values.get / values.batchUpdate) ---
+def _parse_a1(range_a1):
+    """'Hoja'!B2:C3 -> (hoja, fila0, col0, fila1, col1) con base 1; sin celdas = hoja entera."""
+    if "!" in range_a1:
+        sheet, cells = range_a1.rsplit("!", 1)
+    else:
+        sheet, cells = range_a1, ""
+    if sheet.startswith("'") and sheet.endswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    if not cells:
+        return sheet, None
+
+    def cell(ref):
+        letters = "".join(ch for ch in ref if ch.isalpha())
+        digits = "".join(ch for ch in ref if ch.isdigit())
+        col = 0
+        for ch in letters.upper():
+            col = col * 26 + (ord(ch) - 64)
+        return int(digits), col
+
+    first, _, last = cells.partition(":")
+    first_row, first_col = cell(first)
+    last_row, last_col = cell(last or first)
+    return sheet, (first_row, first_col, last_row, last_col)
+
+def _sheets_get(handler, path, sheets):
+    # /v4/spreadsheets/{id}/values/{rango}
+    if not handler._simulate_network():
+        return
+    parts = path.split("/")
+    spreadsheet_id, range_a1 = parts[3], unquote(parts[5])
+    sheet_name, _ = _parse_a1(range_a1)
+    grid = sheets.get(spreadsheet_id, {}).get(sheet_name, [])
+    # Igual que la API real: se recortan filas/columnas vacías del final
+    trimmed = []
+    for row in grid:
+        row = list(row)
+        while row and row[-1] in ("", None):
+            row.pop()
+        trimmed.append(row)
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    body = {"range": range_a1, "majorDimension": "ROWS"}
+    if trimmed:
+        body["values"] = trimmed
+    handler._send_json(200, body)
+
+def _sheets_batch_update(handler, path, sheets, stats, stats_lock):
+    # /v4/spreadsheets/{id}/values:batchUpdate
+    spreadsheet_id = path.split("/")[3].split(":")[0]
+    body = handler._read_json()
+    if not handler._simulate_network():
+        return
+    updated_cells = 0
+    for entry in body.get("data", []):
+        sheet_name, bounds = _parse_a1(entry["range"])
+        grid = sheets.setdefault(spreadsheet_id, {}).setdefault(sheet_name, [])
+        first_row, first_col = (bounds[0], bounds[1]) if bounds else (1, 1)
+        for r, row_values in enumerate(entry.get("values", [])):
+            row_index = first_row - 1 + r
+            while len(grid) <= row_index:
+                grid.append([])
+            row = grid[row_index]
+            for c, value in enumerate(row_values):
+                col_index = first_col - 1 + c
+                while len(row) <= col_index:
+                    row.append("")
+                row[col_index] = value
+                updated_cells += 1
+    with stats_lock:
+        stats["sheets_batch_updates"] = stats.get("sheets_batch_updates", 0) + 1
+        stats["sheets_updated_cells"] = stats.get("sheets_updated_cells", 0) + updated_cells
+    handler._send_json(200, {
+        "spreadsheetId": spreadsheet_id,
+        "totalUpdatedCells": updated_cells,
+        "totalUpdatedRanges": len(body.get("data", [])),
+    })
+
+# --- SERVIDOR HTTP ---
+def _server_bucket(rate):
+    """Cubo de fichas del lado del servidor para simular el límite por segundo."""
+    state = {"tokens": float(rate or 0), "last": time.monotonic()}
+    lock = threading.Lock()
+
+    def take():
+        if not rate:
+            return True
+        with lock:
+            now = time.monotonic()
+            state["tokens"] = min(float(rate), state["tokens"] + (now - state["last"]) * rate)
+            state["last"] = now
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return True
+            return False
+    return take
+
+def make_handler(dataset, latency=0.0, jitter=0.0, rate_limit=None, error_rate=0.0, seed=None):
+    """Crea la clase de handler con la configuración del escenario."""
+    take_token = _server_bucket(rate_limit)
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    match_cache = OrderedDict()
+    cache_lock = threading.Lock()
+    stats = {"requests": 0, "rate_limited": 0, "errors_injected": 0, "by_path": {}}
+    stats_lock = threading.Lock()
+    sheets = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_stats = stats
+        routes = {}
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            raw = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _simulate_network(self):
+            """Latencia, límite de cuota y errores inyectados. Devuelve False si ya respondió."""
+            with rng_lock:
+                delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+                fail = rng.random() < error_rate
+                failure_status = rng.choice([500, 502, 503])
+            time.sleep(delay)
+            if not take_token():
+                with stats_lock:
+                    stats["rate_limited"] += 1
+                self._send_json(429, {
+                    "status": "error", "message": "You have reached your secondly limit.",
+                    "errorType": "RATE_LIMIT", "category": "RATE_LIMITS",
+                }, {"Retry-After": "1"})
+                return False
+            if fail:
+                with stats_lock:
+                    stats["errors_injected"] += 1
+                self._send_json(failure_status, {"status": "error", "message": "Injected failure"})
+                return False
+            return True
+
+        def do_GET(self):
+            if self.path == "/__stats":
+                with stats_lock:
+                    self._send_json(200, json.loads(json.dumps(stats)))
+                return
+            if self.path == "/__sheets":
+                self._send_json(200, sheets)
+                return
+            self._route("GET")
+
+        def do_POST(self):
+            self._route("POST")
+
+        def do_PUT(self):
+            self._route("PUT")
+
+        def _route(self, method):
+            path = self.path.split("?")[0]
+            with stats_lock:
+                stats["requests"] += 1
+                stats["by_path"][path] = stats["by_path"].get(path, 0) + 1
+            if method == "POST" and path.startswith("/crm/v3/objects/") and path.endswith("/search"):
+                object_type = path.split("/")[4]
+                if object_type not in dataset:
+                    self._send_json(404, {"status": "error", "message": "Unknown object"})
+                    return
+                # El cuerpo se lee siempre: si se queda en el socket, la conexión keep-alive se corrompe
+                body = self._read_json()
+                if self._simulate_network():
+                    self._search(object_type, body)
+                return
+            for (route_method, prefix), handler in self.routes.items():
+                if route_method == method and path.startswith(prefix):
+                    handler(self, path)
+                    return
+            self._send_json(404, {"status": "error", "message": f"No route for {method} {path}"})
+
+        def _search(self, object_type, body):
+            table = dataset[object_type]
+            limit = min(int(body.get("limit", 10)), MAX_PAGE_SIZE)
+            offset = int(body.get("after", 0) or 0)
+            if offset >= SEARCH_RESULT_CAP:
+                self._send_json(400, {
+                    "status": "error",
+                    "message": f"Search results are limited to {SEARCH_RESULT_CAP} records.",
+                })
+                return
+            key = json.dumps([object_type, body.get("filterGroups"), body.get("sorts")], sort_keys=True)
+            with cache_lock:
+                indices = match_cache.get(key)
+                if indices is not None:
+                    match_cache.move_to_end(key)
+            if indices is None:
+                try:
+                    indices = match(table, body.get("filterGroups"), body.get("sorts"))
+                except (KeyError, ValueError) as e:
+                    self._send_json(400, {"status": "error", "message": str(e)})
+                    return
+                with cache_lock:
+                    match_cache[key] = indices
+                    while len(match_cache) > 256:
+                        match_cache.popitem(last=False)
+            page = indices[offset:offset + limit]
+            response = {
+                "total": len(indices),
+                "results": [render(table, object_type, i, body.get("properties")) for i in page],
+            }
+            next_offset = offset + limit
+            if next_offset < len(indices) and next_offset < SEARCH_RESULT_CAP:
+                response["paging"] = {"next": {"after": str(next_offset)}}
+            self._send_json(200, response)
+
+    def _batch_inputs(handler):
+        """Lee el cuerpo de un batch; responde 400 si supera el máximo de la API."""
+        body = handler._read_json()
+        inputs = body.get("inputs", [])
+        if len(inputs) > MAX_BATCH_SIZE:
+            handler._send_json(400, {"status": "error", "message": f"Batch limited to {MAX_BATCH_SIZE} inputs"})
+            return body, None
+        if not handler._simulate_network():
+            return body, None
+        return body, inputs
+
+    def _associations_batch_read(handler, path):
+        # /crm/v4/associations/deals/contacts/batch/read
+        _, inputs = _batch_inputs(handler)
+        if inputs is None:
+            return
+        columns = dataset["deals"].get("associations", {}).get("contacts", ())
+        results, errors = [], []
+        for item in inputs:
+            index = int(item["id"]) - 1
+            targets = [column[index] for column in columns if 0 <= index < len(column) and column[index] >= 0]
+            if not targets:
+                errors.append({"status": "error", "category": "OBJECT_NOT_FOUND",
+                               "message": f"No contacts are associated with deal {item['id']}."})
+                continue
+            results.append({
+                "from": {"id": item["id"]},
+                "to": [{"toObjectId": target + 1, "associationTypes": [
+                    {"category": "HUBSPOT_DEFINED", "typeId": 3, "label": None}
+                ]} for target in dict.fromkeys(targets)],
+            })
+        body = {"status": "COMPLETE", "results": results}
+        if errors:
+            body["errors"] = errors
+        handler._send_json(207 if errors else 200, body)
+
+    def _objects_batch_read(handler, path):
+        # /crm/v3/objects/{tipo}/batch/read
+        object_type = path.split("/")[4]
+        body, inputs = _batch_inputs(handler)
+        if inputs is None:
+            return
+        table = dataset.get(object_type)
+        results = [
+            render(table, object_type, int(item["id"]) - 1, body.get("properties"))
+            for item in inputs if 0 < int(item["id"]) <= table["size"]
+        ]
+        handler._send_json(200, {"status": "COMPLETE", "results": results})
+
+    def _objects_list(handler, path):
+        # GET /crm/v3/objects/{tipo}?archived=true: el dataset sintético no borra nada
+        if not handler._simulate_network():
+            return
+        archived = "archived=true" in handler.path.split("?", 1)[-1]
+        if not archived:
+            handler._send_json(400, {"status": "error", "message": "Only archived=true listing is simulated"})
+            return
+        handler._send_json(200, {"results": []})
+
+    Handler.routes = {
+        ("POST", "/crm/v4/associations/deals/contacts/batch/read"): _associations_batch_read,
+        ("POST", "/crm/v3/objects/contacts/batch/read"): _objects_batch_read,
+        ("GET", "/crm/v3/objects/"): _objects_list,
+        ("GET", "/v4/spreadsheets/"): lambda handler, path: _sheets_get(handler, path, sheets),
+        ("POST", "/v4/spreadsheets/"): lambda handler, path: _sheets_batch_update(
+            handler, path, sheets, stats, stats_lock),
+    }
+    return Handler
+
+def start_server(dataset, port=0, **handler_options):
+    """Arranca el servidor en un hilo. Devuelve (servidor, url_base)."""
+    handler = make_handler(dataset, **handler_options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# --- CLI ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de búsqueda de HubSpot")
+    parser.add_argument("--contacts", type=int, default=10000, help="Nº de contactos sintéticos")
+    parser.add_argument("--deals", type=int, default=1000, help="Nº de deals sintéticos")
+    parser.add_argument("--months", type=int, default=12, help="Meses de historia a generar")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=0, help="0 = puerto libre cualquiera")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latencia por petición (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Variación de la latencia (± s)")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Peticiones/s antes de devolver 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de 5xx inyectado")
+    parser.add_argument(
+        "--dump-events", metavar="EVENTOS.jsonl",
+        help="Guarda los eventos de webhook del mes en curso (para webhooks.py replay)"
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    dataset = generate_dataset(args.contacts, args.deals, args.months, args.seed)
+    if args.dump_events:
+        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        events = dataset_events(dataset, int(month_start.timestamp() * 1000), seed=args.seed)
+        with open(args.dump_events, "w", encoding="utf-8") as file:
+            for event in events:
+                file.write(json.dumps(event) + "\n")
+        print(f"{len(events)} eventos de webhook guardados en {args.dump_events}", flush=True)
+    server, base_url = start_server(
+        dataset, port=args.port, latency=args.latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, error_rate=args.error_rate, seed=args.seed
+    )
+    print(f"Dataset generado en {time.perf_counter() - started:.1f} s "
+          f"({args.contacts} contactos, {args.deals} deals)", flush=True)
+    # El benchmark espera esta línea para saber dónde conectarse
+    print(f"READY {base_url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# src/planner.py (Planificador: compila el spec de métricas en el mínimo de búsquedas)
+
+import json
+import os
+from pathlib import Path
+from cache import make_key
+from contacts import _search_contacts, get_last_month_dates
+from deals import _search_deals
+from hubspot_client import run_parallel
+import checkpoint
+import metrics
+
+DEFAULT_SPEC_PATH = Path(__file__).parent / "metrics_spec.json"
+
+# Secciones del spec con forma {"property": ..., "map": {etiqueta: valor}}
+MAPPED_SECTIONS = ("countries", "lead_sources")
+SPEC_SECTIONS = ("countries", "lead_sources", "pipelines", "deal_breakdowns", "report")
+
+# Grupos fijos de resultados (los desgloses de deals añaden los suyos)
+FIXED_GROUPS = ("total_leads", "country_leads", "lead_sources_raw", "pipeline_totals")
+
+# Cada búsqueda de conteo (limit 1) consume una petición de la cuota de /search
+QUOTA_COST_PER_SEARCH = 1
+
+# --- SPEC ---
+def load_spec(path=None):
+    """Lee el spec de métricas (JSON). Se puede sobreescribir con METRICS_SPEC_PATH."""
+    path = Path(path or os.getenv("METRICS_SPEC_PATH", DEFAULT_SPEC_PATH))
+    with open(path, encoding="utf-8") as file:
+        return validate_spec(json.load(file))
+
+def validate_spec(spec):
+    """
+    Comprueba la forma del spec y falla con un ValueError claro: una entrada
+    sin valor (p. ej. un país sin token) no debe acabar en una fila vacía.
+    """
+    unknown = set(spec) - set(SPEC_SECTIONS)
+    missing = set(SPEC_SECTIONS) - set(spec)
+    if unknown or missing:
+        raise ValueError(f"Spec de métricas: secciones desconocidas {sorted(unknown)} / que faltan {sorted(missing)}.")
+    sections = {name: spec[name] for name in MAPPED_SECTIONS}
+    sections.update((f"deal_breakdowns.{group}", breakdown) for group, breakdown in spec["deal_breakdowns"].items())
+    for name, section in sections.items():
+        if not isinstance(section, dict) or not section.get("property") or not isinstance(section.get("map"), dict):
+            raise ValueError(f'Spec de métricas: "{name}" debe ser {{"property": ..., "map": {{etiqueta: valor}}}}.')
+        for label, value in section["map"].items():
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f'Spec de métricas: "{name}" no tiene valor para "{label}".')
+            # Sólo las fuentes de leads admiten filas manuales; en deals se buscaría el valor literal
+            if value == "MANUAL_SKIP" and name != "lead_sources":
+                raise ValueError(f'Spec de métricas: MANUAL_SKIP sólo vale en "lead_sources" ("{name}" -> "{label}"); '
+                                 f'las filas manuales van en "report" con "value".')
+    pipelines = spec["pipelines"]
+    if not isinstance(pipelines, dict) or not pipelines:
+        raise ValueError('Spec de métricas: "pipelines" debe mapear etiqueta -> id de pipeline.')
+    for label, pipeline_id in pipelines.items():
+        if not isinstance(pipeline_id, str) or not pipeline_id.strip() or pipeline_id == "MANUAL_SKIP":
+            raise ValueError(f'Spec de métricas: el pipeline "{label}" no tiene id.')
+    clashes = set(spec["deal_breakdowns"]) & set(FIXED_GROUPS)
+    if clashes:
+        raise ValueError(f"Spec de métricas: los desgloses de deals no pueden llamarse {sorted(clashes)}.")
+    _validate_report(spec)
+    return spec
+
+def _validate_report(spec):
+    """Cada fila del reporte es un texto fijo ("value") o una suma de destinos existentes ("sum")."""
+    rows = spec["report"]
+    if not isinstance(rows, list) or not rows:
+        raise ValueError('Spec de métricas: "report" debe ser una lista de filas {"label", "sum" | "value"}.')
+    maps = group_maps(spec)
+    for position, row in enumerate(rows, start=1):
+        if not isinstance(row, dict) or not isinstance(row.get("label"), str) or ("sum" in row and "value" in row):
+            raise ValueError(f'Spec de métricas: la fila {position} de "report" debe tener "label" y "sum" o "value".')
+        terms = row.get("sum")
+        if terms is None:
+            continue
+        if not isinstance(terms, list) or not terms:
+            raise ValueError(f'Spec de métricas: la fila "{row["label"]}" tiene un "sum" vacío.')
+        for term in terms:
+            group, _, label = str(term).partition(":")
+            if group not in maps or (label and label not in maps[group]):
+                raise ValueError(f'Spec de métricas: la fila "{row["label"]}" suma un destino desconocido: "{term}".')
+            if label and maps[group][label] == "MANUAL_SKIP":
+                raise ValueError(f'Spec de métricas: la fila "{row["label"]}" suma "{term}", que es MANUAL_SKIP.')
+
+def group_maps(spec):
+    """{grupo de resultados: mapa etiqueta -> valor} (total_leads no tiene etiquetas)."""
+    maps = {
+        "total_leads": {},
+        "country_leads": spec["countries"]["map"],
+        "lead_sources_raw": spec["lead_sources"]["map"],
+        "pipeline_totals": spec["pipelines"],
+    }
+    maps.update((group, breakdown["map"]) for group, breakdown in spec["deal_breakdowns"].items())
+    return maps
+
+def report_targets(spec, groups=()):
+    """
+    Destinos (grupo, etiqueta) que consume alguna fila del reporte, más los
+    grupos completos de `groups` (p. ej. lead_sources_raw para la atribución).
+    Un término sin etiqueta ("pipeline_totals") usa todo su grupo.
+    """
+    maps = group_maps(spec)
+    targets = set()
+    terms = [term for row in spec["report"] for term in row.get("sum", [])] + list(groups)
+    for term in terms:
+        group, _, label = term.partition(":")
+        if group == "total_leads":
+            targets.add((group, None))
+        elif label:
+            targets.add((group, label))
+        else:
+            targets.update((group, label) for label in maps[group])
+    return targets
+
+# --- PROPIEDADES QUE LEEN LOS DESGLOSES (modos aggregate y mirror) ---
+def contact_properties(spec):
+    """Propiedades de contacto que agrupan los desgloses del spec, sin repetir."""
+    return list(dict.fromkeys([spec["countries"]["property"], spec["lead_sources"]["property"]]))
+
+def deal_properties(spec):
+    """Pipeline más las propiedades de cada desglose de deals del spec, sin repetir."""
+    return list(dict.fromkeys(["pipeline"] + [b["property"] for b in spec["deal_breakdowns"].values()]))
+
+# --- PLAN ---
+def _add_search(plan, index, object_type, pipelines, filters, target):
+    """Añade una búsqueda al plan, o sólo el destino si ya hay una idéntica."""
+    key_filters = list(filters)
+    if pipelines is not None:
+        key_filters.append({"propertyName": "pipeline", "operator": "IN", "values": pipelines})
+    key = make_key(object_type, key_filters, ())
+    if key not in index:
+        index[key] = len(plan)
+        plan.append({
+            "key": key,
+            "object": object_type,
+            "pipelines": pipelines,
+            "filters": list(filters),
+            "targets": [],
+        })
+    plan[index[key]]["targets"].append(target)
+
+def build_plan(spec, groups=()):
+    """
+    Compila el spec en la lista mínima de búsquedas distintas.
+    Los filtros idénticos (en forma canónica) se consultan una sola vez y
+    alimentan varios destinos (grupo, etiqueta). MANUAL_SKIP no genera búsqueda,
+    y tampoco los destinos que ninguna fila del reporte usa (salvo los de `groups`).
+    """
+    plan = []
+    index = {}
+    wanted = report_targets(spec, groups)
+
+    def add(object_type, pipelines, filters, target):
+        if target in wanted:
+            _add_search(plan, index, object_type, pipelines, filters, target)
+
+    # CONTACTS
+    add("contacts", None, [], ("total_leads", None))
+
+    countries = spec["countries"]
+    for country, token in countries["map"].items():
+        add("contacts", None, [
+            {"propertyName": countries["property"], "operator": "CONTAINS_TOKEN", "value": token}
+        ], ("country_leads", country))
+
+    lead_sources = spec["lead_sources"]
+    for label, internal_value in lead_sources["map"].items():
+        if internal_value == "MANUAL_SKIP":
+            continue
+        add("contacts", None, [
+            {"propertyName": lead_sources["property"], "operator": "EQ", "value": internal_value}
+        ], ("lead_sources_raw", label))
+
+    # DEALS
+    pipeline_ids = list(spec["pipelines"].values())
+    for label, pipeline_id in spec["pipelines"].items():
+        add("deals", [pipeline_id], [], ("pipeline_totals", label))
+
+    for group, breakdown in spec["deal_breakdowns"].items():
+        for label, internal_value in breakdown["map"].items():
+            add("deals", pipeline_ids, [
+                {"propertyName": breakdown["property"], "operator": "EQ", "value": internal_value}
+            ], (group, label))
+
+    return plan
+
+def explain(plan, rate=None):
+    """Imprime el plan: nº de búsquedas, destinos que cubren y coste de cuota."""
+    targets = sum(len(search["targets"]) for search in plan)
+    cost = len(plan) * QUOTA_COST_PER_SEARCH
+    print("\n--- PLAN DE CONSULTAS ---")
+    for search in plan:
+        filters = ", ".join(
+            f"{f['propertyName']} {f['operator']} {f.get('value', f.get('values'))}" for f in search["filters"]
+        ) or "(sólo filtros base)"
+        pipelines = f" pipelines={search['pipelines']}" if search["pipelines"] is not None else ""
+        print(f"  [{search['object']}] {filters}{pipelines} -> {_span_name(search)}")
+    print(f"\nBúsquedas planificadas: {len(plan)} (para {targets} métricas, {targets - len(plan)} deduplicadas)")
+    print(f"Coste de cuota: {cost} peticiones de /search")
+    if rate:
+        print(f"Tiempo mínimo estimado a {rate} peticiones/s: {cost / rate:.1f} s")
+
+# --- EJECUCIÓN ---
+def _span_name(search):
+    return ", ".join(f"{group}:{label}" if label else group for group, label in search["targets"])
+
+def _run_search(access_token, search, date_range):
+    # filters_hash es la clave canónica del plan: no depende de la caché ni del portal
+    with metrics.span(_span_name(search), object=search["object"], window=list(date_range or []),
+                      filters_hash=search["key"]):
+        if search["object"] == "contacts":
+            return _search_contacts(access_token, additional_filters=search["filters"], date_range=date_range)
+        return _search_deals(access_token, search["pipelines"], additional_filters=search["filters"], date_range=date_range)
+
+def _run_checkpointed(access_token, search, date_range):
+    """Ejecuta la búsqueda y guarda su total en el checkpoint en cuanto llega."""
+    count = _run_search(access_token, search, date_range)
+    checkpoint.record(checkpoint.make_key(search["key"], date_range), count)
+    return count
+
+def execute_plan(access_token, plan, date_range=None):
+    """
+    Lanza en paralelo las búsquedas del plan. Devuelve {clave: total}.
+    Con el checkpoint activo, las búsquedas ya completadas (--resume) no se repiten.
+    """
+    date_range = date_range or get_last_month_dates()
+    counts = {}
+    pending = []
+    for search in plan:
+        count = checkpoint.get(checkpoint.make_key(search["key"], date_range))
+        if count is None:
+            pending.append(search)
+        else:
+            counts[search["key"]] = count
+    if counts:
+        print(f"\nCheckpoint: {len(counts)} búsquedas ya completadas, se ejecutan las {len(pending)} restantes...")
+    else:
+        print(f"\nEjecutando {len(plan)} búsquedas planificadas...")
+    results = run_parallel(lambda search: _run_checkpointed(access_token, search, date_range), pending)
+    counts.update((search["key"], count) for search, count in zip(pending, results))
+    return counts
+
+def assemble_results(spec, plan, counts):
+    """
+    Reparte los totales del plan a los grupos del reporte, con el mismo
+    formato (y orden de etiquetas) que devolvían las funciones get_*.
+    """
+    results = {
+        "total_leads": None,
+        "country_leads": {country: None for country in spec["countries"]["map"]},
+        "lead_sources_raw": {
+            label: ("MANUAL_SKIP" if value == "MANUAL_SKIP" else None)
+            for label, value in spec["lead_sources"]["map"].items()
+        },
+        "pipeline_totals": {label: None for label in spec["pipelines"]},
+    }
+    for group, breakdown in spec["deal_breakdowns"].items():
+        results[group] = {label: None for label in breakdown["map"]}
+
+    for search in plan:
+        count = counts.get(search["key"])
+        for group, label in search["targets"]:
+            if label is None:
+                results[group] = count
+            else:
+                results[group][label] = count
+    return results
+
+# --- FILAS DEL REPORTE ---
+def missing_targets(spec, results):
+    """
+    Destinos que usa el reporte y no tienen total ("grupo:etiqueta"): en el
+    modo search, una búsqueda que falló (en el CSV cuenta como 0).
+    """
+    missing = []
+    for group, label in sorted(report_targets(spec), key=str):
+        value = results.get(group)
+        if label is not None:
+            value = value.get(label) if isinstance(value, dict) else None
+        if value is None:
+            missing.append(f"{group}:{label}" if label else group)
+    return missing
+
+def row_value(row, results):
+    """
+    Valor de una fila del spec: su texto fijo ("value") o la suma de sus
+    destinos ("sum"). None y MANUAL_SKIP cuentan como 0; una fila sin nada es "".
+    """
+    if "sum" not in row:
+        return row.get("value", "")
+    total = 0
+    for term in row["sum"]:
+        group, _, label = term.partition(":")
+        data = results.get(group)
+        if label:
+            values = [data.get(label) if isinstance(data, dict) else None]
+        elif isinstance(data, dict):
+            values = list(data.values())
+        else:
+            values = [data]
+        total += sum(value for value in values if value is not None and value != "MANUAL_SKIP")
+    return total
@@ -0,0 +1,178 @@
+# src/portals.py (Modo multi-portal: un reporte por portal en procesos separados)
+
+# Lanza main.py para varios portales de HubSpot a la vez, cada uno en su propio
+# proceso: token, token bucket (--rate), spec, caché, espejo, histórico y
+# carpeta de salida propios. Un portal lento o con 429 no frena a los demás.
+#
+# Configuración (JSON):
+# {
+#   "defaults": {"rate": 5, "workers": 8, "args": ["--mode", "aggregate"]},
+#   "portals": [
+#     {"name": "spain", "token_env": "HUBSPOT_TOKEN_SPAIN"},
+#     {"name": "ireland", "token_env": "HUBSPOT_TOKEN_IRELAND", "rate": 10,
+#      "spec_overrides": {"pipelines": {"[IE] Sales": "default"}},
+#      "api_base": "https://api-eu1.hubapi.com", "args": ["--sheet", "..."]}
+#   ]
+# }
+# `spec_overrides` sustituye claves de primer nivel de metrics_spec.json.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+DEFAULT_OUTPUT_ROOT = Path(__file__).parent.parent / "reportes_portales"
+DEFAULT_SPEC_PATH = Path(__file__).parent / "metrics_spec.json"
+
+# --- CONFIGURACIÓN ---
+def load_portals(path):
+    """Lee el JSON de portales y aplica `defaults` a cada uno."""
+    with open(path, encoding="utf-8") as file:
+        config = json.load(file)
+    defaults = config.get("defaults", {})
+    portals = []
+    for portal in config["portals"]:
+        merged = {**defaults, **portal}
+        merged["args"] = list(defaults.get("args", [])) + list(portal.get("args", []))
+        if not merged.get("name"):
+            raise ValueError("Cada portal necesita un 'name'.")
+        if not (merged.get("token") or merged.get("token_env")):
+            raise ValueError(f"El portal {merged['name']} necesita 'token_env' (o 'token').")
+        portals.append(merged)
+    names = [portal["name"] for portal in portals]
+    if len(set(names)) != len(names):
+        raise ValueError("Los nombres de portal deben ser únicos (cada uno tiene su carpeta).")
+    return portals
+
+def _portal_spec(portal):
+    """Spec base (el del portal, METRICS_SPEC_PATH o metrics_spec.json) con sus sustituciones."""
+    path = portal.get("spec") or os.getenv("METRICS_SPEC_PATH") or DEFAULT_SPEC_PATH
+    with open(path, encoding="utf-8") as file:
+        spec = json.load(file)
+    spec.update(portal.get("spec_overrides", {}))
+    return spec
+
+def _portal_args(portal, base_args):
+    args = list(base_args) + list(portal.get("args", []))
+    if portal.get("rate") is not None:
+        args += ["--rate", str(portal["rate"])]
+    if portal.get("workers") is not None:
+        args += ["--workers", str(portal["workers"])]
+    return args
+
+# --- EJECUCIÓN DE UN PORTAL (en su propio proceso) ---
+def run_portal(portal, base_args, output_root):
+    """
+    Prepara el entorno del portal ANTES de importar main (que lee el spec, la
+    URL de la API y las rutas al importarse) y ejecuta el reporte dentro de su carpeta.
+    La salida de consola va a <carpeta>/run.log.
+    """
+    started = time.perf_counter()
+    portal_dir = Path(output_root).resolve() / portal["name"]
+    portal_dir.mkdir(parents=True, exist_ok=True)
+    token = portal.get("token") or os.getenv(portal["token_env"], "")
+
+    spec_path = portal_dir / "metrics_spec.json"
+    with open(spec_path, "w", encoding="utf-8") as file:
+        json.dump(_portal_spec(portal), file, ensure_ascii=False, indent=4)
+
+    os.environ.update({
+        "HUBSPOT_ACCESS_TOKEN": token,
+        "METRICS_SPEC_PATH": str(spec_path),
+        "HUBSPOT_CACHE_PATH": str(portal_dir / ".hubspot_cache.sqlite"),
+        "HUBSPOT_MIRROR_PATH": str(portal_dir / ".hubspot_mirror.sqlite"),
+        "HUBSPOT_CHECKPOINT_PATH": str(portal_dir / ".hubspot_checkpoint.jsonl"),
+        "REPORT_HISTORY_PATH": str(portal_dir / ".report_history.sqlite"),
+    })
+    if portal.get("api_base"):
+        os.environ["HUBSPOT_API_BASE"] = portal["api_base"]
+    os.chdir(portal_dir)
+
+    result = {"name": portal["name"], "dir": str(portal_dir), "status": "ok", "error": None}
+    with open(portal_dir / "run.log", "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            if not token:
+                raise ValueError(f"La variable {portal['token_env']} está vacía.")
+            import main
+            main.main(_portal_args(portal, base_args))
+        except BaseException as e:
+            traceback.print_exc()
+            result.update(status="error", error=f"{type(e).__name__}: {e}")
+    result["elapsed_s"] = round(time.perf_counter() - started, 2)
+    result["files"] = sorted(p.name for p in portal_dir.glob("reporte_*.csv"))
+    return result
+
+# --- ORQUESTACIÓN ---
+def _run_in_fresh_process(portal, base_args, output_root):
+    """
+    Ejecuta el portal en un pool propio de un solo proceso ('spawn') que se
+    cierra al terminar: equivale a max_tasks_per_child=1, que sólo existe
+    desde Python 3.11, y un proceso que muere se reporta como BrokenProcessPool.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_portal, portal, base_args, output_root).result()
+
+def run_portals(portals, base_args=(), output_root=DEFAULT_OUTPUT_ROOT, processes=None):
+    """
+    Un proceso por portal (como mucho `processes` a la vez). Se usa 'spawn' y
+    un proceso nuevo por portal para que ningún estado de módulo (spec, token
+    bucket, caché) se comparta entre portales. Devuelve la lista de resultados.
+    """
+    processes = processes or len(portals)
+    print(f"Lanzando {len(portals)} portales en {min(processes, len(portals))} procesos...")
+    started = time.perf_counter()
+    results = []
+    # Cada hilo sólo espera a su proceso: el límite de hilos es el de procesos a la vez
+    with ThreadPoolExecutor(max_workers=min(processes, len(portals))) as executor:
+        futures = {
+            executor.submit(_run_in_fresh_process, portal, list(base_args), str(output_root)): portal["name"]
+            for portal in portals
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"name": futures[future], "status": "error", "error": str(e), "elapsed_s": None, "files": []}
+            results.append(result)
+            if result["status"] == "ok":
+                print(f"   - {result['name']}: OK en {result['elapsed_s']} s -> {', '.join(result['files'])}")
+            else:
+                print(f"   - {result['name']}: ERROR ({result['error']}); ver {result.get('dir', '')}/run.log")
+    elapsed = time.perf_counter() - started
+    slowest = max((r["elapsed_s"] or 0) for r in results) if results else 0
+    print(f"\nTotal: {elapsed:.1f} s (portal más lento: {slowest:.1f} s)")
+    return results
+
+# --- CLI ---
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Lo que va después de '--' se pasa a main.py en todos los portales
+    base_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, base_args = argv[:split], argv[split + 1:]
+    parser = argparse.ArgumentParser(description="Reporte de HubSpot para varios portales en paralelo")
+    parser.add_argument("config", help="JSON con la lista de portales")
+    parser.add_argument("--processes", type=int, default=None, help="Máximo de portales a la vez (por defecto, todos)")
+    parser.add_argument("--output-root", default=os.getenv("PORTALS_OUTPUT_ROOT", DEFAULT_OUTPUT_ROOT))
+    parser.add_argument("--only", nargs="+", metavar="PORTAL", help="Ejecuta sólo estos portales")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=Path(__file__).parent.parent / ".env")
+    portals = load_portals(args.config)
+    if args.only:
+        portals = [portal for portal in portals if portal["name"] in args.only]
+    results = run_portals(portals, base_args, args.output_root, args.processes)
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# src/record_store.py (Almacén compacto de registros: columnas de códigos enteros)
+
+import heapq
+import threading
+from array import array
+from collections import Counter
+
+# NumPy va en requirements.txt: conteos con bincount y deduplicado con unique sobre el buffer.
+# Si no está instalado, se usan las versiones en Python puro.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- DEDUPLICADO SIN NUMPY ---
+DEDUP_RUN_SIZE = 1 << 16
+
+def _duplicate_ids(ids):
+    """
+    Ids que aparecen más de una vez, sin un set de todos los ids: se ordena
+    una copia del array('q') por tramos y se mezclan los tramos comparando vecinos.
+    """
+    runs = [array("q", sorted(ids[start:start + DEDUP_RUN_SIZE])) for start in range(0, len(ids), DEDUP_RUN_SIZE)]
+    duplicates = set()
+    previous = None
+    for record_id in heapq.merge(*runs):
+        if record_id == previous:
+            duplicates.add(record_id)
+        previous = record_id
+    return duplicates
+
+class RecordStore:
+    """
+    Guarda los registros de una descarga paginada sin el JSON de cada uno:
+    - cada propiedad es una columna array('I') de códigos enteros (4 bytes/registro);
+    - cada código apunta a un diccionario de valores distintos (pocas decenas);
+    - los ids van en un array('q').
+    Los ids repetidos (un registro que cambia de fecha entre dos tramos) se
+    quitan al final con deduplicate(), sin un set permanente por registro.
+    `transforms` permite reducir una propiedad al guardarla, p. ej. createdate -> 'YYYY-MM'.
+    Es seguro llamar a add_page desde varios hilos.
+    """
+
+    def __init__(self, properties, transforms=None):
+        self.properties = list(properties)
+        self.transforms = transforms or {}
+        self.ids = array("q")
+        self._codes = {name: array("I") for name in self.properties}
+        self._dictionaries = {name: {} for name in self.properties}
+        self._values = {name: [] for name in self.properties}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- ESCRITURA ---
+    def _encode(self, name, value):
+        dictionary = self._dictionaries[name]
+        code = dictionary.get(value)
+        if code is None:
+            code = dictionary[value] = len(self._values[name])
+            self._values[name].append(value)
+        return code
+
+    def add_page(self, results):
+        """Añade una página de resultados de /search."""
+        with self._lock:
+            for record in results:
+                self.ids.append(int(record["id"]))
+                properties = record.get("properties", {})
+                for name in self.properties:
+                    value = properties.get(name)
+                    if name in self.transforms:
+                        value = self.transforms[name](value)
+                    self._codes[name].append(self._encode(name, value))
+
+    def deduplicate(self):
+        """Quita los ids repetidos (se queda con la primera aparición). Devuelve cuántos quitó."""
+        with self._lock:
+            if np is not None:
+                _, first = np.unique(np.frombuffer(self.ids, dtype=np.int64), return_index=True)
+                if len(first) == len(self.ids):
+                    return 0
+                keep = np.sort(first)
+                removed = len(self.ids) - len(keep)
+                self.ids = array("q", np.frombuffer(self.ids, dtype=np.int64)[keep].tobytes())
+                for name, codes in self._codes.items():
+                    self._codes[name] = array("I", np.frombuffer(codes, dtype=np.uint32)[keep].tobytes())
+                return removed
+
+            duplicates = _duplicate_ids(self.ids)
+            if not duplicates:
+                return 0
+            # Máscara de 1 byte por registro; el set sólo guarda los ids repetidos
+            seen = set()
+            keep = bytearray(len(self.ids))
+            for i, record_id in enumerate(self.ids):
+                if record_id in duplicates:
+                    if record_id in seen:
+                        continue
+                    seen.add(record_id)
+                keep[i] = 1
+            removed = len(self.ids) - sum(keep)
+            self.ids = array("q", (record_id for record_id, kept in zip(self.ids, keep) if kept))
+            for name, codes in self._codes.items():
+                self._codes[name] = array("I", (code for code, kept in zip(codes, keep) if kept))
+            return removed
+
+    # --- LECTURA ---
+    def values(self, name):
+        """Diccionario de la columna: código -> valor."""
+        return list(self._values[name])
+
+    def codes(self, name):
+        return self._codes[name]
+
+    def count_by(self, name):
+        """{valor: nº de registros} de una propiedad (bincount sobre los códigos)."""
+        codes = self._codes[name]
+        values = self._values[name]
+        if np is not None:
+            counts = np.bincount(np.frombuffer(codes, dtype=np.uint32), minlength=len(values)).tolist()
+        else:
+            counter = Counter(codes)
+            counts = [counter.get(code, 0) for code in range(len(values))]
+        return {value: count for value, count in zip(values, counts) if count}
+
+    def split_by(self, name):
+        """Reparte el almacén en {valor: RecordStore} según una propiedad (p. ej. el mes)."""
+        parts = {}
+        group_codes = self._codes[name]
+        for i, group_code in enumerate(group_codes):
+            part = parts.get(group_code)
+            if part is None:
+                part = parts[group_code] = RecordStore(self.properties, self.transforms)
+                # Mismos diccionarios: los códigos se copian tal cual
+                part._dictionaries = self._dictionaries
+                part._values = self._values
+            part.ids.append(self.ids[i])
+            for column in self.properties:
+                part._codes[column].append(self._codes[column][i])
+        return {self._values[name][code]: part for code, part in parts.items()}
+
+    def __iter__(self):
+        """Registros en el formato de la API (se crean uno a uno, no se guardan)."""
+        columns = [(name, self._codes[name], self._values[name]) for name in self.properties]
+        for i, record_id in enumerate(self.ids):
+            yield {
+                "id": str(record_id),
+                "properties": {name: values[codes[i]] for name, codes, values in columns},
+            }
+
+    def memory_bytes(self):
+        """Tamaño aproximado de las columnas (sin contar los diccionarios, que son pequeños)."""
+        arrays = [self.ids] + list(self._codes.values())
+        return sum(len(column) * column.itemsize for column in arrays)
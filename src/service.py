@@ -0,0 +1,247 @@
+# src/service.py (Servicio: refresca el reporte periódicamente y lo sirve por HTTP/JSON con ETags)
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cache
+import history
+import main as report
+from contacts import get_last_month_dates
+from hubspot_client import DEFAULT_MAX_WORKERS, DEFAULT_SEARCH_RATE, set_max_workers, set_rate_limit
+
+DEFAULT_PORT = 8765
+DEFAULT_INTERVAL_SECONDS = 15 * 60
+
+# --- ESTADO EN MEMORIA ---
+# Cada respuesta se guarda ya serializada junto con su ETag: leer es un lookup.
+_state = {
+    "report": None,        # (cuerpo, etag) de /report
+    "history": {},         # {mes: (cuerpo, etag)} de /history/<mes>
+    "months": None,        # (cuerpo, etag) de /history
+    "trends": {},          # {(métrica, sección): (cuerpo, etag)} de /history?metric=; se vacía al refrescar
+    "status": {"last_refresh": None, "last_error": None, "refreshes": 0, "next_refresh": None},
+}
+_state_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refresh_requested = threading.Event()
+
+# Una sola conexión al histórico para todo el servicio (sqlite3 no admite uso concurrente)
+_history_conn = None
+_history_lock = threading.Lock()
+
+def _history_query(func, *args):
+    """Ejecuta `func(conn, *args)` sobre la conexión compartida del histórico."""
+    global _history_conn
+    with _history_lock:
+        if _history_conn is None:
+            _history_conn = history.connect()
+        return func(_history_conn, *args)
+
+def _payload(data):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+# --- REFRESCO ---
+def refresh(access_token, mode):
+    """
+    Recalcula el reporte del mes pasado y publica las respuestas nuevas.
+    Si falla, se sigue sirviendo lo último bueno (y /health muestra el error).
+    """
+    if not _refresh_lock.acquire(blocking=False):
+        print("Ya hay un refresco en curso; se ignora la petición.")
+        return False
+    started = time.perf_counter()
+    try:
+        month = history.report_month_for(datetime.now())
+        results = report.collect_results(access_token, mode, get_last_month_dates())
+        final_report_data = report.build_report(results)
+        report_body = {
+            "month": month,
+            "mode": mode,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "report": [[label, value] for label, value in final_report_data],
+        }
+        with _state_lock:
+            previous = _state["report"]
+        # Sólo se guarda en el histórico si el reporte ha cambiado y está completo
+        unchanged = previous is not None and json.loads(previous[0])["report"] == report_body["report"]
+        if not unchanged:
+            report.save_complete_to_history({month: final_report_data}, {month: results})
+
+        runs = _history_query(history.latest_runs)
+        history_payloads = {
+            run_month: _payload({"month": run_month, "run_ts": run["run_ts"], "rows": [
+                {"section": section, "metric": metric, "value": value} for section, metric, value in run["rows"]
+            ]})
+            for run_month, run in runs.items()
+        }
+        months_payload = _payload({"months": {run_month: run["run_ts"] for run_month, run in runs.items()}})
+
+        with _state_lock:
+            if not unchanged:
+                _state["report"] = _payload(report_body)
+            _state["history"] = history_payloads
+            _state["months"] = months_payload
+            _state["trends"] = {}
+            _state["status"].update(
+                last_refresh=datetime.now().isoformat(timespec="seconds"),
+                last_error=None,
+                refreshes=_state["status"]["refreshes"] + 1,
+                last_duration_s=round(time.perf_counter() - started, 3),
+            )
+        print(f"Reporte {month} refrescado en {time.perf_counter() - started:.1f} s"
+              f"{' (sin cambios)' if unchanged else ''}.")
+        return True
+    except Exception as e:
+        print(f"Error al refrescar el reporte: {e}")
+        with _state_lock:
+            _state["status"]["last_error"] = f"{datetime.now().isoformat(timespec='seconds')}: {e}"
+        return False
+    finally:
+        _refresh_lock.release()
+
+def _refresh_loop(access_token, mode, interval_seconds, stop_event):
+    """Refresca cada `interval_seconds` o antes si llega un POST /refresh."""
+    while not stop_event.is_set():
+        refresh(access_token, mode)
+        with _state_lock:
+            _state["status"]["next_refresh"] = datetime.fromtimestamp(
+                time.time() + interval_seconds).isoformat(timespec="seconds")
+        _refresh_requested.wait(interval_seconds)
+        _refresh_requested.clear()
+
+# --- HTTP ---
+class ReportHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_cached(self, payload):
+        """Respuesta precalculada; 304 si el cliente ya tiene esa versión."""
+        if payload is None:
+            self._send(503, _payload({"error": "El primer refresco aún no ha terminado."})[0])
+            return
+        body, etag = payload
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self._send(304, etag=etag)
+            return
+        self._send(200, body, etag)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        with _state_lock:
+            report_payload = _state["report"]
+            history_payloads = _state["history"]
+            months_payload = _state["months"]
+            trend_payloads = _state["trends"]
+            status = dict(_state["status"])
+
+        if path == "/report":
+            self._send_cached(report_payload)
+        elif path == "/history":
+            metric = parse_qs(url.query).get("metric", [None])[0]
+            if metric is None:
+                self._send_cached(months_payload)
+                return
+            # Tendencia de una métrica: la primera petición consulta el índice del
+            # histórico y el resultado se reutiliza hasta el próximo refresco
+            section = parse_qs(url.query).get("section", [None])[0]
+            payload = trend_payloads.get((metric, section))
+            if payload is None:
+                rows = _history_query(history.trend, metric, section)
+                payload = _payload({"metric": metric, "trend": [
+                    {"section": s, "month": m, "run_ts": r, "value": v} for s, m, r, v in rows
+                ]})
+                with _state_lock:
+                    if _state["trends"] is trend_payloads:
+                        trend_payloads[(metric, section)] = payload
+            self._send_cached(payload)
+        elif path.startswith("/history/"):
+            payload = history_payloads.get(path.split("/", 2)[2])
+            if payload is None:
+                self._send(404, _payload({"error": "Mes sin datos en el histórico."})[0])
+            else:
+                self._send_cached(payload)
+        elif path == "/health":
+            self._send(200, _payload(status)[0])
+        else:
+            self._send(404, _payload({"error": f"Ruta desconocida: {path}"})[0])
+
+    def do_POST(self):
+        # Descarta el cuerpo (si lo hay) para no corromper la conexión keep-alive
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlparse(self.path).path.rstrip("/") == "/refresh":
+            _refresh_requested.set()
+            self._send(202, _payload({"status": "refresh scheduled"})[0])
+        else:
+            self._send(404, _payload({"error": "Ruta desconocida"})[0])
+
+def start_service(access_token, mode="mirror", host="127.0.0.1", port=DEFAULT_PORT,
+                  interval_seconds=DEFAULT_INTERVAL_SECONDS):
+    """Arranca el bucle de refresco y el servidor HTTP en hilos. Devuelve (servidor, url_base, stop_event)."""
+    stop_event = threading.Event()
+    threading.Thread(
+        target=_refresh_loop, args=(access_token, mode, interval_seconds, stop_event), daemon=True
+    ).start()
+    server = ThreadingHTTPServer((host, port), ReportHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", stop_event
+
+# --- CLI ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio de reporte: refresco periódico + endpoint HTTP/JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("REPORT_SERVICE_PORT", DEFAULT_PORT)))
+    parser.add_argument(
+        "--interval", type=float, default=DEFAULT_INTERVAL_SECONDS,
+        help="Segundos entre refrescos (POST /refresh fuerza uno antes)"
+    )
+    parser.add_argument(
+        "--mode", choices=["search", "aggregate", "mirror"], default="mirror",
+        help="Igual que en main.py; 'mirror' sólo descarga lo modificado desde el último refresco"
+    )
+    parser.add_argument("--workers", type=int, default=int(os.getenv("HUBSPOT_MAX_WORKERS", DEFAULT_MAX_WORKERS)))
+    parser.add_argument("--rate", type=float, default=float(os.getenv("HUBSPOT_SEARCH_RATE", DEFAULT_SEARCH_RATE)))
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    access_token = report.load_access_token()
+    set_max_workers(args.workers)
+    set_rate_limit(args.rate)
+    cache.configure(enabled=True)
+    server, base_url, stop_event = start_service(
+        access_token, args.mode, args.host, args.port, args.interval
+    )
+    print(f"Servicio escuchando en {base_url} (GET /report, /history, /history/<YYYY-MM>, /health; POST /refresh)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_event.set()
+        _refresh_requested.set()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
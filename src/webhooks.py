@@ -0,0 +1,434 @@
+# src/webhooks.py (Contadores incrementales del mes en curso a partir de webhooks de HubSpot)
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import cache
+from contacts import get_month_dates
+from planner import load_spec, build_plan, execute_plan
+from hubspot_client import DEFAULT_SEARCH_RATE, set_rate_limit
+
+DEFAULT_PORT = 8766
+DEFAULT_RECONCILE_SECONDS = 30 * 60
+# HubSpot reintenta los webhooks: recordamos los últimos eventId para no contarlos dos veces
+SEEN_EVENTS_LIMIT = 100000
+# Firma v3: se rechazan peticiones con más de 5 minutos de antigüedad
+SIGNATURE_MAX_AGE_SECONDS = 5 * 60
+REPLAY_BATCH_SIZE = 100
+
+def current_month_window():
+    now = datetime.now()
+    return get_month_dates(now.year, now.month)
+
+def _to_ms(value):
+    """Fechas de los eventos: epoch en ms (lo normal) o ISO 8601."""
+    if value in (None, ""):
+        return None
+    if str(value).lstrip("-").isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000)
+
+def _split_tokens(value):
+    if not value:
+        return set()
+    return {token.strip().lower() for token in value.split(";") if token.strip()}
+
+# --- CONTADORES ---
+class IncrementalCounters:
+    """
+    Mantiene los conteos del reporte para una ventana (el mes en curso).
+    Cada objeto guarda sus propiedades actuales; un evento calcula la
+    contribución del objeto antes y después del cambio y ajusta sólo esas
+    claves: O(1) por evento (O(nº de tokens) para el multi-checkbox).
+    """
+
+    def __init__(self, spec, window):
+        self.spec = spec
+        self.window = window
+        self.country_property = spec["countries"]["property"]
+        self.lead_source_property = spec["lead_sources"]["property"]
+        self.pipeline_ids = set(spec["pipelines"].values())
+        self.breakdown_properties = sorted({b["property"] for b in spec["deal_breakdowns"].values()})
+        self.counts = Counter()
+        self.objects = {"contact": {}, "deal": {}}
+        self.updated_at = {"contact": {}, "deal": {}}
+        self.seen_events = OrderedDict()
+        self.events_applied = 0
+        self.last_reconcile = None
+        self.last_drift = {}
+        self.lock = threading.Lock()
+
+    # --- CONTRIBUCIÓN DE UN OBJETO ---
+    def _in_window(self, ms):
+        return ms is not None and self.window[0] <= ms < self.window[1]
+
+    def _contribution(self, object_type, props):
+        """Claves de contador a las que suma 1 el objeto en su estado actual."""
+        if object_type == "contact":
+            if not self._in_window(_to_ms(props.get("createdate"))):
+                return []
+            keys = [("contacts",), ("contact_source", props.get(self.lead_source_property))]
+            keys += [("country", token) for token in _split_tokens(props.get(self.country_property))]
+            return keys
+        if (str(props.get("hs_is_closed_won")).lower() != "true"
+                or not self._in_window(_to_ms(props.get("closedate")))
+                or props.get("pipeline") not in self.pipeline_ids):
+            return []
+        keys = [("pipeline", props.get("pipeline"))]
+        keys += [("deal_property", name, props.get(name)) for name in self.breakdown_properties]
+        return keys
+
+    def _set_properties(self, object_type, object_id, changes):
+        state = self.objects[object_type].setdefault(object_id, {})
+        before = self._contribution(object_type, state)
+        state.update(changes)
+        after = self._contribution(object_type, state)
+        for key in before:
+            self.counts[key] -= 1
+        for key in after:
+            self.counts[key] += 1
+
+    # --- EVENTOS ---
+    def apply(self, event):
+        """
+        Aplica un evento de webhook (contact.creation, contact.propertyChange,
+        deal.creation, deal.propertyChange, *.deletion). Devuelve False si se ignora.
+        """
+        event_id = event.get("eventId")
+        object_type, _, action = event.get("subscriptionType", "").partition(".")
+        if object_type not in self.objects:
+            return False
+        object_id = int(event["objectId"])
+        occurred_at = int(event.get("occurredAt") or 0)
+        with self.lock:
+            if event_id is not None:
+                if event_id in self.seen_events:
+                    return False
+                self.seen_events[event_id] = True
+                if len(self.seen_events) > SEEN_EVENTS_LIMIT:
+                    self.seen_events.popitem(last=False)
+
+            if action == "creation":
+                # La creación no trae propiedades: su fecha es la de creación/alta
+                date_property = "createdate" if object_type == "contact" else None
+                if date_property and date_property not in self.objects[object_type].get(object_id, {}):
+                    self._set_properties(object_type, object_id, {date_property: occurred_at})
+            elif action == "deletion":
+                state = self.objects[object_type].pop(object_id, None) or {}
+                self.updated_at[object_type].pop(object_id, None)
+                for key in self._contribution(object_type, state):
+                    self.counts[key] -= 1
+            elif action == "propertyChange":
+                name = event.get("propertyName")
+                # Los eventos pueden llegar desordenados: gana el más reciente por propiedad
+                updated = self.updated_at[object_type].setdefault(object_id, {})
+                if updated.get(name, -1) > occurred_at:
+                    return False
+                updated[name] = occurred_at
+                self._set_properties(object_type, object_id, {name: event.get("propertyValue")})
+            else:
+                return False
+            self.events_applied += 1
+            return True
+
+    # --- RESULTADOS (mismo formato que main.build_report espera) ---
+    def results(self):
+        spec = self.spec
+        with self.lock:
+            counts = Counter(self.counts)
+        results = {
+            "total_leads": counts[("contacts",)],
+            "country_leads": {
+                country: counts[("country", token.lower())] for country, token in spec["countries"]["map"].items()
+            },
+            "lead_sources_raw": {
+                label: "MANUAL_SKIP" if value == "MANUAL_SKIP" else counts[("contact_source", value)]
+                for label, value in spec["lead_sources"]["map"].items()
+            },
+            "pipeline_totals": {
+                label: counts[("pipeline", pipeline_id)] for label, pipeline_id in spec["pipelines"].items()
+            },
+        }
+        for group, breakdown in spec["deal_breakdowns"].items():
+            results[group] = {
+                label: counts[("deal_property", breakdown["property"], value)]
+                for label, value in breakdown["map"].items()
+            }
+        return results
+
+    # --- RECONCILIACIÓN ---
+    def _keys_for(self, group, label):
+        """Clave de contador que alimenta cada (grupo, etiqueta) del plan."""
+        spec = self.spec
+        if group == "total_leads":
+            return ("contacts",)
+        if group == "country_leads":
+            return ("country", spec["countries"]["map"][label].lower())
+        if group == "lead_sources_raw":
+            return ("contact_source", spec["lead_sources"]["map"][label])
+        if group == "pipeline_totals":
+            return ("pipeline", spec["pipelines"][label])
+        breakdown = spec["deal_breakdowns"][group]
+        return ("deal_property", breakdown["property"], breakdown["map"][label])
+
+    def snapshot(self):
+        """Copia de los contadores (se toma antes de consultar la API para reconciliar)."""
+        with self.lock:
+            return Counter(self.counts)
+
+    def reconcile(self, authoritative, baseline=None):
+        """
+        Corrige la deriva con los totales de la API ({(grupo, etiqueta): total}).
+        Las búsquedas tardan varios segundos sin el lock: `baseline` es la copia
+        tomada antes de lanzarlas, y lo aplicado mientras tanto (contador actual
+        - baseline) se suma al total en lugar de perderse.
+        Los totales None (búsqueda fallida) no se tocan. Devuelve {clave: deriva}.
+        """
+        drift = {}
+        with self.lock:
+            for (group, label), total in authoritative.items():
+                if total is None or total == "MANUAL_SKIP":
+                    continue
+                key = self._keys_for(group, label)
+                if key in drift:
+                    continue
+                current = self.counts[key]
+                target = total + (current - baseline[key] if baseline is not None else 0)
+                if current != target:
+                    drift[key] = target - current
+                    self.counts[key] = target
+            self.last_reconcile = datetime.now().isoformat(timespec="seconds")
+            self.last_drift = {" / ".join(str(part) for part in key): delta for key, delta in drift.items()}
+        return drift
+
+def fetch_authoritative_totals(access_token, spec, window):
+    """Ejecuta el plan de búsquedas para la ventana: {(grupo, etiqueta): total}."""
+    plan = build_plan(spec)
+    counts = execute_plan(access_token, plan, window)
+    totals = {}
+    for search in plan:
+        for target in search["targets"]:
+            totals[target] = counts.get(search["key"])
+    return totals
+
+# --- SERVICIO ---
+_counters = None
+_counters_lock = threading.Lock()
+
+def get_counters():
+    return _counters
+
+def _ensure_current_month(spec):
+    """Al cambiar de mes se empieza de cero (la reconciliación rellena el mes nuevo)."""
+    global _counters
+    window = current_month_window()
+    with _counters_lock:
+        if _counters is None or _counters.window != window:
+            _counters = IncrementalCounters(spec, window)
+        return _counters
+
+def reconcile_now(access_token, spec):
+    counters = _ensure_current_month(spec)
+    try:
+        baseline = counters.snapshot()
+        drift = counters.reconcile(fetch_authoritative_totals(access_token, spec, counters.window), baseline)
+        print(f"Reconciliación: {len(drift)} contadores corregidos.")
+    except Exception as e:
+        print(f"Error en la reconciliación: {e}")
+
+def _reconcile_loop(access_token, spec, interval_seconds, stop_event):
+    while not stop_event.is_set():
+        reconcile_now(access_token, spec)
+        stop_event.wait(interval_seconds)
+
+def verify_signature(secret, method, uri, body, timestamp, signature):
+    """Firma v3 de HubSpot: base64(HMAC-SHA256(secret, método + uri + cuerpo + timestamp))."""
+    try:
+        if abs(time.time() * 1000 - int(timestamp)) > SIGNATURE_MAX_AGE_SECONDS * 1000:
+            return False
+    except (TypeError, ValueError):
+        return False
+    message = (method + uri).encode("utf-8") + body + str(timestamp).encode("utf-8")
+    expected = base64.b64encode(hmac.new(secret.encode("utf-8"), message, hashlib.sha256).digest()).decode()
+    return hmac.compare_digest(expected, signature or "")
+
+def _is_valid_event(event):
+    """Un evento aplicable: objeto JSON con objectId (y occurredAt, si viene) enteros."""
+    if not isinstance(event, dict):
+        return False
+    try:
+        int(event["objectId"])
+        int(event.get("occurredAt") or 0)
+    except (KeyError, TypeError, ValueError):
+        return False
+    return True
+
+def make_handler(spec, client_secret=None, on_snapshot=None, public_url=None):
+    """
+    Handler HTTP del receptor. `on_snapshot(results)` convierte los conteos en el reporte.
+    `public_url` es la URL base con la que HubSpot llega al receptor (p. ej.
+    https://informes.ejemplo.com detrás del proxy TLS): HubSpot firma esa URL, no la local.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, data):
+            raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _signed_uri(self):
+            """URI que firmó HubSpot: la pública configurada o la que indican las cabeceras del proxy."""
+            if public_url:
+                return public_url.rstrip("/") + self.path
+            proto = self.headers.get("X-Forwarded-Proto", "http").split(",")[0].strip()
+            host = self.headers.get("X-Forwarded-Host", self.headers.get("Host", "")).split(",")[0].strip()
+            return f"{proto}://{host}{self.path}"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.split("?")[0] != "/webhooks":
+                self._send_json(404, {"error": "Ruta desconocida"})
+                return
+            if client_secret:
+                if not verify_signature(client_secret, "POST", self._signed_uri(), body,
+                                        self.headers.get("X-HubSpot-Request-Timestamp"),
+                                        self.headers.get("X-HubSpot-Signature-v3")):
+                    self._send_json(401, {"error": "Firma no válida"})
+                    return
+            try:
+                events = json.loads(body or b"[]")
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                self._send_json(400, {"error": "JSON no válido"})
+                return
+            # Se valida el lote entero antes de aplicar nada (HubSpot reintenta el lote completo)
+            if not isinstance(events, list) or not all(_is_valid_event(event) for event in events):
+                self._send_json(400, {"error": "Se esperaba una lista de eventos con objectId"})
+                return
+            counters = _ensure_current_month(spec)
+            applied = sum(1 for event in events if counters.apply(event))
+            # HubSpot sólo necesita un 2xx rápido; no hay trabajo pendiente tras responder
+            self._send_json(200, {"received": len(events), "applied": applied})
+
+        def do_GET(self):
+            counters = _ensure_current_month(spec)
+            path = self.path.split("?")[0].rstrip("/")
+            if path == "/counters":
+                results = counters.results()
+                self._send_json(200, {
+                    "window": list(counters.window),
+                    "results": results,
+                    "report": on_snapshot(results) if on_snapshot else None,
+                })
+            elif path == "/health":
+                self._send_json(200, {
+                    "events_applied": counters.events_applied,
+                    "objects": {name: len(objects) for name, objects in counters.objects.items()},
+                    "last_reconcile": counters.last_reconcile,
+                    "last_drift": counters.last_drift,
+                })
+            else:
+                self._send_json(404, {"error": "Ruta desconocida"})
+
+    return Handler
+
+def start_receiver(spec, access_token=None, host="127.0.0.1", port=DEFAULT_PORT,
+                   reconcile_seconds=DEFAULT_RECONCILE_SECONDS, client_secret=None, on_snapshot=None,
+                   public_url=None):
+    """Arranca el receptor (y la reconciliación si hay token). Devuelve (servidor, url_base, stop_event)."""
+    _ensure_current_month(spec)
+    stop_event = threading.Event()
+    if access_token and reconcile_seconds:
+        threading.Thread(
+            target=_reconcile_loop, args=(access_token, spec, reconcile_seconds, stop_event), daemon=True
+        ).start()
+    server = ThreadingHTTPServer((host, port), make_handler(spec, client_secret, on_snapshot, public_url))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", stop_event
+
+# --- REPLAYER ---
+def replay(path, url, batch_size=REPLAY_BATCH_SIZE, delay=0.0):
+    """Envía un archivo JSONL de eventos al receptor en lotes (como hace HubSpot)."""
+    with open(path, encoding="utf-8") as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    session = requests.Session()
+    applied = 0
+    started = time.perf_counter()
+    for i in range(0, len(events), batch_size):
+        response = session.post(f"{url.rstrip('/')}/webhooks", json=events[i:i + batch_size])
+        response.raise_for_status()
+        applied += response.json().get("applied", 0)
+        if delay:
+            time.sleep(delay)
+    elapsed = time.perf_counter() - started
+    print(f"Reenviados {len(events)} eventos ({applied} aplicados) en {elapsed:.2f} s")
+    return applied
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receptor de webhooks con contadores del mes en curso")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="Arranca el receptor HTTP")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=int(os.getenv("WEBHOOKS_PORT", DEFAULT_PORT)))
+    p_serve.add_argument(
+        "--reconcile", type=float, default=DEFAULT_RECONCILE_SECONDS,
+        help="Segundos entre reconciliaciones con la API (0 = nunca)"
+    )
+    p_serve.add_argument(
+        "--public-url", default=os.getenv("WEBHOOKS_PUBLIC_URL"),
+        help="URL base pública (https) del receptor, la que firma HubSpot; "
+             "sin ella se usan X-Forwarded-Proto/X-Forwarded-Host"
+    )
+    p_serve.add_argument("--rate", type=float, default=float(os.getenv("HUBSPOT_SEARCH_RATE", DEFAULT_SEARCH_RATE)))
+
+    p_replay = sub.add_parser("replay", help="Reenvía eventos guardados (JSONL) a un receptor")
+    p_replay.add_argument("file")
+    p_replay.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    p_replay.add_argument("--batch", type=int, default=REPLAY_BATCH_SIZE)
+    p_replay.add_argument("--delay", type=float, default=0.0, help="Pausa entre lotes (s)")
+
+    args = parser.parse_args(argv)
+    if args.command == "replay":
+        replay(args.file, args.url, args.batch, args.delay)
+        return
+
+    import main as report
+    access_token = report.load_access_token() if args.reconcile else None
+    set_rate_limit(args.rate)
+    # La reconciliación siempre consulta la API (pero deja los totales en caché)
+    cache.configure(refresh=True)
+    server, base_url, stop_event = start_receiver(
+        load_spec(), access_token, args.host, args.port, args.reconcile,
+        client_secret=os.getenv("HUBSPOT_CLIENT_SECRET"), public_url=args.public_url,
+        on_snapshot=lambda results: [[label, value] for label, value in report.build_report(results)],
+    )
+    print(f"Receptor de webhooks en {base_url}/webhooks (GET /counters, /health)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_event.set()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
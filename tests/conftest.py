@@ -0,0 +1,54 @@
+# tests/conftest.py (Servidor local de HubSpot/Sheets compartido por todas las pruebas)
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+import mock_hubspot
+
+# Los módulos de src leen la URL de la API y las rutas al importarse: el
+# servidor y el entorno se preparan ANTES de que ninguna prueba los importe
+WORKDIR = tempfile.mkdtemp(prefix="hubspot_tests_")
+DATASET = mock_hubspot.generate_dataset(3000, 400)
+SERVER, BASE_URL = mock_hubspot.start_server(DATASET)
+
+os.environ.update({
+    "HUBSPOT_API_BASE": BASE_URL,
+    "HUBSPOT_ACCESS_TOKEN": "test-token",
+    "GOOGLE_SHEETS_API_BASE": BASE_URL,
+    "GOOGLE_SHEETS_ACCESS_TOKEN": "test-token",
+    "HUBSPOT_MIRROR_PATH": os.path.join(WORKDIR, ".hubspot_mirror.sqlite"),
+    "HUBSPOT_CACHE_PATH": os.path.join(WORKDIR, ".hubspot_cache.sqlite"),
+    "HUBSPOT_CHECKPOINT_PATH": os.path.join(WORKDIR, ".hubspot_checkpoint.jsonl"),
+    "REPORT_HISTORY_PATH": os.path.join(WORKDIR, ".report_history.sqlite"),
+})
+
+# El servidor local no tiene cuota: el cubo no debe alargar las pruebas
+import hubspot_client
+hubspot_client.set_rate_limit(1000)
+
+def pytest_unconfigure(config):
+    SERVER.shutdown()
+
+@pytest.fixture
+def dataset():
+    return DATASET
+
+@pytest.fixture
+def base_url():
+    return BASE_URL
+
+@pytest.fixture
+def access_token():
+    return os.environ["HUBSPOT_ACCESS_TOKEN"]
+
+@pytest.fixture(autouse=True)
+def no_disk_cache():
+    """Cada prueba consulta el servidor: la caché en disco no debe esconder nada."""
+    import cache
+    cache.configure(enabled=False)
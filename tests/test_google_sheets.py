@@ -0,0 +1,86 @@
+# tests/test_google_sheets.py (Diff de rangos y escritura RAW contra el fake de Sheets)
+
+import requests
+import google_sheets
+
+REPORT = [("--- 2LEADS - SPLIT PER CHANNEL ---", ""), ("# of new leads", 120), ("Target", "Manual")]
+
+def _sheet(base_url, spreadsheet_id, sheet_name):
+    return requests.get(f"{base_url}/__sheets").json().get(spreadsheet_id, {}).get(sheet_name, [])
+
+def _up_to_date(spreadsheet_id, sheet_name, grid):
+    current = google_sheets.read_sheet(spreadsheet_id, sheet_name, "test-token")
+    return google_sheets.diff_ranges(current, grid, sheet_name) == []
+
+def _spy_requests(monkeypatch):
+    """Registra (método, cuerpo JSON) de cada petición a Sheets sin cambiar su comportamiento."""
+    calls = []
+    original = google_sheets._request
+
+    def spy(method, url, access_token, **options):
+        calls.append((method, options.get("json")))
+        return original(method, url, access_token, **options)
+
+    monkeypatch.setattr(google_sheets, "_request", spy)
+    return calls
+
+# --- DIFERENCIAS ---
+def test_diff_ranges_merges_changed_rows_and_clears_leftovers():
+    current = [["M", "V"], ["a", 1], ["b", 2], ["x", "y"]]
+    desired = [["M", "V"], ["a", 5], ["b", 6]]
+    assert google_sheets.diff_ranges(current, desired, "Rep") == [
+        {"range": "'Rep'!B2:B3", "values": [[5], [6]]},
+        {"range": "'Rep'!A4:B4", "values": [["", ""]]},
+    ]
+
+def test_diff_ranges_treats_unformatted_floats_as_equal():
+    # UNFORMATTED_VALUE devuelve 120.0 para un entero escrito como 120
+    assert google_sheets.diff_ranges([["a", 120.0], ["b", None]], [["a", 120], ["b", ""]], "Rep") == []
+
+def test_diff_ranges_on_empty_sheet_skips_empty_cells():
+    data = google_sheets.diff_ranges([], google_sheets.report_to_grid(REPORT), "Rep")
+    assert data == [
+        {"range": "'Rep'!A1:B1", "values": [["MÉTRICA", "VALOR"]]},
+        {"range": "'Rep'!A2:A2", "values": [["--- 2LEADS - SPLIT PER CHANNEL ---"]]},
+        {"range": "'Rep'!A3:B4", "values": [["# of new leads", 120], ["Target", "Manual"]]},
+    ]
+
+# --- EXPORTACIÓN ---
+def test_export_writes_raw_values_once(monkeypatch, base_url):
+    calls = _spy_requests(monkeypatch)
+    grid = google_sheets.report_to_grid(REPORT)
+
+    assert google_sheets.export_grid(grid, "sheet-raw", "Reporte") == 3
+    writes = [body for method, body in calls if method == "POST"]
+    assert len(writes) == 1
+    assert writes[0]["valueInputOption"] == "RAW"
+    # Las etiquetas con '-' y los enteros llegan tal cual (no como fórmulas ni texto)
+    assert _sheet(base_url, "sheet-raw", "Reporte")[1][0] == "--- 2LEADS - SPLIT PER CHANNEL ---"
+    assert _sheet(base_url, "sheet-raw", "Reporte")[2] == ["# of new leads", 120]
+    assert _up_to_date("sheet-raw", "Reporte", grid)
+
+    calls.clear()
+    assert google_sheets.export_grid(grid, "sheet-raw", "Reporte") == 0
+    assert [method for method, _ in calls] == ["GET"]
+
+def test_export_sends_only_changed_ranges(monkeypatch, base_url):
+    google_sheets.export_grid(google_sheets.report_to_grid(REPORT), "sheet-diff", "Reporte")
+    calls = _spy_requests(monkeypatch)
+
+    changed = [REPORT[0], ("# of new leads", 130), REPORT[2]]
+    assert google_sheets.export_grid(google_sheets.report_to_grid(changed), "sheet-diff", "Reporte") == 1
+    (body,) = [body for method, body in calls if method == "POST"]
+    assert body["data"] == [{"range": "'Reporte'!B3:B3", "values": [[130]]}]
+    assert _sheet(base_url, "sheet-diff", "Reporte")[2] == ["# of new leads", 130]
+
+def test_export_retries_transient_errors(monkeypatch, dataset):
+    import mock_hubspot
+    monkeypatch.setattr(google_sheets, "_backoff_seconds", lambda attempt: 0)
+    server, url = mock_hubspot.start_server(dataset, error_rate=0.5, seed=3)
+    monkeypatch.setattr(google_sheets, "SHEETS_API_BASE", url)
+    try:
+        grid = google_sheets.report_to_grid(REPORT)
+        assert google_sheets.export_grid(grid, "sheet-retry", "Reporte") == 3
+        assert _up_to_date("sheet-retry", "Reporte", grid)
+    finally:
+        server.shutdown()
@@ -0,0 +1,44 @@
+# tests/test_modes.py (Los modos search, aggregate y mirror dan el mismo reporte)
+
+import os
+from datetime import datetime
+import pytest
+from dateutil.relativedelta import relativedelta
+import main
+from contacts import get_last_month_dates, get_month_windows
+
+@pytest.fixture(scope="module")
+def reports():
+    """Reporte del mes pasado en cada modo, contra el mismo servidor."""
+    token = os.environ["HUBSPOT_ACCESS_TOKEN"]
+    return {
+        mode: main.build_report(main.collect_results(token, mode, get_last_month_dates()))
+        for mode in ("search", "aggregate", "mirror")
+    }
+
+def test_report_is_not_empty(reports):
+    values = dict(reports["search"])
+    assert values["# of new leads"] > 0
+    assert values["# of new Engagements"] > 0
+
+@pytest.mark.parametrize("mode", ["aggregate", "mirror"])
+def test_modes_match_search(reports, mode):
+    assert reports[mode] == reports["search"]
+
+def test_rows_follow_the_spec(reports):
+    assert [label for label, _ in reports["search"]] == [row["label"] for row in main.REPORT_ROWS]
+    values = dict(reports["search"])
+    assert values["Paid online Marketing"] == values["Meta - Paid Social"] + values["Google - Paid Search"]
+    assert values["Target"] == "Manual"
+
+def test_backfill_modes_match(access_token):
+    """Tres meses: search por mes, aggregate en una sola descarga repartida y mirror por ventana."""
+    last = datetime.now().replace(day=1) - relativedelta(months=1)
+    windows = get_month_windows((last - relativedelta(months=2)).strftime("%Y-%m"), last.strftime("%Y-%m"))
+    by_mode = {
+        mode: main.collect_backfill_results(access_token, mode, windows)
+        for mode in ("search", "aggregate", "mirror")
+    }
+    for mode in ("aggregate", "mirror"):
+        for month, _ in windows:
+            assert main.build_report(by_mode[mode][month]) == main.build_report(by_mode["search"][month])
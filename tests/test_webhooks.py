@@ -0,0 +1,139 @@
+# tests/test_webhooks.py (Firma v3, validación de lotes y reconciliación tras un replay)
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+import pytest
+import requests
+import mock_hubspot
+import webhooks
+from planner import load_spec
+
+SECRET = "client-secret"
+PUBLIC_URL = "https://informes.ejemplo.com"
+
+def _sign(method, uri, body, timestamp, secret=SECRET):
+    message = (method + uri).encode("utf-8") + body + str(timestamp).encode("utf-8")
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), message, hashlib.sha256).digest()).decode()
+
+@pytest.fixture
+def spec():
+    return load_spec()
+
+@pytest.fixture
+def receiver(spec):
+    """Receptor con firma obligatoria detrás de un proxy con URL pública; contadores limpios."""
+    webhooks._counters = None
+    server, url, stop_event = webhooks.start_receiver(
+        spec, port=0, reconcile_seconds=0, client_secret=SECRET, public_url=PUBLIC_URL
+    )
+    yield url
+    stop_event.set()
+    server.shutdown()
+    webhooks._counters = None
+
+def _post(url, body, signature_uri=None, timestamp=None, secret=SECRET):
+    timestamp = timestamp or int(time.time() * 1000)
+    raw = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    headers = {
+        "Content-Type": "application/json",
+        "X-HubSpot-Request-Timestamp": str(timestamp),
+        "X-HubSpot-Signature-v3": _sign("POST", signature_uri or PUBLIC_URL + "/webhooks", raw, timestamp, secret),
+    }
+    return requests.post(f"{url}/webhooks", data=raw, headers=headers)
+
+# --- FIRMA ---
+def test_verify_signature_accepts_valid_and_rejects_tampered():
+    body = b'[{"objectId": 1}]'
+    timestamp = int(time.time() * 1000)
+    signature = _sign("POST", PUBLIC_URL + "/webhooks", body, timestamp)
+    assert webhooks.verify_signature(SECRET, "POST", PUBLIC_URL + "/webhooks", body, timestamp, signature)
+    assert not webhooks.verify_signature(SECRET, "POST", PUBLIC_URL + "/webhooks", body + b" ", timestamp, signature)
+    assert not webhooks.verify_signature("otro", "POST", PUBLIC_URL + "/webhooks", body, timestamp, signature)
+    assert not webhooks.verify_signature(SECRET, "POST", PUBLIC_URL + "/webhooks", body, timestamp, None)
+
+def test_verify_signature_rejects_old_timestamps():
+    body = b"[]"
+    old = int((time.time() - webhooks.SIGNATURE_MAX_AGE_SECONDS - 60) * 1000)
+    assert not webhooks.verify_signature(SECRET, "POST", PUBLIC_URL + "/webhooks", body, old,
+                                         _sign("POST", PUBLIC_URL + "/webhooks", body, old))
+    assert not webhooks.verify_signature(SECRET, "POST", PUBLIC_URL + "/webhooks", body, "no-es-un-número", "x")
+
+def test_receiver_checks_signature_against_public_url(receiver):
+    event = [{"eventId": 1, "subscriptionType": "contact.creation", "objectId": 1, "occurredAt": 1}]
+    assert _post(receiver, event).status_code == 200
+    # Firmado con la URL local (la que ve el servidor) en vez de la pública
+    assert _post(receiver, event, signature_uri=receiver + "/webhooks").status_code == 401
+    assert _post(receiver, event, secret="otro").status_code == 401
+
+@pytest.mark.parametrize("body", [
+    b"{no es json",
+    b"\xff\xfe",
+    {"objectId": 1},
+    [{"subscriptionType": "contact.creation"}],
+    [{"objectId": "abc"}],
+    [{"objectId": 1, "occurredAt": "ayer"}],
+])
+def test_receiver_rejects_bad_bodies_with_400(receiver, body):
+    response = _post(receiver, body)
+    assert response.status_code == 400
+    assert webhooks.get_counters().events_applied == 0
+
+def test_bad_event_rejects_the_whole_batch(receiver):
+    batch = [{"eventId": 1, "subscriptionType": "contact.creation", "objectId": 1, "occurredAt": 1}, {"objectId": None}]
+    assert _post(receiver, batch).status_code == 400
+    assert webhooks.get_counters().events_applied == 0
+
+# --- RECONCILIACIÓN ---
+def _report_results(counters, totals):
+    """Sólo los destinos que la API devuelve (los del plan), en el formato de los contadores."""
+    results = counters.results()
+    return {
+        (group, label): (results[group] if label is None else results[group][label])
+        for group, label in totals
+    }
+
+def test_replay_then_reconcile_matches_search_totals(tmp_path, spec, dataset, access_token):
+    webhooks._counters = None
+    counters = webhooks._ensure_current_month(spec)
+    receiver, receiver_url, stop_event = webhooks.start_receiver(spec, port=0, reconcile_seconds=0)
+    try:
+        events = mock_hubspot.dataset_events(dataset, counters.window[0], duplicate_rate=0.05)
+        assert events, "el dataset debe tener actividad en el mes en curso"
+        # Se pierde 1 de cada 7 eventos (webhooks que nunca llegaron)
+        delivered = [event for i, event in enumerate(events) if i % 7]
+        events_path = tmp_path / "events.jsonl"
+        events_path.write_text("".join(json.dumps(event) + "\n" for event in delivered), encoding="utf-8")
+        webhooks.replay(str(events_path), receiver_url)
+
+        totals = webhooks.fetch_authoritative_totals(access_token, spec, counters.window)
+        assert _report_results(counters, totals) != totals
+
+        webhooks.reconcile_now(access_token, spec)
+        assert _report_results(counters, totals) == totals
+
+        # Los duplicados (mismo eventId) no vuelven a contar tras reconciliar
+        webhooks.replay(str(events_path), receiver_url)
+        assert _report_results(counters, totals) == totals
+    finally:
+        stop_event.set()
+        receiver.shutdown()
+        webhooks._counters = None
+
+def test_reconcile_keeps_events_applied_during_the_searches(spec):
+    counters = webhooks.IncrementalCounters(spec, webhooks.current_month_window())
+    start = counters.window[0]
+    counters.apply({"eventId": 1, "subscriptionType": "contact.creation", "objectId": 10, "occurredAt": start + 1})
+    counters.apply({"eventId": 2, "subscriptionType": "contact.propertyChange", "objectId": 10,
+                    "occurredAt": start + 2, "propertyName": "createdate", "propertyValue": str(start + 1)})
+    baseline = counters.snapshot()
+    # Llega otro contacto mientras las búsquedas están en vuelo
+    counters.apply({"eventId": 3, "subscriptionType": "contact.creation", "objectId": 11, "occurredAt": start + 3})
+    counters.apply({"eventId": 4, "subscriptionType": "contact.propertyChange", "objectId": 11,
+                    "occurredAt": start + 4, "propertyName": "createdate", "propertyValue": str(start + 3)})
+    assert counters.results()["total_leads"] == 2
+    # La API (consultada antes del evento 3) ve 5 contactos: el evento 3 se suma encima
+    counters.reconcile({("total_leads", None): 5}, baseline)
+    assert counters.results()["total_leads"] == 6